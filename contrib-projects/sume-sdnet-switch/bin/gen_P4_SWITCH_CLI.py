@@ -85,6 +85,14 @@ def write_libcam(sw_dir, tables_dict, base_address):
         for table_name, table_info in tables_dict.iteritems():
             f.write(libcam_templates.TABLE_DELETE_TEMPLATE.format(table_info))
         f.write(libcam_templates.FUNC_END)
+        f.write(libcam_templates.TABLE_ADD_ENTRIES_START)
+        for table_name, table_info in tables_dict.iteritems():
+            f.write(libcam_templates.TABLE_SELECT_TEMPLATE.format(table_info))
+        f.write(libcam_templates.TABLE_ADD_ENTRIES_END)
+        f.write(libcam_templates.TABLE_DELETE_ENTRIES_START)
+        for table_name, table_info in tables_dict.iteritems():
+            f.write(libcam_templates.TABLE_SELECT_TEMPLATE.format(table_info))
+        f.write(libcam_templates.TABLE_DELETE_ENTRIES_END)
         f.write(libcam_templates.TABLE_SIZE_START)
         for table_name, table_info in tables_dict.iteritems():
             f.write(libcam_templates.TABLE_SIZE_TEMPLATE.format(table_info))
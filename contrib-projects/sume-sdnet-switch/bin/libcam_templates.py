@@ -112,36 +112,14 @@ Description :   This function converts the unsigned integer array to null termin
 int uint_array_to_hex_string( uint32_t *in_buf, char *out_buf, int in_arr_size)
 {
     int i = 0;
-    int j = 0;
-    uint32_t *result;
-    int len=0;
-    char result_str[16] = "";
-    char *result_buf;
-    //  Assign the starting address
-    result = in_buf;
-    result_buf = &result_str[0];
-    in_buf = in_buf + in_arr_size - 1;
-    for (i = 0; i < in_arr_size; i++)
+    //  Most significant word first, each word zero padded to 8 hex digits
+    for (i = in_arr_size - 1; i >= 0; i--)
     {
-        len = uint_to_str(*in_buf, result_buf, 16);
-        in_buf--;
-        for(j=0;j < 8-len;j++)
-        {
-            *out_buf = '0';
-            out_buf++;
-        }
-        while(*result_buf)
-        {
-          *out_buf = *result_buf;
-          result_buf++;
-          out_buf++;
-        }
-        result_buf = &result_str[0];
+        snprintf(out_buf, 9, "%08x", in_buf[i]);
+        out_buf += 8;
     }
     *out_buf = '\\0';
 
-    //  Assign the starting address
-    in_buf = result;
     return 0;
 }
 
@@ -200,6 +178,9 @@ TABLE_READ_TEMPLATE = """
     }}
 """
 
+# selects the CAM_CONTEXT of the table, shared by the batch functions
+TABLE_SELECT_TEMPLATE = TABLE_READ_TEMPLATE
+
 TABLE_READ_END = """
     if (cx != NULL) {
         int num_val_regs = (cx->value_width%32 == 0) ? (cx->value_width/32) : ((cx->value_width/32)+1);
@@ -250,6 +231,74 @@ TABLE_DELETE_TEMPLATE = """
     }}
 """
 
+TABLE_ADD_ENTRIES_START = """
+/*
+ * Add a batch of entries to a table
+ * keys and values are packed arrays of 32-bit words (least significant word
+ * first) holding the key / value of each entry back to back. The return
+ * code of each entry is written to rcs. Returns the first failing return
+ * code, or 0 if all entries were added.
+ */
+int cam_add_entries(uint32_t tableID, uint32_t num_entries, const uint32_t* keys, const uint32_t* values, int* rcs) {
+
+    CAM_CONTEXT* cx = NULL;
+"""
+
+TABLE_ADD_ENTRIES_END = """
+    if (cx != NULL) {
+        int num_key_regs = (cx->key_width%32 == 0) ? (cx->key_width/32) : ((cx->key_width/32)+1);
+        int num_val_regs = (cx->value_width%32 == 0) ? (cx->value_width/32) : ((cx->value_width/32)+1);
+        char key[num_key_regs*8 + 1];
+        char value[num_val_regs*8 + 1];
+        int rc = 0;
+        uint32_t i;
+        for (i = 0; i < num_entries; i++) {
+            uint_array_to_hex_string((uint32_t*) &keys[i*num_key_regs], key, num_key_regs);
+            uint_array_to_hex_string((uint32_t*) &values[i*num_val_regs], value, num_val_regs);
+            rcs[i] = CAM_Mgt_InsertEntry(cx, key, value, 0);
+            if (rcs[i] != 0 && rc == 0) {
+                rc = rcs[i];
+            }
+        }
+        return rc;
+    }
+    else {
+        return CAM_OP_FAILED;
+    }
+}
+"""
+
+TABLE_DELETE_ENTRIES_START = """
+/*
+ * Delete a batch of entries from a table
+ * keys is packed the same way as for cam_add_entries()
+ */
+int cam_delete_entries(uint32_t tableID, uint32_t num_entries, const uint32_t* keys, int* rcs) {
+
+    CAM_CONTEXT* cx = NULL;
+"""
+
+TABLE_DELETE_ENTRIES_END = """
+    if (cx != NULL) {
+        int num_key_regs = (cx->key_width%32 == 0) ? (cx->key_width/32) : ((cx->key_width/32)+1);
+        char key[num_key_regs*8 + 1];
+        int rc = 0;
+        uint32_t i;
+        for (i = 0; i < num_entries; i++) {
+            uint_array_to_hex_string((uint32_t*) &keys[i*num_key_regs], key, num_key_regs);
+            rcs[i] = CAM_Mgt_RemoveEntry(cx, key);
+            if (rcs[i] != 0 && rc == 0) {
+                rc = rcs[i];
+            }
+        }
+        return rc;
+    }
+    else {
+        return CAM_OP_FAILED;
+    }
+}
+"""
+
 TABLE_SIZE_START = """
 /*
  * Get the current number of entries in the table
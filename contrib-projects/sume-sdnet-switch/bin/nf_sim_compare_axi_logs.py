@@ -36,16 +36,22 @@
 #        nf10_sim_reconcile_axi_logs.py
 #
 #  Description:
-#         Reconciles *_log.axi with *_expected.axi.
+#         Reconciles *_log.axi with *_expected.axi.  Either file may also
+#         be a binary trace written by axitrace.py.
 #
 
 from __future__ import with_statement
 
 import axitools
+import axitrace
+import pktmask
 import glob
 import os
 import sys
 import argparse
+import bisect
+import multiprocessing
+from nf_sim_reconcile_axi_logs import find_axi_pairs, map_pairs, write_report
 from collections import OrderedDict
 
 from scapy.all import hexdump
@@ -58,25 +64,195 @@ except:
     pass
 #
 
-def reconcile_pkts( log_pkts, exp_pkts ):
+# how many packet numbers / field diffs to print per category
+MAX_REPORT = 10
+
+ORDER_CHOICES = ['all', 'port', 'flow', 'none']
+
+def flow_key(pkt):
+    """
+    Returns the IPv4 (src, dst, proto, sport, dport) of the raw packet, or
+    None if it is not an IPv4 packet. Parsed straight from the bytes so that
+    no scapy decoding is needed.
+    """
+    data = pkt.data
+    if len(data) < 34 or data[12:14] != '\x08\x00':
+        return None
+    ihl = (ord(data[14]) & 0xf) * 4
+    proto = data[23]
+    ports = ''
+    if proto in ('\x06', '\x11'): # TCP, UDP
+        ports = data[14+ihl:14+ihl+4]
+    return (data[26:34], proto, ports)
+
+def order_key(pkt, order):
     """
-    Reconcile list of logged AXI packets with list of expected packets.
+    Returns the group of pkt within which packets must stay in order
+    """
+    if order == 'port':
+        return pkt.tuser_dport
+    elif order == 'flow':
+        return flow_key(pkt)
+    return None
+
+def reconcile_pkts( log_pkts, exp_pkts, start=0, order='all', mask=None ):
+    """
+    Reconcile logged AXI packets with expected packets.  Both are iterables
+    of axitools.AXISPacket records; start is the packet number of the first
+    packet in both.
+
+    The expected packets are indexed by their raw bytes and each logged
+    packet is matched against the earliest unmatched expected packet with
+    the same bytes, so a drop or a reordering only affects the packets
+    involved.  A matched packet counts as reordered if it was logged after
+    a packet that was expected later in the same order group (the whole
+    stream, each output port, each flow, or no ordering at all).
+
+    Returns a dict with the packet counts and the lists of missing,
+    unexpected and reordered packet numbers, plus the missing and
+    unexpected AXISPacket records for diffing.
+
+    If mask (a string whose set bits are ignored, e.g. TTL, checksum or
+    timestamp fields) is given, packets are indexed and matched by their
+    masked bytes.
     """ 
-    num_log_pkts = len(log_pkts)
-    num_exp_pkts = len(exp_pkts)
-
-    i = 0
-    for exp_pkt, log_pkt in zip(exp_pkts, log_pkts):
-        if (exp_pkt != log_pkt):
-            diff_pkts(exp_pkt, log_pkt, i)
-        i += 1
-
-    if num_log_pkts > num_exp_pkts:
-        print "Logged {0} more packet(s) than were expected".format(num_log_pkts - num_exp_pkts)
-        print "First unepected packet is: \n", log_pkts[num_exp_pkts].show()
-    elif num_log_pkts < num_exp_pkts: 
-        print "Expected {0} more packet(s) than were logged".format(num_exp_pkts - num_log_pkts)
-        print "First missing packet is: \n", log_pkts[num_log_pkts].show()
+    pkt_mask = pktmask.get_mask(mask)
+    if pkt_mask is None:
+        key = lambda pkt: pkt.data
+    else:
+        key = lambda pkt: pkt_mask.apply(pkt.data)
+    exp_list = []
+    index = {}
+    for i, exp_pkt in enumerate(exp_pkts, start):
+        exp_list.append(exp_pkt)
+        index.setdefault(key(exp_pkt), []).append(i)
+    # match the earliest expected packet first
+    for positions in index.itervalues():
+        positions.reverse()
+
+    matched = set()
+    unexpected = []
+    reordered = []
+    last_seen = {}
+    num_log_pkts = 0
+    for j, log_pkt in enumerate(log_pkts, start):
+        num_log_pkts += 1
+        positions = index.get(key(log_pkt))
+        if not positions:
+            unexpected.append((j, log_pkt))
+            continue
+        i = positions.pop()
+        matched.add(i)
+        if order != 'none':
+            group = order_key(exp_list[i-start], order)
+            if last_seen.get(group, -1) > i:
+                reordered.append(i)
+            else:
+                last_seen[group] = i
+
+    missing = [(i, exp_pkt) for i, exp_pkt in enumerate(exp_list, start) if i not in matched]
+    return {'expected'   : len(exp_list),
+            'logged'     : num_log_pkts,
+            'matched'    : len(matched),
+            'missing'    : missing,
+            'unexpected' : unexpected,
+            'reordered'  : reordered}
+
+def format_pkt_nums(nums):
+    """
+    Returns a short string listing at most MAX_REPORT packet numbers
+    """
+    s = ', '.join(str(n) for n in nums[:MAX_REPORT])
+    if len(nums) > MAX_REPORT:
+        s += ', ... ({0} more)'.format(len(nums) - MAX_REPORT)
+    return s
+
+def summarize_result(result):
+    """
+    Returns a JSON serializable summary of the result of reconcile_pkts(),
+    with the counts, the first MAX_REPORT packet numbers of each category
+    and the first divergent packet
+    """
+    missing = result['missing']
+    unexpected = result['unexpected']
+    summary = {'expected_pkts'   : result['expected'],
+               'logged_pkts'     : result['logged'],
+               'matched_pkts'    : result['matched'],
+               'missing_pkts'    : len(missing),
+               'unexpected_pkts' : len(unexpected),
+               'reordered_pkts'  : len(result['reordered']),
+               'missing'         : [i for i, pkt in missing[:MAX_REPORT]],
+               'unexpected'      : [j for j, pkt in unexpected[:MAX_REPORT]],
+               'reordered'       : result['reordered'][:MAX_REPORT],
+               'pass'            : not (missing or unexpected or result['reordered']),
+               'first_divergence': None}
+    first = []
+    if missing:
+        first.append((missing[0][0], 'missing', missing[0][1]))
+    if unexpected:
+        first.append((unexpected[0][0], 'unexpected', unexpected[0][1]))
+    if first:
+        n, kind, pkt = min(first)
+        summary['first_divergence'] = {'packet' : n,
+                                       'kind'   : kind,
+                                       'data'   : pkt.data.encode('hex')}
+    return summary
+
+def compare_pair(task):
+    """
+    Pool worker: reconciles one (name, log_axi, expected_axi, start, order,
+    mask) task and returns its entry of the report
+    """
+    name, log_axi, expected_axi, start, order, mask = task
+    result = reconcile_pkts(axitrace.iter_packets( log_axi, 1e-9, start ),
+                            axitrace.iter_packets( expected_axi, 1e-9, start ), start, order, mask)
+    summary = summarize_result(result)
+    summary.update({'name' : name, 'log' : log_axi, 'expected' : expected_axi})
+    return summary
+
+def pair_mismatches(missing, unexpected):
+    """
+    Pair each unexpected packet with the unpaired missing packet closest to
+    it in packet number, for at most MAX_REPORT pairs. Returns the pairs and
+    the remaining missing and unexpected packets.
+    """
+    remaining = list(missing)
+    pairs = []
+    for j, log_pkt in unexpected[:MAX_REPORT]:
+        if not remaining:
+            break
+        k = bisect.bisect_left([i for i, pkt in remaining], j)
+        if k == len(remaining) or (k > 0 and j - remaining[k-1][0] <= remaining[k][0] - j):
+            k -= 1
+        pairs.append((remaining.pop(k), (j, log_pkt)))
+    return pairs, remaining, unexpected[len(pairs):]
+
+def print_report(result):
+    """
+    Print the result of reconcile_pkts(). Only the missing and unexpected
+    packets that can be paired up are decoded and diffed with scapy.
+    Returns True if the logs do not reconcile.
+    """
+    missing = result['missing']
+    unexpected = result['unexpected']
+    reordered = result['reordered']
+    print "Matched {0} of {1} expected packet(s), {2} packet(s) logged".format(result['matched'], result['expected'], result['logged'])
+    if missing:
+        print "Missing {0} packet(s): expected pkt {1}".format(len(missing), format_pkt_nums([i for i, pkt in missing]))
+    if unexpected:
+        print "Unexpected {0} packet(s): logged pkt {1}".format(len(unexpected), format_pkt_nums([j for j, pkt in unexpected]))
+    if reordered:
+        print "Reordered {0} packet(s): expected pkt {1}".format(len(reordered), format_pkt_nums(reordered))
+
+    pairs, missing, unexpected = pair_mismatches(missing, unexpected)
+    for (i, exp_pkt), (j, log_pkt) in pairs:
+        print "--- expected pkt {0} vs logged pkt {1} ---".format(i, j)
+        diff_pkts(exp_pkt.to_scapy(), log_pkt.to_scapy(), j)
+    if missing:
+        print "First missing packet is: \n", missing[0][1].to_scapy().show()
+    elif unexpected:
+        print "First unepected packet is: \n", unexpected[0][1].to_scapy().show()
+    return bool(result['missing'] or result['unexpected'] or reordered)
 
 def diff_pkts(exp_pkt, log_pkt, i):
     if (exp_pkt == log_pkt):
@@ -88,7 +264,7 @@ def diff_pkts(exp_pkt, log_pkt, i):
         try:
             assert(exp_layer == log_layer)
         except:
-            print "ERROR: expected pkt has layer {0}, logged pkt has layer {1}".format(exp_layer.name, log_layer.name)
+            print "ERROR: expected pkt has layer {0}, logged pkt has layer {1}".format(exp_layer.__name__, log_layer.__name__)
             return
         layer = exp_layer
         field_names = [field.name for field in layer.fields_desc] 
@@ -96,9 +272,9 @@ def diff_pkts(exp_pkt, log_pkt, i):
             exp_field = getattr(exp_pkt[layer], str(field_name))
             log_field = getattr(log_pkt[layer], str(field_name))
             if exp_field != log_field:
-                print "Discrepancy found in packet {0}, layer {1}, field {2}".format(i, layer.name, field.name)
-                print "Expected_Packet[{0}].{1} = {2}".format(layer.name, field.name, exp_field)
-                print "Logged_Packet[{0}].{1} = {2}".format(layer.name, field.name, log_field)
+                print "Discrepancy found in packet {0}, layer {1}, field {2}".format(i, layer.__name__, field_name)
+                print "Expected_Packet[{0}].{1} = {2}".format(layer.__name__, field_name, exp_field)
+                print "Logged_Packet[{0}].{1} = {2}".format(layer.__name__, field_name, log_field)
                 return
 
 def get_pkt_layers(pkt):
@@ -115,33 +291,62 @@ def get_pkt_layers(pkt):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--log', required=True, type=str, help="the path to the log_axi_file")
-    parser.add_argument('--expect', required=True, type=str, help="the path to the expected_axi_file")
+    parser.add_argument('--log', type=str, help="the path to the log_axi_file")
+    parser.add_argument('--expect', type=str, help="the path to the expected_axi_file")
+    parser.add_argument('--dir', type=str, default=None, help="compare every *_log.axi/*_expected.axi pair in this directory instead")
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(), help="number of pairs to compare in parallel (with --dir)")
+    parser.add_argument('--json', type=str, default=None, help="write a JSON report to this file (with --dir)")
     parser.add_argument('-w', action='store_true', default=False, help="write the logged and expected pkts")
+    parser.add_argument('--start', type=int, default=0, help="packet number to start the comparison at (binary traces seek directly to it)")
+    parser.add_argument('--order', type=str, default='all', choices=ORDER_CHOICES,
+                        help="ordering constraint: across all pkts, per output port, per IPv4 flow, or none")
+    parser.add_argument('--mask', type=str, default=None,
+                        help="hex mask of the packet bits to ignore, e.g. TTL, checksum or timestamp fields")
     args = parser.parse_args()
 
-    with open(args.log) as f:
-        log_pkts = axitools.axis_load( f, 1e-9 )
-    with open(args.expect) as f:
-        exp_pkts = axitools.axis_load( f, 1e-9 ) 
+    mask = None
+    if args.mask is not None:
+        try:
+            mask = pktmask.parse_mask(args.mask)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.dir is not None:
+        tasks = [pair + (args.start, args.order, mask) for pair in find_axi_pairs(args.dir)]
+        results = map_pairs(compare_pair, tasks, args.jobs)
+        for r in results:
+            print "{0}: {1} ({2} expected, {3} logged, {4} missing, {5} unexpected, {6} reordered)".format(
+                r['name'], 'PASS' if r['pass'] else 'FAIL', r['expected_pkts'], r['logged_pkts'],
+                r['missing_pkts'], r['unexpected_pkts'], r['reordered_pkts'])
+        if args.json is not None:
+            write_report(args.json, results)
+        if not all(r['pass'] for r in results):
+            sys.exit(1)
+        return
+
+    if args.log is None or args.expect is None:
+        parser.error("--log and --expect are required unless --dir is given")
 
     if (args.w):
         #wrpcap('logged_pkts.pcap', log_pkts)
         #wrpcap('expected_pkts.pcap', exp_pkts)
-        i = 1
-        for pkt in exp_pkts:
+        i = args.start + 1
+        for pkt in axitrace.iter_packets( args.expect, 1e-9, args.start ):
             print "expected pkt {0}".format(i)
-            pkt.show()
+            pkt.to_scapy().show()
             print "---------------------------"
             i += 1
-        i = 1
-        for pkt in log_pkts:
+        i = args.start + 1
+        for pkt in axitrace.iter_packets( args.log, 1e-9, args.start ):
             print "log pkt {0}".format(i)
-            pkt.show()
+            pkt.to_scapy().show()
             print "---------------------------"           
+            i += 1
 
-
-    reconcile_pkts(log_pkts, exp_pkts)
+    result = reconcile_pkts(axitrace.iter_packets( args.log, 1e-9, args.start ),
+                            axitrace.iter_packets( args.expect, 1e-9, args.start ), args.start, args.order, mask)
+    if print_report(result):
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2017 Stephen Ibanez
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+
+
+"""
+Streaming test data generation for the SDNet and SUME simulations.
+
+A project describes its traffic as scenarios: generator functions that
+yield Apply and Expect events. The events are written out as they are
+produced, to the pcap files (src.pcap, dst.pcap, nf<i>_applied.pcap and
+nf<i>_expected.pcap) and to the tuple files (Tuple_in.txt and
+Tuple_expect.txt), so no packet list is kept in memory:
+
+    def scenario():
+        pkt = Ether() / IP()
+        yield Apply(pkt, 'nf0', 0)
+        yield Expect(pkt, 'nf1')
+
+    run_scenarios([scenario])
+
+Independent scenarios can be generated in parallel with jobs > 1. Each one
+is then written to its own directory and the results are concatenated in
+scenario order. In that case every scenario starts from the initial tuple
+values and must set the tuple fields it relies on.
+"""
+
+import os, sys, struct, shutil, tempfile, multiprocessing
+from scapy.all import PcapWriter
+
+__all__ = ['Apply', 'Expect', 'TestData', 'run_scenarios']
+
+port_map = {'nf0':0b00000001, 'nf1':0b00000100, 'nf2':0b00010000, 'nf3':0b01000000,
+            'dma0':0b00000010, 'bcast':0b01010101, 'none':0}
+nf_id_map = {'nf0':0, 'nf1':1, 'nf2':2, 'nf3':3}
+
+PCAP_HEADER_LEN = 24
+# magic, version 2.4, thiszone, sigfigs, snaplen, linktype (Ethernet)
+PCAP_HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+
+class Apply(object):
+    """
+    Apply pkt to port ingress at the given time. Any other keyword argument
+    is an sume_tuple_in field to set.
+    """
+    __slots__ = ('pkt', 'ingress', 'time', 'fields')
+
+    def __init__(self, pkt, ingress, time, **fields):
+        self.pkt = pkt
+        self.ingress = ingress
+        self.time = time
+        self.fields = fields
+
+class Expect(object):
+    """
+    Expect pkt on port egress (or 'bcast' for nf0-nf3) unless it is dropped.
+    digest holds the dig_tuple_expect fields to set and any other keyword
+    argument is an sume_tuple_expect field to set.
+    """
+    __slots__ = ('pkt', 'egress', 'drop', 'digest', 'fields')
+
+    def __init__(self, pkt, egress, drop=False, digest=None, **fields):
+        self.pkt = pkt
+        self.egress = egress
+        self.drop = drop
+        self.digest = digest
+        self.fields = fields
+
+
+class TestData(object):
+    """
+    Writes the pcap and tuple files of a simulation as packets are applied
+    and expected. The tuple layouts and initial values come from the
+    project's sss_sdnet_tuples module.
+    """
+
+    def __init__(self, outdir='.', tuples=None):
+        if tuples is None:
+            import sss_sdnet_tuples as tuples
+        from sdnet_tuple_codec import TupleWriter
+        self.outdir = outdir
+        self.tuples = tuples
+        self.tuple_in_writer = TupleWriter(os.path.join(outdir, tuples.tuple_in_file))
+        self.tuple_expect_writer = TupleWriter(os.path.join(outdir, tuples.tuple_expect_file))
+        self.tuple_in_writer.clear()
+        self.tuple_expect_writer.clear()
+        # pcap writers are opened on first use, so that only the ports
+        # with packets get a file
+        self.pcap_writers = {}
+        self.counts = {}
+
+    def write_pcap(self, name, pkt):
+        writer = self.pcap_writers.get(name)
+        if writer is None:
+            writer = PcapWriter(os.path.join(self.outdir, name))
+            self.pcap_writers[name] = writer
+            self.counts[name] = 0
+        writer.write(pkt)
+        self.counts[name] += 1
+
+    def apply_pkt(self, pkt, ingress, time, **fields):
+        tuples = self.tuples
+        tuples.sume_tuple_in['pkt_len'] = len(pkt)
+        tuples.sume_tuple_in['src_port'] = port_map[ingress]
+        tuples.sume_tuple_expect['pkt_len'] = len(pkt)
+        tuples.sume_tuple_expect['src_port'] = port_map[ingress]
+        tuples.sume_tuple_in.update(fields)
+        pkt.time = time
+        self.write_pcap('src.pcap', pkt)
+        self.write_pcap('nf{0}_applied.pcap'.format(nf_id_map[ingress]), pkt)
+
+    def exp_pkt(self, pkt, egress, drop=False, digest=None, **fields):
+        tuples = self.tuples
+        tuples.sume_tuple_expect['dst_port'] = port_map[egress]
+        if 'drop' in tuples.sume_field_len:
+            tuples.sume_tuple_expect['drop'] = drop
+        tuples.sume_tuple_expect.update(fields)
+        if digest is not None:
+            tuples.dig_tuple_expect.update(digest)
+        self.tuple_in_writer.write(tuples.sume_codec.encode_hex(tuples.sume_tuple_in) + '\n')
+        self.tuple_expect_writer.write(tuples.dig_codec.encode_hex(tuples.dig_tuple_expect) + ' ' +
+                                       tuples.sume_codec.encode_hex(tuples.sume_tuple_expect) + '\n')
+        self.write_pcap('dst.pcap', pkt)
+        if drop:
+            return
+        if egress in nf_id_map:
+            self.write_pcap('nf{0}_expected.pcap'.format(nf_id_map[egress]), pkt)
+        elif egress == 'bcast':
+            for i in range(4):
+                self.write_pcap('nf{0}_expected.pcap'.format(i), pkt)
+
+    """
+    Write out all of the events of a scenario
+    """
+    def run(self, events):
+        for event in events:
+            if isinstance(event, Apply):
+                self.apply_pkt(event.pkt, event.ingress, event.time, **event.fields)
+            elif isinstance(event, Expect):
+                self.exp_pkt(event.pkt, event.egress, event.drop, event.digest, **event.fields)
+            else:
+                # raised rather than exiting so that pool workers report it to the parent
+                raise ValueError("unknown test data event {0}".format(event))
+
+    def close(self):
+        for writer in self.pcap_writers.values():
+            writer.close()
+        # src.pcap and dst.pcap are always written, even if empty
+        for name in ['src.pcap', 'dst.pcap']:
+            if name not in self.pcap_writers:
+                with open(os.path.join(self.outdir, name), 'wb') as f:
+                    f.write(PCAP_HEADER)
+                self.counts[name] = 0
+        self.tuple_in_writer.close()
+        self.tuple_expect_writer.close()
+
+
+"""
+Concatenate the files of the part directories into outdir, in order. The
+pcap header is only kept from the first part of each pcap file.
+"""
+def merge_parts(part_dirs, outdir):
+    names = []
+    for part_dir in part_dirs:
+        for name in sorted(os.listdir(part_dir)):
+            if name not in names:
+                names.append(name)
+    for name in names:
+        with open(os.path.join(outdir, name), 'wb') as fout:
+            header_written = False
+            for part_dir in part_dirs:
+                path = os.path.join(part_dir, name)
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'rb') as fin:
+                    if name.endswith('.pcap'):
+                        header = fin.read(PCAP_HEADER_LEN)
+                        if not header_written:
+                            fout.write(header)
+                            header_written = True
+                    shutil.copyfileobj(fin, fout, 1 << 20)
+
+# the scenarios being generated in parallel, inherited by the pool workers
+# so that they do not need to be picklable
+pool_scenarios = []
+
+def run_scenario_part(task):
+    """
+    Pool worker: generate one scenario into its own directory
+    """
+    index, part_dir = task
+    td = TestData(part_dir)
+    td.run(pool_scenarios[index]())
+    td.close()
+    return td.counts
+
+"""
+Generate the test data of all of the scenarios (generator functions
+yielding Apply/Expect events) into outdir, with up to jobs scenarios
+generated in parallel. Returns the number of packets written to each pcap
+file.
+"""
+def run_scenarios(scenarios, outdir='.', jobs=1):
+    try:
+        counts = generate_scenarios(scenarios, outdir, jobs)
+    except ValueError as e:
+        print >> sys.stderr, "ERROR: {0}".format(e)
+        sys.exit(1)
+    for name in sorted(counts):
+        print "{0}: {1} packets".format(name, counts[name])
+    return counts
+
+"""
+Does the work of run_scenarios(), raises ValueError on an unknown event
+"""
+def generate_scenarios(scenarios, outdir, jobs):
+    if jobs <= 1 or len(scenarios) <= 1:
+        td = TestData(outdir)
+        for scenario in scenarios:
+            td.run(scenario())
+        td.close()
+        counts = td.counts
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix='.testdata_', dir=outdir)
+        try:
+            part_dirs = []
+            for i in range(len(scenarios)):
+                part_dirs.append(os.path.join(tmp_dir, str(i)))
+                os.mkdir(part_dirs[-1])
+            pool_scenarios[:] = scenarios
+            pool = multiprocessing.Pool(min(jobs, len(scenarios)))
+            try:
+                part_counts = pool.map(run_scenario_part, list(enumerate(part_dirs)), 1)
+            finally:
+                pool.close()
+                pool.join()
+                pool_scenarios[:] = []
+            merge_parts(part_dirs, outdir)
+        finally:
+            shutil.rmtree(tmp_dir)
+        counts = {}
+        for part in part_counts:
+            for name, count in part.items():
+                counts[name] = counts.get(name, 0) + count
+    return counts
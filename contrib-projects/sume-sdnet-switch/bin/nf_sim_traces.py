@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2017 Stephen Ibanez
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+
+
+
+"""
+Synthesize traces that interleave the packets of many flows, keeping the
+packets of each flow in order. Packets are pulled from the flows and
+yielded one at a time, so a trace does not need to fit in memory.
+
+random_interleave() returns a uniformly random interleaving of flows of
+known length, drawing the flow of each packet with probability
+proportional to its remaining packets. interleave_flows() assigns each
+packet an arrival time from an arrival model (FixedRate, Poisson, OnOff)
+and merges the flows in time order. Both take O(log N) time per packet
+for N flows.
+"""
+
+import heapq, random
+from nf_sim_tools import nf_port_map
+
+__all__ = ['FixedRate', 'Poisson', 'OnOff', 'random_interleave', 'interleave_flows']
+
+class FixedRate(object):
+    """
+    Back to back packets at rate Mbps, as in nf_sim_tools.send_pkts
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    """
+    Yield (time, pkt) for the packets of one flow starting at time start
+    """
+    def times(self, pkts, start, rng):
+        bps = self.rate * 10**6
+        t = start
+        for pkt in pkts:
+            yield t, pkt
+            t += (len(pkt)*8.0)/bps
+
+class Poisson(object):
+    """
+    Packets arriving as a Poisson process of rate pkts/second
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def times(self, pkts, start, rng):
+        t = start
+        for pkt in pkts:
+            yield t, pkt
+            t += rng.expovariate(self.rate)
+
+class OnOff(object):
+    """
+    Bursts of back to back packets at rate Mbps separated by idle periods.
+    The burst and idle durations (in seconds) are exponentially distributed
+    with means on_time and off_time.
+    """
+
+    def __init__(self, rate, on_time, off_time):
+        self.rate = rate
+        self.on_time = on_time
+        self.off_time = off_time
+
+    def times(self, pkts, start, rng):
+        bps = self.rate * 10**6
+        t = start
+        on_end = t + rng.expovariate(1.0/self.on_time)
+        for pkt in pkts:
+            if t >= on_end:
+                t = on_end + rng.expovariate(1.0/self.off_time)
+                on_end = t + rng.expovariate(1.0/self.on_time)
+            yield t, pkt
+            t += (len(pkt)*8.0)/bps
+
+
+"""
+Yield the packets of flows (sequences of packets) in a uniformly random
+order that keeps the packets of each flow in order. rng is a
+random.Random, or the random module, which makes the result depend on
+random.seed().
+"""
+def random_interleave(flows, rng=random):
+    iters = [iter(flow) for flow in flows]
+    n = len(iters)
+    # Fenwick tree of the number of packets left in each flow
+    tree = [0] * (n + 1)
+    for i, flow in enumerate(flows):
+        j = i + 1
+        while j <= n:
+            tree[j] += len(flow)
+            j += j & -j
+    top = 1
+    while top * 2 <= n:
+        top *= 2
+    remaining = sum(len(flow) for flow in flows)
+    while remaining > 0:
+        # find the flow holding the r'th remaining packet
+        r = rng.randrange(remaining)
+        pos = 0
+        step = top
+        while step:
+            nxt = pos + step
+            if nxt <= n and tree[nxt] <= r:
+                pos = nxt
+                r -= tree[nxt]
+            step >>= 1
+        j = pos + 1
+        while j <= n:
+            tree[j] -= 1
+            j += j & -j
+        remaining -= 1
+        yield next(iters[pos])
+
+def flow_times(fid, pkts, model, start, rng):
+    for seq, (t, pkt) in enumerate(model.times(pkts, start, rng)):
+        yield t, fid, seq, pkt
+
+"""
+Yield the packets of flows (iterables of packets) in order of arrival time,
+setting pkt.time. The packets of each flow arrive according to model
+(FixedRate, Poisson or OnOff). All of the flows start at base_time, or
+if flow_rate is given the flows start as a Poisson process of flow_rate
+flows/second. If interface is given the packets' tuser_sport is set as in
+nf_sim_tools.send_pkts. seed seeds the random arrivals.
+"""
+def interleave_flows(flows, model, base_time=0, flow_rate=None, interface=None, seed=None):
+    rng = random.Random(seed)
+    streams = []
+    start = base_time
+    for fid, pkts in enumerate(flows):
+        streams.append(flow_times(fid, pkts, model, start, rng))
+        if flow_rate is not None:
+            start += rng.expovariate(flow_rate)
+    for t, fid, seq, pkt in heapq.merge(*streams):
+        pkt.time = t
+        if interface is not None:
+            pkt.tuser_sport = nf_port_map[interface]
+        yield pkt
@@ -36,8 +36,53 @@ which contain the initial entries in each table
 """
 
 import sys, os, argparse, re, json
-import struct, socket
+import struct, socket, sqlite3, tempfile, hashlib
+import multiprocessing
+from itertools import islice
 from collections import OrderedDict
+from StringIO import StringIO
+
+# size of the write buffer used for each *.tbl file in streaming mode
+STREAM_BUFSIZE = 1 << 20
+
+# number of commands handed to a worker process at a time in parallel mode
+CHUNK_SIZE = 4096
+
+# bump whenever the *.tbl output format changes to invalidate old caches
+CACHE_VERSION = 1
+
+class PXPacker(object):
+    """
+    Combines P4 field values into a single integer. The field layout
+    (sizes, masks and the parser used for each field) is computed once
+    so that packing an entry is a single pass over its values.
+    """
+
+    def __init__(self, fields):
+        self.fields = [(name, size) for name, size in fields if ('padding' not in name and 'hit' not in name)]
+        self.layout = [(field_parser(size), size, (1 << size) - 1) for name, size in self.fields]
+
+    """
+    Pack the list of field_vals into a single integer
+    """
+    def pack(self, field_vals):
+        if (len(field_vals) != len(self.layout)):
+            print >> sys.stderr, "ERROR: {} field values provided, expected {} ({})".format(
+                len(field_vals), len(self.layout), ', '.join(name for name, size in self.fields))
+            sys.exit(1)
+
+        ret = 0
+        for val, (parse, bits, mask) in zip(field_vals, self.layout):
+            ret = (ret << bits) | (parse(val) & mask)
+        return ret
+
+    """
+    Pack each list of field values in entries
+    """
+    def pack_all(self, entries):
+        pack = self.pack
+        return [pack(field_vals) for field_vals in entries]
+
 
 class PXTable(object):
     """
@@ -59,27 +104,59 @@ class PXTable(object):
         # response_tuple:
         self.response_tuple = table_dict['response_fields']
 
+        # precompiled packers for the key and value of each entry
+        self.key_packer = PXPacker(self.extract_fields(self.request_tuple))
+        self.value_packer = PXPacker(self.extract_fields(self.response_tuple))
+
+        # packers used by _hexify(), keyed by field list
+        self.packers = {}
+
+        # open *.tbl file when entries are being streamed rather than buffered
+        self.fout = None
+        self.tmp_file = None
+
     """
-    Combine P4 field values into single hex number where the bit width of each
-    P4 field value is indicated in fields list
+    Open a temporary *.tbl file so that entries are written out as they are
+    added rather than being kept in memory until write_px_file() is called.
+    commit_px_file() moves it over the *.tbl file once it is complete.
     """
-    def _hexify(self, field_vals, fields):
-        field_sizes = [size for name, size in fields if ('padding' not in name and 'hit' not in name)]
+    def open_px_file(self):
+        self.tmp_file = self.name + ".tbl.tmp"
+        self.fout = open(self.tmp_file, 'w+', STREAM_BUFSIZE)
 
-        if (len(field_vals) != len(field_sizes)):
-            print >> sys.stderr, "ERROR: not enough fields provided to complete _hexify()"
-            sys.exit(1)
+    """
+    Flush and close the file opened by open_px_file()
+    """
+    def close_px_file(self):
+        self.fout.close()
+        self.fout = None
 
-        # convert field_vals to int
-        field_vals = map(convert_to_int, field_vals)
+    """
+    Replace the *.tbl file with the file written since open_px_file()
+    """
+    def commit_px_file(self):
+        os.rename(self.tmp_file, self.name + ".tbl")
+        self.tmp_file = None
 
-        # combine field_vals using field sizes
-        ret = 0
-        for val, bits in zip(field_vals, field_sizes):
-            mask = 2**bits -1
-            ret = (ret << bits) + (val & mask)
-        return ret
+    """
+    Remove the file written since open_px_file(), leaving the *.tbl file as
+    it was
+    """
+    def discard_px_file(self):
+        if os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
+        self.tmp_file = None
 
+    """
+    Combine P4 field values into single hex number where the bit width of each
+    P4 field value is indicated in fields list
+    """
+    def _hexify(self, field_vals, fields):
+        fields = tuple(fields)
+        packer = self.packers.get(fields)
+        if packer is None:
+            packer = self.packers[fields] = PXPacker(fields)
+        return packer.pack(field_vals)
 
     """
     Return list of fields, each entry of form: (field_name, size_bits, lsb)
@@ -99,31 +176,38 @@ class PXTable(object):
     Get the action_ID of the given action_name for the table
     """
     def get_action_id(self, action_name):
-        if action_name in self.actions.keys():
-            return self.actions[action_name]
-        return None
+        return self.actions.get(action_name)
 
     """
     Convert the action_name and action_data into a single hex value represented
     as a string
     """
     def hexify_value(self, action_name, action_data):
-        fields = self.extract_fields(self.response_tuple)
         action_name = '{}.{}'.format(self.block_name, action_name) if action_name != 'NoAction' else '.NoAction'
-        if (action_name not in self.actions.keys()):
+        if (action_name not in self.actions):
             print >> sys.stderr, "ERROR: {} is not a recognized action for table {}".format(action_name, self.name)
             sys.exit(1)
-        field_vals = [self.get_action_id(action_name)] + action_data
-        return self._hexify(field_vals, fields)
+        field_vals = [self.actions[action_name]] + list(action_data)
+        return self.value_packer.pack(field_vals)
 
     """
     Convert list of ints representing the keys to match on into a single hex value
     represented as a string
     """
     def hexify_key(self, key_list):
-        fields = self.extract_fields(self.request_tuple)
-        field_vals = key_list
-        return self._hexify(field_vals, fields)
+        return self.key_packer.pack(key_list)
+
+    """
+    Batch version of hexify_value(), actions is a list of (action_name, action_data)
+    """
+    def hexify_values(self, actions):
+        return [self.hexify_value(action_name, action_data) for action_name, action_data in actions]
+
+    """
+    Batch version of hexify_key()
+    """
+    def hexify_keys(self, key_lists):
+        return self.key_packer.pack_all(key_lists)
 
 
 class PXCAMTable(PXTable):
@@ -139,13 +223,82 @@ class PXCAMTable(PXTable):
         #   value format ==> <action_ID><action_data1><action_data2>...
         self.entries = OrderedDict()
 
+        # on-disk key index used to handle duplicate keys in streaming mode
+        self.index = None
+        self.index_file = None
+        self.has_dups = False
+
     """
-    Add entry to CAM table
+    Convert a CAM entry into its (key, value) integers
     """
-    def add_entry(self, keys, action_name, action_data):
+    def hexify_entry(self, keys, action_name, action_data):
         key = self.hexify_key(keys)
         value = self.hexify_value(action_name, action_data)
-        self.entries[key] = value
+        return (key, value)
+
+    """
+    Insert an entry produced by hexify_entry()
+    """
+    def insert_entry(self, entry):
+        key, value = entry
+        if self.fout is None:
+            self.entries[key] = value
+        else:
+            self.stream_entry(key, value)
+
+    """
+    Add entry to CAM table
+    """
+    def add_entry(self, keys, action_name, action_data):
+        self.insert_entry(self.hexify_entry(keys, action_name, action_data))
+
+    """
+    Format a single line of the *.tbl file
+    """
+    def format_entry(self, key, value):
+        return "{:X} {:X}\n".format(key, value)
+
+    """
+    Streaming mode: keep a sqlite index of the keys written so far so that
+    duplicate keys can be detected without holding the table in memory
+    """
+    def open_px_file(self):
+        super(PXCAMTable, self).open_px_file()
+        fd, self.index_file = tempfile.mkstemp(prefix=self.name + '.', suffix='.idx')
+        os.close(fd)
+        self.index = sqlite3.connect(self.index_file)
+        self.index.execute("PRAGMA synchronous = OFF")
+        self.index.execute("PRAGMA journal_mode = OFF")
+        self.index.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT)")
+        self.has_dups = False
+
+    """
+    Streaming mode: write a new key straight to the *.tbl file. A duplicate
+    key only updates the index, the file is then regenerated from the index
+    by close_px_file() so the entry keeps its original position (as with the
+    OrderedDict used in buffered mode).
+    """
+    def stream_entry(self, key, value):
+        hkey, hvalue = "{:X}".format(key), "{:X}".format(value)
+        try:
+            self.index.execute("INSERT INTO entries VALUES (?, ?)", (hkey, hvalue))
+        except sqlite3.IntegrityError:
+            self.index.execute("UPDATE entries SET value = ? WHERE key = ?", (hvalue, hkey))
+            self.has_dups = True
+            return
+        self.fout.write(self.format_entry(key, value))
+
+    def close_px_file(self):
+        if self.has_dups:
+            self.fout.seek(0)
+            self.fout.truncate()
+            for hkey, hvalue in self.index.execute("SELECT key, value FROM entries ORDER BY rowid"):
+                self.fout.write("{} {}\n".format(hkey, hvalue))
+        self.index.close()
+        os.remove(self.index_file)
+        self.index = None
+        self.index_file = None
+        super(PXCAMTable, self).close_px_file()
 
     """
     Write the entries of the table to a file that can be used in the SDNet simulations 
@@ -153,7 +306,7 @@ class PXCAMTable(PXTable):
     def write_px_file(self):
         with open(self.name + ".tbl", 'w+') as fout:
             for key, value in self.entries.items():
-                fout.write("{:X} {:X}\n".format(key, value)) 
+                fout.write(self.format_entry(key, value))
 
 
 class PXTCAMTable(PXTable):
@@ -172,18 +325,37 @@ class PXTCAMTable(PXTable):
     Convert mask_list into single hex value represented as a string
     """
     def hexify_mask(self, mask_list):
-        fields = self.extract_fields(self.request_tuple)
-        field_vals = mask_list
-        return self._hexify(field_vals, fields)
+        return self.key_packer.pack(mask_list)
 
     """
-    Add an entry to a TCAM table.
+    Convert a TCAM entry into its (address, mask, key, value) integers
     """
-    def add_entry(self, address, keys, masks, action_name, action_data):
+    def hexify_entry(self, address, keys, masks, action_name, action_data):
         mask = self.hexify_mask(masks)
         key = self.hexify_key(keys)
         value = self.hexify_value(action_name, action_data)
-        self.entries.append([address, mask, key, value])
+        return (address, mask, key, value)
+
+    """
+    Insert an entry produced by hexify_entry()
+    """
+    def insert_entry(self, entry):
+        if self.fout is None:
+            self.entries.append(list(entry))
+        else:
+            self.fout.write(self.format_entry(*entry))
+
+    """
+    Add an entry to a TCAM table.
+    """
+    def add_entry(self, address, keys, masks, action_name, action_data):
+        self.insert_entry(self.hexify_entry(address, keys, masks, action_name, action_data))
+
+    """
+    Format a single line of the *.tbl file
+    """
+    def format_entry(self, addr, mask, key, value):
+        return "{:d} {:X} {:X} {:X}\n".format(addr, key, mask, value)
 
     """
     Write the entries of the table to a file that can be used in the SDNet simulations 
@@ -191,7 +363,7 @@ class PXTCAMTable(PXTable):
     def write_px_file(self):
         with open(self.name + ".tbl", 'w+') as fout:
             for addr, mask, key, value in self.entries:
-                fout.write("{:d} {:X} {:X} {:X}\n".format(addr, key, mask, value)) 
+                fout.write(self.format_entry(addr, mask, key, value))
 
 
 class PXLPMTable(PXTable):
@@ -206,12 +378,33 @@ class PXLPMTable(PXTable):
         # format       ==> [prefix, length, value] 
         self.entries = []
 
+    """
+    Convert an LPM entry into its (prefix, length, value)
+    """
+    def hexify_entry(self, prefix, length, action_name, action_data):
+        value = self.hexify_value(action_name, action_data)
+        return (prefix, length, value)
+
+    """
+    Insert an entry produced by hexify_entry()
+    """
+    def insert_entry(self, entry):
+        if self.fout is None:
+            self.entries.append(list(entry))
+        else:
+            self.fout.write(self.format_entry(*entry))
+
     """
     Add an entry to an LPM table.
     """
     def add_entry(self, prefix, length, action_name, action_data):
-        value = self.hexify_value(action_name, action_data)
-        self.entries.append([prefix, length, value])
+        self.insert_entry(self.hexify_entry(prefix, length, action_name, action_data))
+
+    """
+    Format a single line of the *.tbl file
+    """
+    def format_entry(self, prefix, length, value):
+        return "{} {:d} {:X}\n".format(prefix, length, value)
 
     """
     Write the entries of the table to a file that can be used in the SDNet simulations 
@@ -219,7 +412,7 @@ class PXLPMTable(PXTable):
     def write_px_file(self):
         with open(self.name + ".tbl", 'w+') as fout:
             for prefix, length, value in self.entries:
-                fout.write("{} {:d} {:X}\n".format(prefix, length, value))
+                fout.write(self.format_entry(prefix, length, value))
 
 
 PX_TABLES = {}
@@ -286,13 +479,14 @@ def ip2int(addr):
 def mac2int(addr):
     return int(addr.translate(None, ":"), 16)
 
+MAC_RE = re.compile(r'([\dA-Fa-f]{2}:){5}[\dA-Fa-f]{2}')
+IP_RE = re.compile(r'([0-9]{1,3}\.){3}[0-9]{1,3}')
+
 def convert_to_int(val):
     if type(val) == str:
-        mac_fmat = r'([\dA-Fa-f]{2}:){5}[\dA-Fa-f]{2}'
-        ip_fmat = r'([0-9]{1,3}\.){3}[0-9]{1,3}'
-        if re.match(mac_fmat, val):
+        if MAC_RE.match(val):
             return mac2int(val)
-        elif re.match(ip_fmat, val):
+        elif IP_RE.match(val):
             return ip2int(val)
         else:
             try:
@@ -306,6 +500,38 @@ def convert_to_int(val):
         print >> sys.stderr, "ERROR: failed to convert {} of type {} to an integer".format(val, type(val))
         sys.exit(1)
 
+"""
+Fast path of convert_to_int() for plain integer values. Strings that
+int() cannot parse (MAC and IPv4 addresses) fall back to convert_to_int().
+"""
+def parse_int(val):
+    if type(val) == int:
+        return val
+    try:
+        return int(val, 0)
+    except (ValueError, TypeError):
+        return convert_to_int(val)
+
+def parse_mac(val):
+    if type(val) == str and MAC_RE.match(val):
+        return mac2int(val)
+    return parse_int(val)
+
+def parse_ip(val):
+    if type(val) == str and IP_RE.match(val):
+        return ip2int(val)
+    return parse_int(val)
+
+"""
+Pick the value parser to use for a field of the given bit width
+"""
+def field_parser(size):
+    if size == 48:
+        return parse_mac
+    elif size == 32:
+        return parse_ip
+    return parse_int
+
 def parse_table_cam_add_entry(line):
     stmt = line.split('=>')
     if len(stmt) != 2:
@@ -365,7 +591,11 @@ def parse_table_lpm_add_entry(line):
         print >> sys.stderr, "ERROR: must specify exactly one length for each prefix"
         sys.exit(1)
     prefix = prefix_len[0]
-    length = prefix_len[1]
+    try:
+        length = int(prefix_len[1], 0)
+    except ValueError:
+        print >> sys.stderr, "ERROR: LPM prefix length could not be converted to integer"
+        sys.exit(1)
     rhs = searchObj.groupdict()['action_data'].split()
     action_data = rhs
     return (table_name, prefix, length, action_name, action_data)
@@ -402,37 +632,249 @@ def run_table_lpm_add_entry(line):
         sys.exit(1)       
     PX_TABLES[table_name].add_entry(prefix, length, action_name, action_data)
 
+COMMANDS = OrderedDict([
+    ("table_cam_add_entry", run_table_cam_add_entry),
+    ("table_tcam_add_entry", run_table_tcam_add_entry),
+    ("table_lpm_add_entry", run_table_lpm_add_entry),
+])
+
+PARSERS = {
+    "table_cam_add_entry": parse_table_cam_add_entry,
+    "table_tcam_add_entry": parse_table_tcam_add_entry,
+    "table_lpm_add_entry": parse_table_lpm_add_entry,
+}
+
 """
-Iterate through the commands in the commands_file to fill out the table entries
+Return the name of the table that the args of a command refer to
+"""
+def command_table_name(args):
+    fields = args.split(None, 1)
+    return fields[0] if len(fields) > 0 else None
+
+"""
+Lazily yield (command, args) for each table command in the commands_file.
+Commands that refer to a table in skip are left out.
 """
-def fill_px_tables(commands_file):
+def read_commands(commands_file, skip=()):
     with open(commands_file) as f:
         for line in f:
             line = line.strip()
-            if line.startswith("table_cam_add_entry"):
-                run_table_cam_add_entry(line.replace("table_cam_add_entry","").strip())
-            elif line.startswith("table_tcam_add_entry"):
-                run_table_tcam_add_entry(line.replace("table_tcam_add_entry","").strip())
-            elif line.startswith("table_lpm_add_entry"):
-                run_table_lpm_add_entry(line.replace("table_lpm_add_entry","").strip())
+            for cmd in COMMANDS.keys():
+                if line.startswith(cmd):
+                    args = line.replace(cmd, "").strip()
+                    if len(skip) == 0 or command_table_name(args) not in skip:
+                        yield cmd, args
+                    break
+
+"""
+Iterate through the commands in the commands_file to fill out the table entries
+"""
+def fill_px_tables(commands_file, skip=()):
+    for cmd, args in read_commands(commands_file, skip):
+        COMMANDS[cmd](args)
 
 """
 Write the *.tbl files
 """
-def write_px_tables():
-    for table in PX_TABLES.values():
-        table.write_px_file()
+def write_px_tables(skip=()):
+    for name, table in PX_TABLES.items():
+        if name not in skip:
+            table.write_px_file()
+
+"""
+Compute a hash of the inputs of each table: its table_dict from the
+switch_info_file and its lines in the commands_file
+"""
+def hash_px_tables(commands_file):
+    hashes = {}
+    for name, table in PX_TABLES.items():
+        hashes[name] = hashlib.sha1(json.dumps([CACHE_VERSION, table.block_name, table.info], sort_keys=True))
+    for cmd, args in read_commands(commands_file):
+        name = command_table_name(args)
+        if name in hashes:
+            hashes[name].update("{} {}\n".format(cmd, args))
+    return dict((name, h.hexdigest()) for name, h in hashes.items())
+
+def load_px_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+"""
+Return the hash of the contents of a *.tbl file
+"""
+def hash_px_file(filename):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            h.update(block)
+    return h.hexdigest()
+
+"""
+Write the cache: for each table the hash of its inputs and the hash of the
+*.tbl file that was generated from them
+"""
+def save_px_cache(cache_file, hashes):
+    cache = dict((name, [digest, hash_px_file(PX_TABLES[name].name + ".tbl")]) for name, digest in hashes.items())
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f, indent=4, sort_keys=True)
+
+"""
+Return the set of tables whose inputs have not changed since the cache was
+written and whose *.tbl file still is the one generated from them
+"""
+def find_cached_px_tables(hashes, cache):
+    cached = set()
+    for name, digest in hashes.items():
+        entry = cache.get(name)
+        if not isinstance(entry, list) or len(entry) != 2 or entry[0] != digest:
+            continue
+        tbl_file = PX_TABLES[name].name + ".tbl"
+        if os.path.isfile(tbl_file) and hash_px_file(tbl_file) == entry[1]:
+            cached.add(name)
+    return cached
+
+"""
+Group the commands in the commands_file into lists of up to size commands
+"""
+def read_chunks(commands_file, size, skip=()):
+    chunk = []
+    for command in read_commands(commands_file, skip):
+        chunk.append(command)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+"""
+Parse and hexify a single command without adding it to its table.
+Returns (table_name, entry)
+"""
+def hexify_command(cmd, args):
+    parsed = PARSERS[cmd](args)
+    table_name = parsed[0]
+    if (table_name not in PX_TABLES):
+        print >> sys.stderr, "ERROR: {} is not a recognized table name".format(table_name)
+        sys.exit(1)
+    return table_name, PX_TABLES[table_name].hexify_entry(*parsed[1:])
+
+"""
+Worker process side of fill_px_tables_parallel()
+"""
+def init_worker(switch_info_file):
+    if len(PX_TABLES) == 0:
+        make_px_tables(switch_info_file)
+
+"""
+Returns (results, None), or (None, error message) if a command could not be
+parsed. The message is printed by the parent, so that it is only reported
+once however many workers are running.
+"""
+def hexify_chunk(chunk):
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        return [hexify_command(cmd, args) for cmd, args in chunk], None
+    except SystemExit:
+        return None, sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+
+"""
+Same as fill_px_tables() but the commands are parsed and hexified by a pool
+of jobs worker processes. Results are inserted into the tables in the order
+of the commands_file so the *.tbl files are identical to the serial ones.
+"""
+def fill_px_tables_parallel(commands_file, switch_info_file, jobs, skip=()):
+    pool = multiprocessing.Pool(jobs, init_worker, (switch_info_file,))
+    try:
+        chunks = read_chunks(commands_file, CHUNK_SIZE, skip)
+        pending = None
+        while True:
+            # keep the workers busy with the next window while the results
+            # of the previous one are inserted
+            window = list(islice(chunks, 2*jobs))
+            next_pending = pool.map_async(hexify_chunk, window) if len(window) > 0 else None
+            if pending is not None:
+                for results, error in pending.get():
+                    if error is not None:
+                        sys.stderr.write(error)
+                        sys.exit(1)
+                    for table_name, entry in results:
+                        PX_TABLES[table_name].insert_entry(entry)
+            if next_pending is None:
+                break
+            pending = next_pending
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+"""
+Fill out the *.tbl files while iterating through the commands_file, without
+keeping the table entries in memory. fill is called with fill_args to
+process the commands. The tables are written to temporary files which only
+replace the *.tbl files once all of the commands have been processed, so a
+failed run leaves the *.tbl files untouched.
+"""
+def stream_px_tables(skip, fill, *fill_args):
+    tables = [table for name, table in PX_TABLES.items() if name not in skip]
+    for table in tables:
+        table.open_px_file()
+    done = False
+    try:
+        fill(*fill_args)
+        done = True
+    finally:
+        for table in tables:
+            if table.fout is not None:
+                table.close_px_file()
+        for table in tables:
+            if done:
+                table.commit_px_file()
+            else:
+                table.discard_px_file()
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('commands_file', type=str, help="the commands.txt file")
     parser.add_argument('switch_info_file', type=str, help="the .sdnet_switch_info.dat file")
+    parser.add_argument('--stream', action='store_true', default=False, help="write the *.tbl files incrementally using bounded memory")
+    parser.add_argument('--jobs', type=int, default=1, help="number of worker processes used to parse the commands")
+    parser.add_argument('--cache', type=str, default=None, help="cache file used to only rebuild the *.tbl files whose inputs changed")
 
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     make_px_tables(args.switch_info_file)
-    fill_px_tables(args.commands_file)
-    write_px_tables()
+
+    # tables whose *.tbl file is already up to date
+    skip = set()
+    if args.cache is not None:
+        hashes = hash_px_tables(args.commands_file)
+        skip = find_cached_px_tables(hashes, load_px_cache(args.cache))
+        if len(skip) == len(PX_TABLES):
+            return
+
+    if args.jobs > 1:
+        fill, fill_args = fill_px_tables_parallel, (args.commands_file, args.switch_info_file, args.jobs, skip)
+    else:
+        fill, fill_args = fill_px_tables, (args.commands_file, skip)
+
+    if args.stream:
+        stream_px_tables(skip, fill, *fill_args)
+    else:
+        fill(*fill_args)
+        write_px_tables(skip)
+
+    if args.cache is not None:
+        save_px_cache(args.cache, hashes)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2017 Stephen Ibanez
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+
+
+"""
+Encode and decode the hex tuple lines of the SDNet simulations
+(Tuple_in.txt, Tuple_expect.txt) from a field layout, i.e. an OrderedDict
+mapping each field name to its width in bits with the first field in the
+most significant bits (sume_field_len, dig_field_len)
+"""
+
+import atexit, collections
+from binascii import hexlify, unhexlify
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LIMB_BITS = 64
+LIMB_MASK = (1 << LIMB_BITS) - 1
+
+class TupleCodec(object):
+    """
+    Packs and unpacks the fields of a tuple with shifts and masks that are
+    computed once, when the codec is created.
+    """
+
+    def __init__(self, field_len):
+        self.field_len = collections.OrderedDict(field_len)
+        self.num_bits = sum(self.field_len.values())
+        self.hex_chars = (self.num_bits + 3) / 4
+        self.hex_fmt = '%0{0}x'.format(self.hex_chars)
+        # (name, shift, mask) from the most significant field down
+        self.layout = []
+        shift = self.num_bits
+        for name, length in self.field_len.items():
+            shift -= length
+            self.layout.append((name, shift, (1 << length) - 1))
+        # number of 64-bit limbs used by the batch (numpy) functions
+        self.num_limbs = max(1, (self.num_bits + LIMB_BITS - 1) / LIMB_BITS)
+
+    """
+    Return the tuple (any mapping from field name to value, missing fields
+    are 0) as an integer
+    """
+    def encode(self, tup):
+        val = 0
+        for name, shift, mask in self.layout:
+            val |= (tup.get(name, 0) & mask) << shift
+        return val
+
+    """
+    Return the tuple as a hex string, as written to the tuple files
+    """
+    def encode_hex(self, tup):
+        return self.hex_fmt % self.encode(tup)
+
+    """
+    Return the hex lines of all of the tuples as a single string
+    """
+    def encode_batch(self, tuples):
+        hex_fmt = self.hex_fmt
+        encode = self.encode
+        return ''.join([hex_fmt % encode(tup) + '\n' for tup in tuples])
+
+    """
+    Return the OrderedDict of field values of the tuple integer val
+    """
+    def decode(self, val):
+        if val >> self.num_bits:
+            raise ValueError('tuple 0x{0:x} is wider than {1} bits'.format(val, self.num_bits))
+        tup = collections.OrderedDict()
+        for name, shift, mask in self.layout:
+            tup[name] = (val >> shift) & mask
+        return tup
+
+    """
+    Return the OrderedDict of field values of the hex string of a tuple
+    """
+    def decode_hex(self, tup_string):
+        return self.decode(int(tup_string, 16))
+
+    ##########################################
+    ## Batch functions (NumPy is required) ##
+    ##########################################
+
+    """
+    Encode n tuples given as columns: a mapping from field name to a
+    sequence of n values (missing fields are 0). Fields of up to 64 bits may
+    be NumPy arrays and are packed with vectorized shifts, wider fields
+    must be sequences of python ints. Returns the packed tuples as an
+    (n, num_limbs) array of uint64 with the most significant limb first.
+    """
+    def encode_columns(self, columns, n):
+        limbs = np.zeros((n, self.num_limbs), dtype=np.uint64)
+        top = self.num_limbs * LIMB_BITS
+        for name, shift, mask in self.layout:
+            if name not in columns:
+                continue
+            width = mask.bit_length()
+            if width > LIMB_BITS:
+                # wide fields are split into limbs one value at a time
+                for row, val in enumerate(columns[name]):
+                    val = (int(val) & mask) << shift
+                    for k in range(self.num_limbs):
+                        limbs[row, self.num_limbs-1-k] |= np.uint64((val >> (k*LIMB_BITS)) & LIMB_MASK)
+                continue
+            col = np.asarray(columns[name], dtype=np.uint64) & np.uint64(mask)
+            k, bit = divmod(shift, LIMB_BITS)
+            limbs[:, self.num_limbs-1-k] |= col << np.uint64(bit)
+            if bit + width > LIMB_BITS:
+                limbs[:, self.num_limbs-2-k] |= col >> np.uint64(LIMB_BITS - bit)
+        return limbs
+
+    """
+    Return the hex lines of an (n, num_limbs) array from encode_columns()
+    as a single string
+    """
+    def limbs_to_hex(self, limbs):
+        raw = hexlify(limbs.astype('>u8').tobytes())
+        row_chars = self.num_limbs * LIMB_BITS / 4
+        skip = row_chars - self.hex_chars
+        return ''.join([raw[i+skip:i+row_chars] + '\n' for i in xrange(0, len(raw), row_chars)])
+
+    """
+    Decode a sequence of hex tuple strings into an (n, num_limbs) array of
+    uint64 with the most significant limb first
+    """
+    def hex_to_limbs(self, tup_strings):
+        row_chars = self.num_limbs * LIMB_BITS / 4
+        try:
+            raw = unhexlify(''.join([s.strip().zfill(row_chars) for s in tup_strings]))
+        except TypeError:
+            raise ValueError('invalid hex tuple data')
+        if len(raw) * 2 != row_chars * len(tup_strings):
+            raise ValueError('tuple wider than {0} bits'.format(self.num_bits))
+        limbs = np.frombuffer(raw, dtype='>u8').astype(np.uint64)
+        return limbs.reshape((len(tup_strings), self.num_limbs))
+
+    """
+    Return the values of field name for every row of an (n, num_limbs)
+    array. Fields of up to 64 bits are extracted with vectorized shifts
+    into a uint64 array, wider fields are returned as a list of python ints.
+    """
+    def extract_field(self, limbs, name):
+        for field, shift, mask in self.layout:
+            if field == name:
+                break
+        else:
+            raise KeyError(name)
+        width = mask.bit_length()
+        if width > LIMB_BITS:
+            vals = []
+            for row in limbs:
+                val = 0
+                for limb in row:
+                    val = (val << LIMB_BITS) | int(limb)
+                vals.append((val >> shift) & mask)
+            return vals
+        k, bit = divmod(shift, LIMB_BITS)
+        col = limbs[:, self.num_limbs-1-k] >> np.uint64(bit)
+        if bit + width > LIMB_BITS:
+            col = col | (limbs[:, self.num_limbs-2-k] << np.uint64(LIMB_BITS - bit))
+        return col & np.uint64(mask)
+
+    """
+    Decode a sequence of hex tuple strings into an OrderedDict mapping each
+    field name to its column of values (see extract_field)
+    """
+    def decode_columns(self, tup_strings):
+        limbs = self.hex_to_limbs(tup_strings)
+        columns = collections.OrderedDict()
+        for name, shift, mask in self.layout:
+            columns[name] = self.extract_field(limbs, name)
+        return columns
+
+
+class TupleWriter(object):
+    """
+    Keeps a tuple file open and writes the lines added to it in bulk, once
+    flush_lines of them have been buffered and when the program exits
+    """
+
+    def __init__(self, filename, flush_lines=4096):
+        self.filename = filename
+        self.flush_lines = flush_lines
+        self.f = None
+        self.lines = []
+        atexit.register(self.close)
+
+    """
+    Empty the file
+    """
+    def clear(self):
+        self.lines = []
+        if self.f is not None:
+            self.f.close()
+        self.f = open(self.filename, 'w')
+
+    def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.flush_lines:
+            self.flush()
+
+    def flush(self):
+        if self.f is None:
+            self.f = open(self.filename, 'a')
+        self.f.write(''.join(self.lines))
+        self.f.flush()
+        self.lines = []
+
+    def close(self):
+        if self.f is not None or self.lines:
+            self.flush()
+            self.f.close()
+            self.f = None
+
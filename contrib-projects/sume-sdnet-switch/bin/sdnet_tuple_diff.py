@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2017 Stephen Ibanez
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+
+
+"""
+Compare the expected tuples of an SDNet simulation (Tuple_expect.txt) with
+the tuples output by the simulator, field by field. Each line holds the
+digest tuple followed by the sume tuple, in hex. The field layouts are
+taken from the project's sss_sdnet_tuples.py.
+
+Both files are streamed in chunks, identical lines are skipped without
+decoding and the differing lines of a chunk are decoded together (with
+NumPy when it is available), so memory use does not grow with the number
+of tuples.
+"""
+
+import argparse, collections, os, sys
+from itertools import izip_longest
+from sdnet_tuple_codec import np
+
+CHUNK_LINES = 8192
+
+class TupleDiff(object):
+    """
+    Accumulates the per-field mismatch counts and the first max_rows
+    differing rows of a comparison
+    """
+
+    def __init__(self, codecs, max_rows=10):
+        # [(tuple name, codec)] in the order of the fields on each line
+        self.codecs = codecs
+        self.max_rows = max_rows
+        self.num_rows = 0
+        self.num_diff_rows = 0
+        self.missing = 0
+        self.extra = 0
+        self.field_mismatches = collections.OrderedDict()
+        for tup_name, codec in codecs:
+            for field in codec.field_len:
+                self.field_mismatches[(tup_name, field)] = 0
+        # [(row, [(tuple name, field, expected, actual)])]
+        self.rows = []
+
+    """
+    Compare one chunk of lines, the first of which is tuple number start
+    """
+    def compare_chunk(self, start, exp_lines, out_lines):
+        diff_idx = []
+        for i, (exp_line, out_line) in enumerate(izip_longest(exp_lines, out_lines)):
+            if exp_line is None:
+                self.extra += 1
+            elif out_line is None:
+                self.missing += 1
+            elif exp_line.split() != out_line.split():
+                diff_idx.append(i)
+        self.num_rows += min(len(exp_lines), len(out_lines))
+        if not diff_idx:
+            return
+
+        exp_split = [exp_lines[i].split() for i in diff_idx]
+        out_split = [out_lines[i].split() for i in diff_idx]
+        for k, i in enumerate(diff_idx):
+            if len(exp_split[k]) != len(self.codecs) or len(out_split[k]) != len(self.codecs):
+                print >> sys.stderr, "ERROR: tuple {0}: expected {1} tuples per line".format(start + i, len(self.codecs))
+                sys.exit(1)
+        # only the first max_rows differing rows are reported in detail
+        remaining = self.max_rows - len(self.rows)
+        row_diffs = collections.defaultdict(list)
+        bad_rows = set()
+        for pos, (tup_name, codec) in enumerate(self.codecs):
+            exp_cols = decode_columns(codec, [fields[pos] for fields in exp_split], start, diff_idx)
+            out_cols = decode_columns(codec, [fields[pos] for fields in out_split], start, diff_idx)
+            for field in codec.field_len:
+                exp_col = exp_cols[field]
+                out_col = out_cols[field]
+                if np is not None and isinstance(exp_col, np.ndarray):
+                    bad = np.nonzero(exp_col != out_col)[0].tolist()
+                else:
+                    bad = [k for k, (e, o) in enumerate(zip(exp_col, out_col)) if e != o]
+                self.field_mismatches[(tup_name, field)] += len(bad)
+                bad_rows.update(bad)
+                for k in bad:
+                    if k < remaining:
+                        row_diffs[k].append((tup_name, field, int(exp_col[k]), int(out_col[k])))
+        self.num_diff_rows += len(bad_rows)
+        for k in sorted(row_diffs):
+            self.rows.append((start + diff_idx[k], row_diffs[k]))
+
+    def passed(self):
+        return self.num_diff_rows == 0 and self.missing == 0 and self.extra == 0
+
+    def report(self):
+        print "Compared {0} tuple(s): {1} differ, {2} missing, {3} unexpected".format(
+            self.num_rows, self.num_diff_rows, self.missing, self.extra)
+        for (tup_name, field), count in self.field_mismatches.items():
+            if count > 0:
+                print "  {0}.{1}: {2} mismatch(es)".format(tup_name, field, count)
+        for row, diffs in self.rows:
+            print "tuple {0}:".format(row)
+            for tup_name, field, exp_val, out_val in diffs:
+                print "    {0}.{1}: expected 0x{2:x}, got 0x{3:x}".format(tup_name, field, exp_val, out_val)
+
+
+"""
+Decode the hex strings of one tuple type into columns, with NumPy if it is
+available and one tuple at a time otherwise
+"""
+def decode_columns(codec, tup_strings, start, diff_idx):
+    try:
+        if np is not None:
+            return codec.decode_columns(tup_strings)
+        columns = collections.OrderedDict((field, []) for field in codec.field_len)
+        for s in tup_strings:
+            for field, val in codec.decode_hex(s).items():
+                columns[field].append(val)
+        return columns
+    except ValueError as e:
+        print >> sys.stderr, "ERROR: bad tuple in tuples {0}-{1}: {2}".format(start + diff_idx[0], start + diff_idx[-1], e)
+        sys.exit(1)
+
+"""
+Yield (start line number, lines) chunks of f
+"""
+def read_chunks(f, size=CHUNK_LINES):
+    start = 1
+    while True:
+        lines = []
+        for line in f:
+            if line.strip():
+                lines.append(line)
+                if len(lines) == size:
+                    break
+        if not lines:
+            return
+        yield start, lines
+        start += len(lines)
+
+def diff_tuple_files(expect_file, out_file, codecs, max_rows=10):
+    diff = TupleDiff(codecs, max_rows)
+    with open(expect_file) as exp_f, open(out_file) as out_f:
+        for exp_chunk, out_chunk in izip_longest(read_chunks(exp_f), read_chunks(out_f)):
+            start = exp_chunk[0] if exp_chunk is not None else out_chunk[0]
+            diff.compare_chunk(start, exp_chunk[1] if exp_chunk is not None else [],
+                               out_chunk[1] if out_chunk is not None else [])
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--expect', type=str, default='Tuple_expect.txt', help="the expected tuples")
+    parser.add_argument('--out', type=str, default='Tuple_out.txt', help="the tuples output by the simulation")
+    parser.add_argument('--testdata', type=str, default='.', help="the directory of the project's sss_sdnet_tuples.py")
+    parser.add_argument('--max_rows', type=int, default=10, help="number of differing lines to print")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.testdata))
+    import sss_sdnet_tuples
+    codecs = [('digest', sss_sdnet_tuples.dig_codec), ('sume', sss_sdnet_tuples.sume_codec)]
+
+    diff = diff_tuple_files(args.expect, args.out, codecs, args.max_rows)
+    diff.report()
+    if not diff.passed():
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2017 Stephen Ibanez
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+
+
+"""
+Builds the libcam.c generated by gen_P4_SWITCH_CLI against a minimal CAM
+driver that records the key / value strings it is handed, and checks the
+strings produced by the batch entry points.
+"""
+
+import os, sys, shutil, tempfile, unittest, subprocess
+from ctypes import CDLL, c_uint32, c_int, c_char
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import gen_P4_SWITCH_CLI
+
+# Just enough of the SDNet CAM driver API for libcam.c to compile
+CAM_H = """
+#include <stdbool.h>
+#include <stdint.h>
+typedef uint64_t addr_t;
+typedef struct { uint32_t key_width; uint32_t value_width; } CAM_CONTEXT;
+#define CAM_OP_FAILED -1
+uint32_t CAM_Init_GetAddrSize(void);
+int CAM_Init_ValidateContext(CAM_CONTEXT* cx, addr_t baseAddr, uint32_t size, uint32_t max_depth,
+                             uint32_t key_width, uint32_t clk_period, uint32_t value_width,
+                             uint32_t aging_width, void (*register_write)(addr_t, uint32_t),
+                             uint32_t (*register_read)(addr_t), int (*log_msg)(const char*),
+                             uint32_t log_level);
+int CAM_Mgt_ReadEntry(CAM_CONTEXT* cx, char* key, uint32_t* value, bool* static_flag, bool* found);
+int CAM_Mgt_InsertEntry(CAM_CONTEXT* cx, const char* key, const char* value, int static_flag);
+int CAM_Mgt_RemoveEntry(CAM_CONTEXT* cx, const char* key);
+uint32_t CAM_Mgt_GetSize(CAM_CONTEXT* cx);
+const char* CAM_Error_Decode(int error);
+"""
+
+SUME_REG_IF_H = """
+#include <stdint.h>
+void sume_register_write(uint64_t addr, uint32_t data);
+uint32_t sume_register_read(uint64_t addr);
+"""
+
+# Records every key / value string passed to the driver
+CAM_C = """
+#include <stdio.h>
+#include <string.h>
+#include "CAM.h"
+char last_keys[4096];
+char last_values[4096];
+uint32_t CAM_Init_GetAddrSize(void) { return 0; }
+int CAM_Init_ValidateContext(CAM_CONTEXT* cx, addr_t baseAddr, uint32_t size, uint32_t max_depth,
+                             uint32_t key_width, uint32_t clk_period, uint32_t value_width,
+                             uint32_t aging_width, void (*register_write)(addr_t, uint32_t),
+                             uint32_t (*register_read)(addr_t), int (*log_msg)(const char*),
+                             uint32_t log_level) {
+    cx->key_width = key_width;
+    cx->value_width = value_width;
+    return 0;
+}
+int CAM_Mgt_ReadEntry(CAM_CONTEXT* cx, char* key, uint32_t* value, bool* static_flag, bool* found) { return 0; }
+int CAM_Mgt_InsertEntry(CAM_CONTEXT* cx, const char* key, const char* value, int static_flag) {
+    strcat(last_keys, key); strcat(last_keys, " ");
+    strcat(last_values, value); strcat(last_values, " ");
+    return 0;
+}
+int CAM_Mgt_RemoveEntry(CAM_CONTEXT* cx, const char* key) {
+    strcat(last_keys, key); strcat(last_keys, " ");
+    return 0;
+}
+uint32_t CAM_Mgt_GetSize(CAM_CONTEXT* cx) { return 0; }
+const char* CAM_Error_Decode(int error) { return ""; }
+void sume_register_write(uint64_t addr, uint32_t data) {}
+uint32_t sume_register_read(uint64_t addr) { return 0; }
+"""
+
+TABLE_INFO = {'table_name': 'test_table', 'tableID': '1', 'clk_period': '5',
+              'key_width': '80', 'value_width': '40', 'max_depth': '64',
+              'aging_width': '0', 'base_address': '0x0'}
+
+def have_cc():
+    try:
+        return subprocess.call(['cc', '--version'], stdout=open(os.devnull, 'w'),
+                               stderr=subprocess.STDOUT) == 0
+    except OSError:
+        return False
+
+@unittest.skipUnless(have_cc(), "no C compiler available")
+class LibcamBatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cli_dir = os.path.join(cls.tmp_dir, gen_P4_SWITCH_CLI.CLI_dir)
+        os.mkdir(cli_dir)
+        gen_P4_SWITCH_CLI.write_libcam(cls.tmp_dir, {'test_table': TABLE_INFO}, '0x44020000')
+        for fname, contents in [('CAM.h', CAM_H), ('sume_reg_if.h', SUME_REG_IF_H), ('CAM.c', CAM_C)]:
+            with open(os.path.join(cli_dir, fname), 'w') as f:
+                f.write(contents)
+        lib = os.path.join(cli_dir, 'libcam.so')
+        subprocess.check_call(['cc', '-shared', '-fPIC', '-o', lib,
+                               os.path.join(cli_dir, gen_P4_SWITCH_CLI.LIBCAM_FILE),
+                               os.path.join(cli_dir, 'CAM.c'), '-I', cli_dir])
+        cls.lib = CDLL(lib)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def setUp(self):
+        for name in ['last_keys', 'last_values']:
+            self.recorded_buf(name)[0] = '\0'
+
+    def recorded_buf(self, name):
+        return (c_char * 4096).in_dll(self.lib, name)
+
+    def recorded(self, name):
+        return self.recorded_buf(name).value.split()
+
+    def test_add_entries_zero_pads_each_word(self):
+        # 80-bit keys use 3 words and 40-bit values use 2 words, least significant word first
+        keys = (c_uint32 * 6)(0x1, 0x0, 0xaabb, 0x00000fff, 0x0000abcd, 0x12)
+        values = (c_uint32 * 4)(0x5, 0x1, 0xabcdef, 0x0)
+        rcs = (c_int * 2)()
+        rc = self.lib.cam_add_entries(1, 2, keys, values, rcs)
+        self.assertEqual(rc, 0)
+        self.assertEqual(list(rcs), [0, 0])
+        self.assertEqual(self.recorded('last_keys'),
+                         ['0000aabb0000000000000001', '000000120000abcd00000fff'])
+        self.assertEqual(self.recorded('last_values'),
+                         ['0000000100000005', '0000000000abcdef'])
+
+    def test_delete_entries_zero_pads_each_word(self):
+        keys = (c_uint32 * 3)(0xf, 0xffffffff, 0x1)
+        rcs = (c_int * 1)()
+        rc = self.lib.cam_delete_entries(1, 1, keys, rcs)
+        self.assertEqual(rc, 0)
+        self.assertEqual(self.recorded('last_keys'), ['00000001ffffffff0000000f'])
+
+if __name__ == '__main__':
+    unittest.main()
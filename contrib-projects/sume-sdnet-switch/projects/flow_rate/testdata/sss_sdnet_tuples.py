@@ -36,6 +36,7 @@ SDNet simulations
 """
 
 import argparse, collections, sys
+from sdnet_tuple_codec import TupleCodec, TupleWriter
 
 # this defines the common sume_metadata
 from sume_event_metadata import *
@@ -55,58 +56,35 @@ dig_field_len['unused'] = 8
 dig_tuple_expect = collections.OrderedDict()
 dig_tuple_expect['unused'] = 0
 
-"""
-Clear the tuple files
-"""
-def clear_tuple_files():
-    with open(tuple_in_file, "w") as f:
-        f.write("")
-    
-    with open(tuple_expect_file, "w") as f:
-        f.write("")
+# codecs built from the field layouts above
+sume_codec = TupleCodec(sume_field_len)
+dig_codec = TupleCodec(dig_field_len)
 
+# the tuple files are kept open and written in bulk
+tuple_in_writer = TupleWriter(tuple_in_file)
+tuple_expect_writer = TupleWriter(tuple_expect_file)
 
 """
-Return a binary string with length = field_len_dic[field_name] 
+Clear the tuple files
 """
-def get_bin_val(field_name, value, field_len_dic):
-    format_string = "{0:0%db}" % field_len_dic[field_name] 
-    bin_string = format_string.format(value)
-    return bin_string
+def clear_tuple_files():
+    tuple_in_writer.clear()
+    tuple_expect_writer.clear()
 
 """
-Given a binary string, return the hex version
+Write out any buffered lines of the tuple files (also done at exit)
 """
-def bin_to_hex(bin_string):
-    hex_string = ''
-    assert(len(bin_string) % 4 == 0)
-    for i in range(0,len(bin_string),4):
-        hex_string += "{0:1x}".format(int(bin_string[i:i+4], 2))
-    return hex_string 
+def flush_tuple_files():
+    tuple_in_writer.flush()
+    tuple_expect_writer.flush()
 
 """
 Write the next line of the Tuple_in.txt and Tuple_expect.txt
 """
 def write_tuples():
-    with open("Tuple_in.txt", "a") as f:
-        tup_bin_string = ''
-        for field_name, value in sume_tuple_in.iteritems():
-            bin_val = get_bin_val(field_name, value, sume_field_len)
-            tup_bin_string += bin_val
-        f.write(bin_to_hex(tup_bin_string) + '\n')
-
-    with open("Tuple_expect.txt", "a") as f:
-        tup_bin_string = ''
-        for field_name, value in dig_tuple_expect.iteritems():
-            bin_val = get_bin_val(field_name, value, dig_field_len)
-            tup_bin_string += bin_val
-        f.write(bin_to_hex(tup_bin_string) + ' ')
-
-        tup_bin_string = ''
-        for field_name, value in sume_tuple_expect.iteritems():
-            bin_val = get_bin_val(field_name, value, sume_field_len)
-            tup_bin_string += bin_val
-        f.write(bin_to_hex(tup_bin_string) + '\n')
+    tuple_in_writer.write(sume_codec.encode_hex(sume_tuple_in) + '\n')
+    tuple_expect_writer.write(dig_codec.encode_hex(dig_tuple_expect) + ' ' +
+                              sume_codec.encode_hex(sume_tuple_expect) + '\n')
 
 
 ###############################
@@ -114,43 +92,25 @@ def write_tuples():
 ###############################
 
 def find_tup_len(field_len_dic):
-    num_bits = 0
-    for length in field_len_dic.values():
-        num_bits += length
-    return num_bits
+    return sum(field_len_dic.values())
 
 """
-Given a hex string, convert it to a binary string
+Given hex string representation of a tuple, return the parsed version of it
 """
-def hex_to_bin(hex_string, length):
-    fmat_string = '{0:0%db}' % length
-    bin_string = fmat_string.format(int(hex_string, 16))
-    return bin_string
-
-def check_length(bin_string, field_len_dic):
-    num_bits = find_tup_len(field_len_dic)
+def parse_tup_string(tup_string, field_len_dic):
+    if field_len_dic is sume_field_len:
+        codec = sume_codec
+    elif field_len_dic is dig_field_len:
+        codec = dig_codec
+    else:
+        codec = TupleCodec(field_len_dic)
     try:
-        assert(len(bin_string) == num_bits)
-    except:
+        return codec.decode_hex(tup_string)
+    except ValueError as e:
         print 'ERROR: unexpected input'
-        print 'len(bin_string) = ', len(bin_string)
-        print 'num_bits = ', num_bits
+        print e
         sys.exit(1)
 
-"""
-Given hex string representation of a tuple, return the parsed version of it
-"""
-def parse_tup_string(tup_string, field_len_dic):
-    tup_len = find_tup_len(field_len_dic)
-    bin_string = hex_to_bin(tup_string, tup_len)
-    check_length(bin_string, field_len_dic)
-    tup = collections.OrderedDict()   
-    i = 0
-    for (field,length) in field_len_dic.iteritems():
-        tup[field] = int(bin_string[i:i+length], 2)
-        i += length
-    return tup
-
 def parse_line(line, tuple_type):
     if tuple_type == 'sume':
         field_len = sume_field_len
@@ -30,9 +30,8 @@
 #
 
 
-import sys, os
-sys.path.append(os.path.expandvars('$P4_PROJECT_DIR/testdata/'))
-from sss_digest_header import *
+import sys, os, time, struct, socket, argparse, threading, Queue
+from collections import OrderedDict
 
 sys.path.append(os.path.expandvars('$P4_PROJECT_DIR/sw/CLI/'))
 from p4_tables_api import *
@@ -40,43 +39,179 @@ from p4_tables_api import *
 """
 This is the learning switch software that adds the appropriate
 entries to the forwarding and smac tables 
+
+Digest packets are read from a raw socket by a reader thread and queued.
+A worker thread drains the queue, drops MACs that are already known or
+were seen recently, and adds the new MACs to the tables in batches.
 """
 
 DMA_IFACE = 'nf0'
 DIG_PKT_LEN = 32 # 32 bytes, 256 bits
+ETH_P_ALL = 0x0003
+
+# Digest_data layout (see testdata/sss_digest_header.py):
+#   src_port (1 byte), eth_src_addr (8 bytes, little endian), unused (23 bytes)
+DIGEST_FMT = struct.Struct('<BQ23x')
+
+QUEUE_SIZE = 65536
+BATCH_SIZE = 256      # max number of MACs added per table update
+BATCH_TIMEOUT = 0.01  # seconds to wait for a batch to fill up
+DEDUP_WINDOW = 1.0    # seconds during which a repeated MAC is ignored
+METRICS_INTERVAL = 5  # seconds between metrics reports
+
+class LearnMetrics(object):
+    """
+    Counters reported periodically by the learning agent
+    """
 
-forward_tbl = {}
-smac_tbl = {}
-
-def learn_digest(pkt):
-    dig_pkt = Digest_data(str(pkt))
-    if len(dig_pkt) != DIG_PKT_LEN:
-        return
-    print "Received Digest packet: "
-    print "\tsrc_port = ", bin(dig_pkt.src_port)
-    print "\teth_src_addr = ", hex(dig_pkt.eth_src_addr)
-    print "prn pkt = ",
-    hexdump(dig_pkt)
-    print "###################################"
-    add_to_tables(dig_pkt)
-
-def add_to_tables(dig_pkt):
-    src_port = dig_pkt.src_port
-    eth_src_addr = dig_pkt.eth_src_addr
-    (found, val) = table_cam_read_entry('forward', [eth_src_addr])
-    if (found == 'False'):
-        print 'Adding entry: ({0}, set_output_port, {1}) to the forward table'.format(hex(eth_src_addr), bin(src_port))
-        table_cam_add_entry('forward', [eth_src_addr], 'set_output_port', [src_port])
-        print 'Adding entry: ({0}, NoAction, []) to the smac table'.format(hex(eth_src_addr))
-        table_cam_add_entry('smac', [eth_src_addr], 'NoAction', [])
-    else:
-        print "Entry: ({0}, set_output_port, {1}) is already in the tables".format(hex(eth_src_addr), bin(src_port))
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received = 0
+        self.dropped = 0
+        self.malformed = 0
+        self.duplicates = 0
+        self.learned = 0
+        self.failed = 0
+        self.last_learned = 0
+        self.last_time = time.time()
+
+    def incr(self, name, n=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def report(self, queue):
+        with self.lock:
+            now = time.time()
+            rate = (self.learned - self.last_learned) / (now - self.last_time)
+            self.last_learned = self.learned
+            self.last_time = now
+            print "learn rate = {0:.1f}/s, queue depth = {1}, received = {2}, dropped = {3}, malformed = {4}, duplicates = {5}, learned = {6}, failed = {7}".format(
+                rate, queue.qsize(), self.received, self.dropped, self.malformed, self.duplicates, self.learned, self.failed)
+            sys.stdout.flush()
+
+"""
+Parse a digest packet into (src_port, eth_src_addr), returns None if the
+packet is not a digest
+"""
+def parse_digest(pkt):
+    if len(pkt) != DIG_PKT_LEN:
+        return None
+    return DIGEST_FMT.unpack(pkt)
+
+"""
+Read digest packets from iface and put the parsed digests on the queue
+"""
+def read_digests(iface, queue, metrics):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+    sock.bind((iface, ETH_P_ALL))
+    while True:
+        digest = parse_digest(sock.recv(2048))
+        if digest is None:
+            metrics.incr('malformed')
+            continue
+        metrics.incr('received')
+        try:
+            queue.put_nowait(digest)
+        except Queue.Full:
+            metrics.incr('dropped')
+
+"""
+Take up to BATCH_SIZE digests from the queue, waiting at most
+BATCH_TIMEOUT for more digests once the first one has arrived
+"""
+def get_batch(queue):
+    batch = [queue.get()]
+    deadline = time.time() + BATCH_TIMEOUT
+    while len(batch) < BATCH_SIZE:
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(queue.get(timeout=timeout))
+        except Queue.Empty:
+            break
+    return batch
+
+"""
+Add the new MACs in each batch of digests to the forward and smac tables
+"""
+def learn_digests(queue, metrics):
+    recent = {} # eth_src_addr ==> time last seen
+    last_prune = time.time()
+    while True:
+        batch = get_batch(queue)
+        now = time.time()
+        new_macs = OrderedDict()
+        for src_port, eth_src_addr in batch:
+            if (eth_src_addr in new_macs or now - recent.get(eth_src_addr, -DEDUP_WINDOW) < DEDUP_WINDOW):
+                metrics.incr('duplicates')
+                continue
+            recent[eth_src_addr] = now
+            (found, val) = table_cam_read_entry('forward', [eth_src_addr])
+            if (found == 'False'):
+                new_macs[eth_src_addr] = src_port
+            else:
+                metrics.incr('duplicates')
+
+        # forget MACs outside of the dedup window, once per window
+        if now - last_prune >= DEDUP_WINDOW:
+            recent = dict((mac, t) for mac, t in recent.items() if now - t < DEDUP_WINDOW)
+            last_prune = now
+
+        if len(new_macs) == 0:
+            continue
+        macs = new_macs.keys()
+        forward_rcs = table_cam_add_entries('forward', [([mac], 'set_output_port', [port]) for mac, port in new_macs.items()])
+        smac_rcs = table_cam_add_entries('smac', [([mac], 'NoAction', []) for mac in macs])
+        # a MAC is only learned once it is in both tables
+        failed = [mac for mac, forward_rc, smac_rc in zip(macs, forward_rcs, smac_rcs) if forward_rc != 0 or smac_rc != 0]
+        if len(failed) > 0:
+            # remove the entries the failed MACs did get, so that the retry
+            # adds both entries again: a forward entry on its own would stop
+            # the next digest from being learned, and an smac entry on its
+            # own would make the retried smac add fail on the duplicate key
+            forward_only = [mac for mac, forward_rc, smac_rc in zip(macs, forward_rcs, smac_rcs) if forward_rc == 0 and smac_rc != 0]
+            smac_only = [mac for mac, forward_rc, smac_rc in zip(macs, forward_rcs, smac_rcs) if forward_rc != 0 and smac_rc == 0]
+            if len(forward_only) > 0:
+                table_cam_delete_entries('forward', [[mac] for mac in forward_only])
+            if len(smac_only) > 0:
+                table_cam_delete_entries('smac', [[mac] for mac in smac_only])
+            # and let the next digest of the failed MACs retry straight away
+            for mac in failed:
+                recent.pop(mac, None)
+        metrics.incr('learned', len(macs) - len(failed))
+        metrics.incr('failed', len(failed))
+
+def start_thread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
 
 def main():
-    sniff(iface=DMA_IFACE, prn=learn_digest, count=0)
+    global BATCH_SIZE, DEDUP_WINDOW
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iface', type=str, default=DMA_IFACE, help="the interface on which digest packets are received")
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help="max number of MACs added per table update")
+    parser.add_argument('--window', type=float, default=DEDUP_WINDOW, help="seconds during which a repeated MAC is ignored")
+    args = parser.parse_args()
+    BATCH_SIZE = args.batch_size
+    DEDUP_WINDOW = args.window
 
+    # serve the forward table lookups from a shadow copy rather than the hardware
+    table_cam_enable_shadow('forward')
 
-if __name__ == "__main__":
-    main()
+    queue = Queue.Queue(QUEUE_SIZE)
+    metrics = LearnMetrics()
+    start_thread(read_digests, args.iface, queue, metrics)
+    start_thread(learn_digests, queue, metrics)
+    try:
+        while True:
+            time.sleep(METRICS_INTERVAL)
+            metrics.report(queue)
+    except KeyboardInterrupt:
+        pass
 
 
+if __name__ == "__main__":
+    main()
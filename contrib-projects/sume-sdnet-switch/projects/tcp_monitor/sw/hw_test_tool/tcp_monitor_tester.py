@@ -40,6 +40,7 @@ import random, socket, struct
 import numpy as np
 
 from nf_sim_tools import *
+from nf_sim_traces import random_interleave
 
 sys.path.append(os.path.expandvars('$P4_PROJECT_DIR/sw/CLI/'))
 import p4_regs_api
@@ -94,20 +95,19 @@ class TcpMonitorTester(cmd.Cmd):
     Generate a trace of flows indicated by the given parameters and apply to the switch 
     """
     def _run_flows(self, num_flows, min_size, max_size):
-        trace = []
+        flows = []
         for fid in range(num_flows):
             size = random.randint(min_size, max_size)
             # create the flows pkts
-            flow_pkts = self._make_flow(size)
-            # randomly interleave flow's pkts into trace
-            trace = map(next, random.sample([iter(trace)]*len(trace) + [iter(flow_pkts)]*len(flow_pkts), len(trace)+len(flow_pkts)))        
+            flows.append(self._make_flow(size))
+        # randomly interleave the flows' pkts into the trace
+        trace = list(random_interleave(flows))
 
         # apply trace to the switch
         sendp(trace, iface=IFACE)
 
     def _clear_dist(self):
-        for i in range(NUM_BINS):
-            p4_regs_api.reg_write('dist', i, 0)
+        p4_regs_api.reg_write_range('dist', 0, [0]*NUM_BINS)
 
 
     def _parse_line(self, line):
@@ -38,7 +38,7 @@ tcp_monitor P4 program running on the switch
 import argparse, os, sys
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-import sched, time, copy
+import sched, time
 
 from ascii_graph import Pyasciigraph
 
@@ -58,10 +58,7 @@ fig = None
 ax = None
 
 def barlist(): 
-    data = []
-    for i in range(NUM_BINS):
-         data.append(p4_regs_api.reg_read('dist', i))
-    return data 
+    return list(p4_regs_api.reg_read_range('dist', 0, NUM_BINS))
 
 
 def animate(i):
@@ -101,9 +98,7 @@ def print_dist():
 
 def update_dist(sc):
     global dist_vals
-    new_dist = copy.deepcopy(dist_vals)
-    for i in range(NUM_BINS):
-        new_dist[i] = p4_regs_api.reg_read('dist', i)
+    new_dist = list(p4_regs_api.reg_read_range('dist', 0, NUM_BINS))
     if new_dist != dist_vals:
         dist_vals = new_dist
         print_dist()
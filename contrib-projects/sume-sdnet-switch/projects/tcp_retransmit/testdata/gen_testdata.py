@@ -31,6 +31,7 @@
 
 
 from nf_sim_tools import *
+from nf_sim_traces import random_interleave
 import random
 from collections import OrderedDict
 import sss_sdnet_tuples
@@ -175,16 +176,7 @@ def make_flow(srcIP, dstIP, sport, dport, flow_size):
 
 # randomly interleave the flow's packets
 def mix_flows(flows):
-    trace = []
-    for fid in range(len(flows)):
-        trace = map(
-            next,
-            random.sample(
-                [iter(trace)] * len(trace) + [iter(flows[fid])] * len(flows[fid]),
-                len(trace) + len(flows[fid]),
-            ),
-        )
-    return trace
+    return list(random_interleave(flows))
 
 
 #####################
@@ -45,6 +45,10 @@ int cam_add_entry(uint32_t tableID, const char* key, const char* value);
 
 int cam_delete_entry(uint32_t tableID, const char* key);
 
+int cam_add_entries(uint32_t tableID, uint32_t num_entries, const uint32_t* keys, const uint32_t* values, int* rcs);
+
+int cam_delete_entries(uint32_t tableID, uint32_t num_entries, const uint32_t* keys, int* rcs);
+
 const char* cam_error_decode(int error);
 
 #endif // LIBCAM_H 
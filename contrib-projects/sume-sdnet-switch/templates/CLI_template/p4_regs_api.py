@@ -29,24 +29,208 @@
 # @NETFPGA_LICENSE_HEADER_END@
 #
 
-from NFTest import *
-import sys, os, re, json
+import sys, os, re, json, mmap, struct, errno
 from fcntl import *
 from ctypes import *
+from array import array
 from collections import OrderedDict
 
-# Loading the SUME shared library
-print "loading libsume.."
-lib_path=os.path.join(os.environ['SUME_FOLDER'],'lib','sw','std','hwtestlib','libsume.so')
-libsume=cdll.LoadLibrary(lib_path)
-
-# argtypes for the functions called from  C
-libsume.regread.argtypes = [c_uint]
-libsume.regwrite.argtypes= [c_uint, c_uint]
-
 EXTERN_DEFINES_FILE = os.path.expandvars("$P4_PROJECT_DIR/sw/CLI/SimpleSumeSwitch_extern_defines.json")
 
+# if set, registers are accessed through a memory mapping of this file
+# (e.g. a PCIe BAR resource file, or a plain file acting as a fake device)
+# rather than through libsume
+REGS_DEVICE = os.environ.get('P4_REGS_DEVICE')
+# register address at offset 0 of REGS_DEVICE, defaults to the lowest extern address
+REGS_DEVICE_BASE = os.environ.get('P4_REGS_DEVICE_BASE')
+# if set to 1, a missing REGS_DEVICE is created as a zero filled fake device
+REGS_FAKE = os.environ.get('P4_REGS_FAKE') == '1'
+
 ERROR_CODE = -1
+# value returned by libsume for a failed access
+LIBSUME_ERROR_CODE = 0xdeadbeef
+
+"""
+Return a ctypes pointer to the contents of an array('I')
+"""
+def array_ptr(vals):
+    return cast(vals.buffer_info()[0], POINTER(c_uint32))
+
+##########################
+### Register Backends ###
+##########################
+
+class LibsumeBackend(object):
+    """
+    Register access through the libsume ioctl interface
+    """
+
+    def __init__(self):
+        # imported here rather than at the top of the module: NFTest loads
+        # libsume and needs SUME_FOLDER and NF_DESIGN_DIR, which the mmap
+        # backend does not
+        import NFTest
+
+        # Loading the SUME shared library
+        print "loading libsume.."
+        lib_path=os.path.join(os.environ['SUME_FOLDER'],'lib','sw','std','hwtestlib','libsume.so')
+        self.libsume=cdll.LoadLibrary(lib_path)
+
+        # argtypes for the functions called from  C
+        self.libsume.regread.argtypes = [c_uint32]
+        self.libsume.regwrite.argtypes= [c_uint32, c_uint32]
+        # register values are unsigned, the default c_int restype would
+        # return values >= 2**31 (e.g. 0xdeadbeef) as negative numbers
+        self.libsume.regread.restype = c_uint32
+
+        # bulk accessors, only present in newer builds of libsume
+        self.have_range_api = hasattr(self.libsume, 'regread_range') and hasattr(self.libsume, 'regwrite_range')
+        if self.have_range_api:
+            self.libsume.regread_range.argtypes = [c_uint, c_uint, c_uint, POINTER(c_uint32)]
+            self.libsume.regwrite_range.argtypes = [c_uint, c_uint, c_uint, POINTER(c_uint32)]
+            # number of failed accesses, or LIBSUME_ERROR_CODE
+            self.libsume.regread_range.restype = c_uint32
+            self.libsume.regwrite_range.restype = c_uint32
+
+    def read(self, address):
+        return self.libsume.regread(address)
+
+    def write(self, address, val):
+        return self.libsume.regwrite(address, val)
+
+    def read_range(self, address, count):
+        if not self.have_range_api:
+            vals = array('I', [self.libsume.regread(address + i) for i in range(count)])
+            if LIBSUME_ERROR_CODE in vals:
+                print >> sys.stderr, "ERROR: failed to read address {0}".format(hex(address + vals.index(LIBSUME_ERROR_CODE)))
+                return ERROR_CODE
+            return vals
+        vals = array('I', [0]) * count
+        failed = self.libsume.regread_range(address, 1, count, array_ptr(vals))
+        if failed != 0:
+            print >> sys.stderr, "ERROR: failed to read {0} registers from address {1}".format(
+                count if failed == LIBSUME_ERROR_CODE else failed, hex(address))
+            return ERROR_CODE
+        return vals
+
+    def write_range(self, address, vals):
+        if not self.have_range_api:
+            return len([i for i, val in enumerate(vals) if self.libsume.regwrite(address + i, val) != 0])
+        failed = self.libsume.regwrite_range(address, 1, len(vals), array_ptr(vals))
+        if failed == LIBSUME_ERROR_CODE:
+            # the device could not be opened, none of the writes happened
+            return len(vals)
+        return failed
+
+
+class MmapBackend(object):
+    """
+    Register access through a memory mapping of a file. Each register
+    address is one little endian 32-bit word, base_addr is the address of
+    the word at offset 0 of the file.
+    """
+
+    def __init__(self, path, base_addr):
+        self.path = path
+        self.base_addr = base_addr
+        self.fd = os.open(path, os.O_RDWR)
+        self.mm = mmap.mmap(self.fd, 0)
+        self.num_words = len(self.mm) / 4
+
+    """
+    Return the byte offset of address in the mapping or None if the
+    count words starting at address are not all mapped
+    """
+    def offset(self, address, count=1):
+        index = address - self.base_addr
+        if index < 0 or index + count > self.num_words:
+            print >> sys.stderr, "ERROR: address {0} is not mapped by {1}".format(hex(address), self.path)
+            return None
+        return index * 4
+
+    def read(self, address):
+        offset = self.offset(address)
+        if offset is None:
+            return ERROR_CODE
+        return struct.unpack_from('<I', self.mm, offset)[0]
+
+    def write(self, address, val):
+        offset = self.offset(address)
+        if offset is None:
+            return ERROR_CODE
+        struct.pack_into('<I', self.mm, offset, val & 0xffffffff)
+        return 0
+
+    def read_range(self, address, count):
+        offset = self.offset(address, count)
+        if offset is None:
+            return ERROR_CODE
+        vals = array('I')
+        vals.fromstring(self.mm[offset:offset + 4*count])
+        if sys.byteorder == 'big':
+            vals.byteswap()
+        return vals
+
+    def write_range(self, address, vals):
+        offset = self.offset(address, len(vals))
+        if offset is None:
+            return ERROR_CODE
+        vals = array('I', vals)
+        if sys.byteorder == 'big':
+            vals.byteswap()
+        self.mm[offset:offset + 4*len(vals)] = vals.tostring()
+        return 0
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+"""
+Return the range of register addresses [low, high) used by the externs
+with a control interface
+"""
+def get_extern_address_range(p4_externs):
+    ranges = [(e['base_addr'], e['base_addr'] + 2**e['control_width']) for e in p4_externs.values()
+              if 'control_width' in e.keys() and e['control_width'] > 0]
+    if len(ranges) == 0:
+        return 0, 0
+    return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+"""
+Create a zero filled file that can be used as a fake register device by
+the MmapBackend, large enough to hold all of the P4 extern registers
+when the word at offset 0 is the register at base_addr.
+"""
+def create_fake_device(path, base_addr):
+    high = get_extern_address_range(P4_EXTERNS)[1]
+    with open(path, 'wb') as f:
+        f.truncate(4 * max(high - base_addr, 1))
+
+"""
+Open the register backend selected by the P4_REGS_DEVICE environment
+variable. A missing device is only created when P4_REGS_FAKE=1, so that a
+mistyped device path is an error rather than a device reading all zeros.
+"""
+def open_backend():
+    if REGS_DEVICE is None:
+        return LibsumeBackend()
+    if REGS_DEVICE_BASE is not None:
+        base_addr = int(REGS_DEVICE_BASE, 0)
+    else:
+        base_addr = get_extern_address_range(P4_EXTERNS)[0]
+    if not os.path.exists(REGS_DEVICE):
+        if not REGS_FAKE:
+            raise IOError(errno.ENOENT, "register device does not exist (set P4_REGS_FAKE=1 to create a fake device)", REGS_DEVICE)
+        create_fake_device(REGS_DEVICE, base_addr)
+    return MmapBackend(REGS_DEVICE, base_addr)
+
+"""
+Use backend for all further register accesses
+"""
+def set_backend(backend):
+    global BACKEND
+    BACKEND = backend
 
 """
 Read the SimpleSumeSwitch_reg_defines.txt file 
@@ -67,9 +251,22 @@ def get_address(reg_name, index):
         return ERROR_CODE
     return P4_EXTERNS[reg_name]['base_addr'] + index
 
+"""
+Same as get_address() but checks the whole range [start, start+count)
+"""
+def get_address_range(reg_name, start, count):
+    if count <= 0:
+        print >> sys.stderr, "ERROR: cannot access {0}, count must be positive".format(reg_name)
+        return ERROR_CODE
+    if get_address(reg_name, start + count - 1) == ERROR_CODE:
+        return ERROR_CODE
+    return get_address(reg_name, start)
+
 # P4_EXTERNS is indexed by prefix_name
 P4_EXTERNS = read_extern_defines()
 
+BACKEND = open_backend()
+
 #####################
 ### API Functions ###
 #####################
@@ -79,12 +276,31 @@ def reg_read(reg_name, index):
     if address == ERROR_CODE:
         return ERROR_CODE
 #    print "reading address : {0}".format(hex(address)) 
-    return libsume.regread(address)
+    return BACKEND.read(address)
 
 def reg_write(reg_name, index, val):
     address = get_address(reg_name, index)
     if address == ERROR_CODE:
         return ERROR_CODE
 #    print "writing address : {0}".format(hex(address)) 
-    return libsume.regwrite(address, val)
+    return BACKEND.write(address, val)
 
+"""
+Read indices [start, start+count) of the register, returns an array('I')
+"""
+def reg_read_range(reg_name, start, count):
+    address = get_address_range(reg_name, start, count)
+    if address == ERROR_CODE:
+        return ERROR_CODE
+    return BACKEND.read_range(address, count)
+
+"""
+Write values to indices [start, start+len(values)) of the register.
+Returns the number of failed writes.
+"""
+def reg_write_range(reg_name, start, values):
+    vals = array('I', values)
+    address = get_address_range(reg_name, start, len(vals))
+    if address == ERROR_CODE:
+        return ERROR_CODE
+    return BACKEND.write_range(address, vals)
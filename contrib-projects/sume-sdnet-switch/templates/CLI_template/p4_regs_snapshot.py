@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2017 Stephen Ibanez
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+
+
+"""
+Periodically snapshot all of the P4 extern registers that have a control
+interface and stream the cells that changed since the previous snapshot
+to a consumer (callback, file or local socket)
+"""
+
+import sys, os, time, json, socket, argparse
+from array import array
+from collections import OrderedDict
+import p4_regs_api
+
+# just the externs with a control interface
+P4_REGS = OrderedDict()
+for extern_name, extern_dict in p4_regs_api.P4_EXTERNS.items():
+    if 'control_width' in extern_dict.keys() and extern_dict['control_width'] > 0:
+        P4_REGS[extern_name] = extern_dict
+
+class RegSnapshot(object):
+    """
+    All of the registers stored back to back in a single array('I').
+    layout maps each register name to its (offset, depth) in the array.
+    """
+
+    def __init__(self, regs=P4_REGS):
+        self.layout = OrderedDict()
+        offset = 0
+        for reg_name, reg_dict in regs.items():
+            depth = 2**reg_dict['control_width']
+            self.layout[reg_name] = (offset, depth)
+            offset += depth
+        self.data = array('I', [0]) * offset
+        self.timestamp = None
+
+    """
+    Read every register from the switch into the snapshot. Returns False
+    if any register could not be read, in which case the snapshot is
+    incomplete.
+    """
+    def capture(self):
+        self.timestamp = time.time()
+        ok = True
+        for reg_name, (offset, depth) in self.layout.items():
+            vals = p4_regs_api.reg_read_range(reg_name, 0, depth)
+            if vals == p4_regs_api.ERROR_CODE:
+                print >> sys.stderr, "ERROR: failed to read {0}".format(reg_name)
+                ok = False
+                continue
+            self.data[offset:offset+depth] = vals
+        return ok
+
+    """
+    Return the values of reg_name in the snapshot
+    """
+    def get(self, reg_name):
+        offset, depth = self.layout[reg_name]
+        return self.data[offset:offset+depth]
+
+    """
+    Return {reg_name : [(index, value), ...]} for every cell that differs
+    from the prev snapshot (which must use the same layout). If prev is
+    None all cells are returned.
+    """
+    def delta(self, prev=None):
+        changes = OrderedDict()
+        for reg_name, (offset, depth) in self.layout.items():
+            cur_vals = self.data[offset:offset+depth]
+            if prev is None:
+                changes[reg_name] = list(enumerate(cur_vals))
+                continue
+            prev_vals = prev.data[offset:offset+depth]
+            if cur_vals == prev_vals:
+                continue
+            changes[reg_name] = [(i, v) for i, (v, p) in enumerate(zip(cur_vals, prev_vals)) if v != p]
+        return changes
+
+    def copy(self):
+        snap = RegSnapshot.__new__(RegSnapshot)
+        snap.layout = self.layout
+        snap.data = array('I', self.data)
+        snap.timestamp = self.timestamp
+        return snap
+
+
+#################
+### Consumers ###
+#################
+
+"""
+Serialize the changes of one snapshot as a single line of JSON
+"""
+def format_changes(timestamp, changes):
+    return json.dumps({'time':timestamp, 'changes':changes}) + '\n'
+
+class FileConsumer(object):
+    """
+    Append the changes of each snapshot to a file, one JSON object per line
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, 'a')
+
+    def __call__(self, timestamp, changes):
+        self.f.write(format_changes(timestamp, changes))
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+class SocketConsumer(object):
+    """
+    Send the changes of each snapshot to a local (unix domain) stream
+    socket, one JSON object per line
+    """
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+    def __call__(self, timestamp, changes):
+        self.sock.sendall(format_changes(timestamp, changes))
+
+    def close(self):
+        self.sock.close()
+
+
+"""
+Take a snapshot every interval seconds and pass the changed cells to
+consumer(timestamp, changes). The first snapshot reports every cell.
+Snapshots without any change are not reported, nor are snapshots in which
+a register could not be read; the next delta is then taken against the
+last complete snapshot. Stops after count snapshots if count is not None.
+"""
+def stream_snapshots(consumer, interval=1.0, count=None, regs=P4_REGS):
+    cur = RegSnapshot(regs)
+    prev = None
+    n = 0
+    while count is None or n < count:
+        start = time.time()
+        if cur.capture():
+            changes = cur.delta(prev)
+            if len(changes) > 0:
+                consumer(cur.timestamp, changes)
+            if prev is None:
+                prev = cur.copy()
+            else:
+                # swap the buffers rather than allocating a new snapshot
+                prev, cur = cur, prev
+        n += 1
+        if count is None or n < count:
+            time.sleep(max(0, interval - (time.time() - start)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between snapshots")
+    parser.add_argument('--count', type=int, default=None, help="number of snapshots to take (default: run forever)")
+    parser.add_argument('--file', type=str, default=None, help="append the changes to this file")
+    parser.add_argument('--socket', type=str, default=None, help="send the changes to this unix domain socket")
+    args = parser.parse_args()
+
+    if args.socket is not None:
+        consumer = SocketConsumer(args.socket)
+    elif args.file is not None:
+        consumer = FileConsumer(args.file)
+    else:
+        consumer = lambda timestamp, changes: sys.stdout.write(format_changes(timestamp, changes))
+
+    try:
+        stream_snapshots(consumer, args.interval, args.count)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if hasattr(consumer, 'close'):
+            consumer.close()
+
+if __name__ == "__main__":
+    main()
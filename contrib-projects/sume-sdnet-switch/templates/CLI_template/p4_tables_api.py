@@ -63,6 +63,8 @@ if (len(PX_CAM_TABLES) > 0):
     libcam.cam_read_entry.argtypes = [c_uint, c_char_p, c_char_p, c_char_p]
     libcam.cam_add_entry.argtypes = [c_uint, c_char_p, c_char_p]
     libcam.cam_delete_entry.argtypes = [c_uint, c_char_p]
+    libcam.cam_add_entries.argtypes = [c_uint, c_uint, POINTER(c_uint32), POINTER(c_uint32), POINTER(c_int)]
+    libcam.cam_delete_entries.argtypes = [c_uint, c_uint, POINTER(c_uint32), POINTER(c_int)]
     libcam.cam_error_decode.argtypes = [c_int]
     libcam.cam_error_decode.restype = c_char_p
     libcam.cam_get_size.argtypes = [c_uint]
@@ -98,6 +100,14 @@ if (len(PX_LPM_TABLES) > 0):
 
 TABLE_DEFINES_FILE = os.path.expandvars("$P4_PROJECT_DIR/sw/CLI/SimpleSumeSwitch_table_defines.json")
 
+# directory holding the *.tbl files with the initial table entries
+TBL_DIR = os.path.expandvars("$P4_PROJECT_DIR/src/")
+
+# write-through shadow copies of CAM tables, format ==> {table_name : {key : value}}
+SHADOW_CAM_TABLES = {}
+# names of the shadowed tables whose reads are also checked against the hardware
+SHADOW_CHECK_TABLES = set()
+
 ########################
 ### Helper Functions ###
 ########################
@@ -140,22 +150,66 @@ def check_valid_lpm_table_name(table_name):
         return False
     return True
 
+"""
+Pack a list of integers into a ctypes array of 32-bit words, least
+significant word first, using width bits per integer
+"""
+def pack_words(vals, width):
+    num_words = (width + 31) / 32
+    words = []
+    for val in vals:
+        for i in range(num_words):
+            words.append(val & 0xffffffff)
+            val >>= 32
+    return (c_uint32 * len(words))(*words)
+
 #########################
 ### CAM API Functions ###
 #########################
 
-def table_cam_read_entry(table_name, keys):
-    if not check_valid_cam_table_name(table_name):
-        return "NA", "NA"
-
+"""
+Read the entry with the packed key from the hardware
+"""
+def cam_hw_read_entry(table_name, key):
     tableID = int(p4_tables_info['EM'][table_name]['tableID']) 
-    key = PX_CAM_TABLES[table_name].hexify_key(keys) 
     hex_key_buf = create_string_buffer("{:X}".format(key))
     value = create_string_buffer(1024) # TODO: Fix this ... Must be large enough to hold entire value 
     found = create_string_buffer(10)  # Should only need to hold "True" or "False"  
     rc = libcam.cam_read_entry(tableID, hex_key_buf, value, found)
+    return rc, found.value, value.value
+
+"""
+Format a shadow table value the same way as libcam.cam_read_entry()
+"""
+def cam_format_value(table_name, value):
+    num_val_regs = (int(p4_tables_info['EM'][table_name]['value_width']) + 31) / 32
+    return "{:0{}x}".format(value, num_val_regs*8)
+
+"""
+Read entry from the shadow copy of the table, checking it against the
+hardware if the table is in SHADOW_CHECK_TABLES
+"""
+def cam_shadow_read_entry(table_name, key):
+    shadow = SHADOW_CAM_TABLES[table_name]
+    found = 'True' if key in shadow else 'False'
+    value = cam_format_value(table_name, shadow.get(key, 0))
+    if table_name in SHADOW_CHECK_TABLES:
+        rc, hw_found, hw_value = cam_hw_read_entry(table_name, key)
+        if (hw_found != found or (found == 'True' and int(hw_value, 16) != shadow[key])):
+            print >> sys.stderr, "WARNING: shadow of table {} is out of sync for key {:X}: shadow = ({}, {}), hardware = ({}, {})".format(table_name, key, found, value, hw_found, hw_value)
+            return hw_found, hw_value
+    return found, value
+
+def table_cam_read_entry(table_name, keys):
+    if not check_valid_cam_table_name(table_name):
+        return "NA", "NA"
+
+    key = PX_CAM_TABLES[table_name].hexify_key(keys) 
+    if table_name in SHADOW_CAM_TABLES:
+        return cam_shadow_read_entry(table_name, key)
+    rc, found, value = cam_hw_read_entry(table_name, key)
     print libcam.cam_error_decode(rc)
-    return found.value, value.value
+    return found, value
 
 def table_cam_add_entry(table_name, keys, action_name, action_data):
     if not check_valid_cam_table_name(table_name):
@@ -166,6 +220,8 @@ def table_cam_add_entry(table_name, keys, action_name, action_data):
     value = PX_CAM_TABLES[table_name].hexify_value(action_name, action_data)
     rc = libcam.cam_add_entry(tableID, "{:X}".format(key), "{:X}".format(value))
     print libcam.cam_error_decode(rc)
+    if rc == 0 and table_name in SHADOW_CAM_TABLES:
+        SHADOW_CAM_TABLES[table_name][key] = value
 
 def table_cam_delete_entry(table_name, keys):
     if not check_valid_cam_table_name(table_name):
@@ -175,7 +231,103 @@ def table_cam_delete_entry(table_name, keys):
     key = PX_CAM_TABLES[table_name].hexify_key(keys)
     rc = libcam.cam_delete_entry(tableID, "{:X}".format(key))
     print libcam.cam_error_decode(rc)
+    if rc == 0 and table_name in SHADOW_CAM_TABLES:
+        SHADOW_CAM_TABLES[table_name].pop(key, None)
  
+"""
+Add a batch of entries to a CAM table with a single libcam call
+entries is a list of (keys, action_name, action_data)
+Returns the list of return codes of each entry
+"""
+def table_cam_add_entries(table_name, entries):
+    if not check_valid_cam_table_name(table_name):
+        return []
+
+    table_info = p4_tables_info['EM'][table_name]
+    tableID = int(table_info['tableID'])
+    keys = PX_CAM_TABLES[table_name].hexify_keys([e[0] for e in entries])
+    values = PX_CAM_TABLES[table_name].hexify_values([(e[1], e[2]) for e in entries])
+    key_buf = pack_words(keys, int(table_info['key_width']))
+    value_buf = pack_words(values, int(table_info['value_width']))
+    rcs = (c_int * len(entries))()
+    rc = libcam.cam_add_entries(tableID, len(entries), key_buf, value_buf, rcs)
+    print libcam.cam_error_decode(rc)
+    if table_name in SHADOW_CAM_TABLES:
+        shadow = SHADOW_CAM_TABLES[table_name]
+        for key, value, entry_rc in zip(keys, values, rcs):
+            if entry_rc == 0:
+                shadow[key] = value
+    return list(rcs)
+
+"""
+Delete a batch of entries from a CAM table with a single libcam call
+key_lists is a list of keys
+Returns the list of return codes of each entry
+"""
+def table_cam_delete_entries(table_name, key_lists):
+    if not check_valid_cam_table_name(table_name):
+        return []
+
+    table_info = p4_tables_info['EM'][table_name]
+    tableID = int(table_info['tableID'])
+    keys = PX_CAM_TABLES[table_name].hexify_keys(key_lists)
+    key_buf = pack_words(keys, int(table_info['key_width']))
+    rcs = (c_int * len(key_lists))()
+    rc = libcam.cam_delete_entries(tableID, len(key_lists), key_buf, rcs)
+    print libcam.cam_error_decode(rc)
+    if table_name in SHADOW_CAM_TABLES:
+        shadow = SHADOW_CAM_TABLES[table_name]
+        for key, entry_rc in zip(keys, rcs):
+            if entry_rc == 0:
+                shadow.pop(key, None)
+    return list(rcs)
+
+"""
+Keep a write-through shadow copy of a CAM table in memory so that
+table_cam_read_entry() does not need to access the hardware. If check is
+True every shadow read is also compared against the hardware.
+"""
+def table_cam_enable_shadow(table_name, check=False):
+    if not check_valid_cam_table_name(table_name):
+        return
+
+    SHADOW_CAM_TABLES[table_name] = {}
+    if check:
+        SHADOW_CHECK_TABLES.add(table_name)
+    else:
+        SHADOW_CHECK_TABLES.discard(table_name)
+    resync_table(table_name)
+
+def table_cam_disable_shadow(table_name):
+    SHADOW_CAM_TABLES.pop(table_name, None)
+    SHADOW_CHECK_TABLES.discard(table_name)
+
+"""
+Reload the shadow copy of a CAM table from the hardware. The CAM API can
+only look up individual keys, so the keys that are re-read are the ones
+already in the shadow plus the initial entries in the table's *.tbl file.
+"""
+def resync_table(table_name):
+    if table_name not in SHADOW_CAM_TABLES:
+        print >> sys.stderr, "ERROR: {0} does not have a shadow table".format(table_name)
+        return
+
+    keys = set(SHADOW_CAM_TABLES[table_name].keys())
+    tbl_file = os.path.join(TBL_DIR, table_name + '.tbl')
+    if os.path.isfile(tbl_file):
+        with open(tbl_file) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2:
+                    keys.add(int(fields[0], 16))
+
+    shadow = {}
+    for key in keys:
+        rc, found, value = cam_hw_read_entry(table_name, key)
+        if found == 'True':
+            shadow[key] = int(value, 16)
+    SHADOW_CAM_TABLES[table_name] = shadow
+
 def table_cam_get_size(table_name):
     if not check_valid_cam_table_name(table_name):
         return 0
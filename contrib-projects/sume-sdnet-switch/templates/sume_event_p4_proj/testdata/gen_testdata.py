@@ -31,71 +31,8 @@
 
 
 from nf_sim_tools import *
+from nf_sim_testdata import *
 import random
-from collections import OrderedDict
-import sss_sdnet_tuples
-
-###########
-# pkt generation tools
-###########
-
-pktsApplied = []
-pktsExpected = []
-
-# Pkt lists for SUME simulations
-nf_applied = OrderedDict()
-nf_applied[0] = []
-nf_applied[1] = []
-nf_applied[2] = []
-nf_applied[3] = []
-nf_expected = OrderedDict()
-nf_expected[0] = []
-nf_expected[1] = []
-nf_expected[2] = []
-nf_expected[3] = []
-
-nf_port_map = {"nf0":0b00000001, "nf1":0b00000100, "nf2":0b00010000, "nf3":0b01000000, "dma0":0b00000010}
-nf_id_map = {"nf0":0, "nf1":1, "nf2":2, "nf3":3}
-
-sss_sdnet_tuples.clear_tuple_files()
-
-def applyPkt(pkt, ingress, time):
-    pktsApplied.append(pkt)
-    sss_sdnet_tuples.sume_tuple_in['pkt_trigger'] = 1 
-    sss_sdnet_tuples.sume_tuple_in['pkt_len'] = len(pkt) 
-    sss_sdnet_tuples.sume_tuple_in['src_port'] = nf_port_map[ingress]
-    sss_sdnet_tuples.sume_tuple_expect['pkt_trigger'] = 1 
-    sss_sdnet_tuples.sume_tuple_expect['pkt_len'] = len(pkt) 
-    sss_sdnet_tuples.sume_tuple_expect['src_port'] = nf_port_map[ingress] 
-    pkt.time = time
-    nf_applied[nf_id_map[ingress]].append(pkt)
-
-def expPkt(pkt, egress):
-    pktsExpected.append(pkt)
-    sss_sdnet_tuples.sume_tuple_expect['dst_port'] = nf_port_map[egress]
-    sss_sdnet_tuples.write_tuples()
-    if egress in ["nf0","nf1","nf2","nf3"]:
-        nf_expected[nf_id_map[egress]].append(pkt)
-    elif egress == 'bcast':
-        nf_expected[0].append(pkt)
-        nf_expected[1].append(pkt)
-        nf_expected[2].append(pkt)
-        nf_expected[3].append(pkt)
-
-def write_pcap_files():
-    wrpcap("src.pcap", pktsApplied)
-    wrpcap("dst.pcap", pktsExpected)
-
-    for i in nf_applied.keys():
-        if (len(nf_applied[i]) > 0):
-            wrpcap('nf{0}_applied.pcap'.format(i), nf_applied[i])
-
-    for i in nf_expected.keys():
-        if (len(nf_expected[i]) > 0):
-            wrpcap('nf{0}_expected.pcap'.format(i), nf_expected[i])
-
-    for i in nf_applied.keys():
-        print "nf{0}_applied times: ".format(i), [p.time for p in nf_applied[i]]
 
 #####################
 # generate testdata #
@@ -106,13 +43,16 @@ MAC2 = "08:00:00:00:00:02"
 IP1 = "10.0.0.1"
 IP2 = "10.0.0.2"
 
-pktCnt = 0
-
-pkt = Ether(dst=MAC2, src=MAC1) / IP(dst=IP2, src=IP1)
-pkt = pad_pkt(pkt, 64)
-applyPkt(pkt, 'nf0', pktCnt)
-pktCnt += 1
-expPkt(pkt, 'nf1')
+"""
+Each scenario is a generator function that yields the packets to apply
+(Apply(pkt, ingress, time)) and to expect (Expect(pkt, egress))
+"""
+def basic_forwarding():
+    pkt = Ether(dst=MAC2, src=MAC1) / IP(dst=IP2, src=IP1)
+    pkt = pad_pkt(pkt, 64)
+    yield Apply(pkt, 'nf0', 0, pkt_trigger=1)
+    yield Expect(pkt, 'nf1', pkt_trigger=1)
 
-write_pcap_files()
+scenarios = [basic_forwarding]
 
+run_scenarios(scenarios)
@@ -73,12 +73,24 @@
 
 #define	_SUME_REG_ERROR_CODE	0xdeadbeef
 
-int
-sume_do_register(struct sume_ifreq *sifr, unsigned long request, char *ifnam)
+static int
+sume_open_socket(void)
+{
+	int fd;
+
+	fd = socket(AF_INET6, SOCK_DGRAM, 0);
+	if (fd == -1)
+		fd = socket(AF_INET, SOCK_DGRAM, 0);
+	return (fd);
+}
+
+static int
+sume_do_register_fd(int fd, struct sume_ifreq *sifr, unsigned long request,
+    char *ifnam)
 {
 	struct ifreq ifr;
 	size_t ifnamlen;
-	int fd, rc;
+	int rc;
 
 	memset(&ifr, 0, sizeof(ifr));
 	ifnamlen = strlen(ifnam);
@@ -88,17 +100,24 @@ sume_do_register(struct sume_ifreq *sifr, unsigned long request, char *ifnam)
 	ifr.ifr_name[ifnamlen] = '\0';
 	ifr.ifr_data = (char *)sifr;
 
-	fd = socket(AF_INET6, SOCK_DGRAM, 0);
-	if (fd == -1) {
-		fd = socket(AF_INET, SOCK_DGRAM, 0);
-		if (fd == -1)
-			return (ENOPROTOOPT);
-	}
-
 	rc = ioctl(fd, request, &ifr);
 	if (rc == -1)
 		rc = ENOTTY;
-        close(fd);
+
+	return (rc);
+}
+
+int
+sume_do_register(struct sume_ifreq *sifr, unsigned long request, char *ifnam)
+{
+	int fd, rc;
+
+	fd = sume_open_socket();
+	if (fd == -1)
+		return (ENOPROTOOPT);
+
+	rc = sume_do_register_fd(fd, sifr, request, ifnam);
+	close(fd);
 
 	return (rc);
 }
@@ -157,4 +176,63 @@ regwrite(uint32_t addr, uint32_t val)
 	return (0);
 }
 
+/*
+ * Bulk accessors: read/write count registers starting at addr, stepping the
+ * address by stride, reusing a single socket for all of the ioctls.
+ * Registers that fail to read are set to the error value; the return value
+ * is the number of failed accesses (or ERROR_CODE if no socket could be
+ * opened).
+ */
+int
+regread_range(uint32_t addr, uint32_t stride, uint32_t count, uint32_t *vals)
+{
+	struct sume_ifreq sifr;
+	uint32_t i;
+	int fd, failed;
+
+	fd = sume_open_socket();
+	if (fd == -1)
+		return (_SUME_REG_ERROR_CODE);
+
+	failed = 0;
+	for (i = 0; i < count; i++) {
+		sifr.addr = addr + i * stride;
+		sifr.val = 0;
+		if (sume_do_register_fd(fd, &sifr, SUME_IOCTL_CMD_READ_REG,
+		    SUME_IFNAM_DEFAULT) != 0) {
+			vals[i] = _SUME_REG_ERROR_CODE;
+			failed++;
+		} else
+			vals[i] = sifr.val;
+	}
+	close(fd);
+
+	return (failed);
+}
+
+int
+regwrite_range(uint32_t addr, uint32_t stride, uint32_t count,
+    const uint32_t *vals)
+{
+	struct sume_ifreq sifr;
+	uint32_t i;
+	int fd, failed;
+
+	fd = sume_open_socket();
+	if (fd == -1)
+		return (_SUME_REG_ERROR_CODE);
+
+	failed = 0;
+	for (i = 0; i < count; i++) {
+		sifr.addr = addr + i * stride;
+		sifr.val = vals[i];
+		if (sume_do_register_fd(fd, &sifr, SUME_IOCTL_CMD_WRITE_REG,
+		    SUME_IFNAM_DEFAULT) != 0)
+			failed++;
+	}
+	close(fd);
+
+	return (failed);
+}
+
 /* end */
@@ -250,6 +250,10 @@ def nftest_start():
 #####################################################################\n')
     logfile.close()
     if not sim:
+        if '--tpacket' in sys.argv:
+            hwPktLib.capture_backend = 'tpacket'
+        if '--filter' in sys.argv:
+            hwPktLib.capture_filter = sys.argv[sys.argv.index('--filter')+1]
         hwPktLib.start()
     nftest_barrier()
 
@@ -294,6 +298,32 @@ def nftest_send_dma(ifaceName, pkt):
     else:
         hwPktLib.send(iface_map[ifaceName], pkt)
 
+############################
+# Function: nftest_set_rate_phy
+# Arguments: interface name
+#            (optional) rate in Gbps
+#            (optional) rate in packets per second
+# Description: (hw) paces the packets sent to the phy, sends as fast as
+#              possible if neither rate is given
+#              (sim) packet timing is not modelled, does nothing
+############################
+def nftest_set_rate_phy(ifaceName, gbps = None, pps = None):
+    if not sim:
+        hwPktLib.set_rate(iface_map[connections[ifaceName]], gbps, pps)
+
+############################
+# Function: nftest_send_stats_phy
+# Arguments: interface name
+# Description: (hw) returns the number of packets and bytes sent to the phy,
+#              the achieved rate in pps and Gbps, and the (time, number of
+#              packets) of the recent batches sent as 'send_times'
+#              (sim) returns None
+############################
+def nftest_send_stats_phy(ifaceName):
+    if sim:
+        return None
+    return hwPktLib.send_stats(iface_map[connections[ifaceName]])
+
 ############################
 # Function: nftest_expect_phy
 # Arguments: interface name
@@ -32,13 +32,17 @@
 #
 
 import sys
-from threading import Thread, Lock, Event
+from threading import Thread, Event, Condition
 import time
 import socket
 import os
-from collections import deque
+from collections import deque, OrderedDict
 from select import select
 
+# Add path *relative to this module's location* of the pktmask module
+sys.path.append( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', '..' ) )
+import pktmask
+
 try:
     import scapy.all as scapy
 except:
@@ -47,43 +51,281 @@ except:
     except:
         sys.exit("Error: need to install scapy for packet handling")
 from scapy_sniff_patch import sniff
+import tpacket_capture
+
+# expected packets shorter than this may be received with Ethernet padding
+MIN_PKT_LEN = 60
+# number of batch send times each pktSend keeps for stats()
+SEND_TIMES_LEN = 65536
+
+############################
+# Function: decodePkt
+# Arguments: received packet, a scapy packet or a raw string
+# Description: returns the packet as a scapy packet
+############################
+def decodePkt(pkt):
+    if not isinstance(pkt, str):
+        return pkt
+    decoded = scapy.Ether(pkt)
+    if hasattr(pkt, 'time'):
+        decoded.time = pkt.time
+    return decoded
+
+############################
+# Function: paddingOf
+# Arguments: received packet, a scapy packet or a raw string
+# Description: returns the Ethernet padding of the packet, decoding raw
+#              strings with scapy
+############################
+def paddingOf(pkt):
+    pkt = decodePkt(pkt)
+    if pkt.haslayer(scapy.Padding):
+        return str(pkt[scapy.Padding])
+    return ''
+
+class pktMatcher(object):
+    ############################
+    # Function: __init__
+    # Arguments: calling object
+    # Description: initializes vars
+    #              expected packets are indexed by their (masked) string,
+    #              one index per distinct mask, and unmatched received
+    #              packets by their string, so that each packet is matched
+    #              with dict lookups as it is added
+    ############################
+    def __init__(self):
+        self.pkts = OrderedDict()
+        self.exp_pkts = OrderedDict()
+        self.matched = []
+        self.reset()
+
+    ############################
+    # Function: reset
+    # Arguments: calling object
+    # Description: clears all packet lists and indexes
+    ############################
+    def reset(self):
+        self.pkts.clear()
+        self.exp_pkts.clear()
+        del self.matched[:]
+        self.seq = 0
+        # mask string (None for exact) -> (PacketMask, {masked string: deque of seq})
+        self.exp_index = {}
+        # the same for expected packets shorter than MIN_PKT_LEN, which
+        # also match a received packet with its padding removed
+        self.short_index = {}
+        # received string -> deque of seq, and seq -> received string
+        self.pkt_index = {}
+        self.pkt_strs = {}
+
+    ############################
+    # Function: addPkt
+    # Arguments: calling object
+    #            received packet, a scapy packet or a raw string
+    # Description: matches the packet with the oldest outstanding expected
+    #              packet it is equal to, or keeps it as unmatched
+    ############################
+    def addPkt(self, pkt):
+        strpkt = pkt if isinstance(pkt, str) else str(pkt)
+        # (seq, index, key) of the oldest matching expected packet
+        best = None
+        for mask, index in self.exp_index.itervalues():
+            key = strpkt if mask is None else mask.apply(strpkt)
+            best = self.oldest(index, key, self.exp_pkts, best)
+        if self.short_index:
+            pad = paddingOf(pkt)
+            if pad and strpkt.endswith(pad):
+                base_len = len(strpkt) - len(pad)
+                for mask, index in self.short_index.itervalues():
+                    key = strpkt if mask is None else mask.apply(strpkt)
+                    best = self.oldest(index, key[:base_len], self.exp_pkts, best)
+        if best is not None:
+            seq, index, key = best
+            self.popIndex(index, key)
+            del self.exp_pkts[seq]
+            self.matched.append(pkt)
+            return True
+        seq = self.nextSeq()
+        self.pkts[seq] = pkt
+        self.pkt_strs[seq] = strpkt
+        self.pkt_index.setdefault(strpkt, deque()).append(seq)
+        return False
+
+    ############################
+    # Function: expectPkt
+    # Arguments: calling object
+    #            packet to expect
+    #            optional mask to apply to packet
+    # Description: matches the expected packet with the oldest unmatched
+    #              received packet it is equal to, or keeps it as outstanding
+    ############################
+    def expectPkt(self, pkt, mask = None):
+        strexp = str(pkt)
+        strmask = str(mask) if mask else None
+        short = len(strexp) < MIN_PKT_LEN
+        match = None
+        if strmask is None and not short:
+            best = self.oldest(self.pkt_index, strexp, self.pkts, None)
+            if best is not None:
+                match = best[0]
+                self.popIndex(self.pkt_index, strexp)
+        else:
+            # masked and short expected packets are checked against each
+            # unmatched received packet
+            expmask = pktmask.get_mask(strmask)
+            key = strexp if expmask is None else expmask.apply(strexp)
+            for seq, strpkt in self.pkt_strs.iteritems():
+                if self.matchesPkt(key, expmask, strpkt, self.pkts[seq], short):
+                    if match is None or seq < match:
+                        match = seq
+        if match is not None:
+            self.matched.append(self.pkts.pop(match))
+            del self.pkt_strs[match]
+            return True
+        seq = self.nextSeq()
+        self.exp_pkts[seq] = (pkt, mask)
+        self.addIndex(self.exp_index, strmask, strexp, seq)
+        if short:
+            self.addIndex(self.short_index, strmask, strexp, seq)
+        return False
+
+    ############################
+    # Function: matchesPkt
+    # Arguments: calling object
+    #            masked expected string
+    #            PacketMask or None
+    #            received string
+    #            received packet
+    #            whether the expected packet is shorter than MIN_PKT_LEN
+    # Description: compares an expected packet with a received packet,
+    #              ignoring the padding of the received packet if the
+    #              expected packet is short
+    ############################
+    def matchesPkt(self, key, expmask, strpkt, pkt, short):
+        masked = strpkt if expmask is None else expmask.apply(strpkt)
+        if masked == key:
+            return True
+        if short:
+            pad = paddingOf(pkt)
+            if pad and strpkt.endswith(pad):
+                return masked[:len(strpkt) - len(pad)] == key
+        return False
+
+    ############################
+    # Function: addIndex
+    # Arguments: calling object
+    #            index to add to
+    #            mask string or None
+    #            expected string
+    #            sequence number
+    # Description: adds an expected packet to the index of its mask
+    ############################
+    def addIndex(self, indexes, strmask, strexp, seq):
+        entry = indexes.get(strmask)
+        if entry is None:
+            entry = (pktmask.get_mask(strmask), {})
+            indexes[strmask] = entry
+        mask, index = entry
+        key = strexp if mask is None else mask.apply(strexp)
+        index.setdefault(key, deque()).append(seq)
+
+    ############################
+    # Function: oldest
+    # Arguments: calling object
+    #            index
+    #            key to look up
+    #            dict of outstanding packets by sequence number
+    #            best (seq, index, key) so far, or None
+    # Description: returns (seq, index, key) for the lowest outstanding
+    #              sequence number under key, or best if it is lower.
+    #              Entries that were matched through another index are
+    #              dropped as they are found.
+    ############################
+    def oldest(self, index, key, outstanding, best):
+        seqs = index.get(key)
+        if seqs is None:
+            return best
+        while seqs and seqs[0] not in outstanding:
+            seqs.popleft()
+        if not seqs:
+            del index[key]
+            return best
+        if best is None or seqs[0] < best[0]:
+            return (seqs[0], index, key)
+        return best
+
+    ############################
+    # Function: popIndex
+    # Arguments: calling object
+    #            index
+    #            key
+    # Description: removes the oldest entry under key
+    ############################
+    def popIndex(self, index, key):
+        seqs = index[key]
+        seqs.popleft()
+        if not seqs:
+            del index[key]
+
+    ############################
+    # Function: nextSeq
+    # Arguments: calling object
+    # Description: returns the next sequence number, shared by received
+    #              and expected packets
+    ############################
+    def nextSeq(self):
+        self.seq += 1
+        return self.seq
 
 class pktExpect(Thread):
     ############################
     # Function: __init__
     # Arguments: calling object
     #            device name to sniff
+    #            (optional) condition shared with other capture threads,
+    #            notified whenever a packet is received or expected
+    #            (optional) capture backend, 'scapy' or 'tpacket'
+    #            (optional) BPF filter for the tpacket backend
     # Description: overrides Thread.__init__, initializes vars
     ############################
-    def __init__ (self, device):
+    def __init__ (self, device, cond = None, backend = 'scapy', bpf = None):
         Thread.__init__(self)
         self.daemon = True
         self.device = device
+        self.backend = backend
+        self.bpf = bpf
         self.done = False
         self.ready = False
         self.count = 0
-        self.pkts = []
-        self.exp_pkts = []
-        self.matched =[]
-        self.lock = Lock()
+        self.matcher = pktMatcher()
+        # unmatched received packets and outstanding expected packets,
+        # ordered by arrival
+        self.pkts = self.matcher.pkts
+        self.exp_pkts = self.matcher.exp_pkts
+        self.matched = self.matcher.matched
+        # the condition's lock protects the packet lists
+        self.lock = cond if cond is not None else Condition()
+        self.lastPktTime = 0
         self.status = -1
-        self.compareEvent = Event()
-        self.compare = pktCompare(self)
         self.barrierEvent = Event()
         self.started = False
 
     ############################
     # Function: run
     # Arguments: calling object
-    # Description: starts background comparison thread, runs sniff
+    # Description: runs sniff, or captures raw packets from a TPACKET_V3
+    #              ring with the tpacket backend
     ############################
     def run(self):
-        self.compare.start()
         self.started = True
         while not self.done:
             try:
-                sniff(prn=self.addPkt,iface=self.device, store=0,
-                      stopperTimeout=1, stopper=self.isDone)
+                if self.backend == 'tpacket':
+                    tpacket_capture.capture(self.device, self.addPkts, self.isDone,
+                                            self.bpf)
+                else:
+                    sniff(prn=self.addPkt,iface=self.device, store=0,
+                          stopperTimeout=1, stopper=self.isDone)
             except(KeyboardInterrupt):
                 self.finish()
 
@@ -99,19 +341,33 @@ class pktExpect(Thread):
     # Function: addPkt
     # Arguments: calling object
     #            packet to add to pkts
-    # Description: adds packet to either matched or received packets list
-    #              notifies background thread to compare packet lists
+    # Description: matches packet with the expected packets, or adds it
+    #              to the unmatched received packets
     ############################
     def addPkt(self,pkt):
         self.lock.acquire()
-        self.pkts.append(pkt)
+        self.matcher.addPkt(pkt)
         self.count += 1
+        self.lastPktTime = time.time()
+        self.barrierEvent.clear()
+        self.lock.notifyAll()
+        self.lock.release()
+
+    ############################
+    # Function: addPkts
+    # Arguments: calling object
+    #            list of packets to add
+    # Description: adds a batch of received packets under a single lock
+    ############################
+    def addPkts(self,pkts):
+        self.lock.acquire()
+        for pkt in pkts:
+            self.matcher.addPkt(pkt)
+        self.count += len(pkts)
+        self.lastPktTime = time.time()
         self.barrierEvent.clear()
+        self.lock.notifyAll()
         self.lock.release()
-        #if self.compareEvent.is_set():
-        #    pass
-        #else:
-        #    self.compareEvent.set()
 
     ############################
     # Function: isDone
@@ -136,12 +392,14 @@ class pktExpect(Thread):
     # Arguments: calling object
     #            packet to expect
     #            optional mask to apply to packet
-    # Description: adds packet to list of packets to expect
+    # Description: matches packet with the unmatched received packets, or
+    #              adds it to the packets to expect
     ############################
     def expectPkt(self, pkt, mask = None):
         self.lock.acquire()
-        self.exp_pkts.append((pkt, mask))
+        self.matcher.expectPkt(pkt, mask)
         self.barrierEvent.clear()
+        self.lock.notifyAll()
         self.lock.release()
 
     ############################
@@ -154,54 +412,19 @@ class pktExpect(Thread):
     #              certain bytes
     ############################
     def comparePkts(self, pkta, pktb, mask = None):
-        if mask:
-            pkta = [ord(x) for x in pkta]
-            pktb = [ord(x) for x in pktb]
-            mask = [ord(x) for x in mask]
-            for i in xrange(min(len(pkta), len(mask))):
-                pkta[i] = pkta[i] & ~mask[i]
-            for i in xrange(min(len(pktb), len(mask))):
-                pktb[i] = pktb[i] & ~mask[i]
-
-            pkta = ''.join([chr(x) for x in pkta])
-            pktb = ''.join([chr(x) for x in pktb])
-
-        return pkta == pktb
+        return pktmask.compare(pkta, pktb, mask)
 
     ############################
     # Function: resolvePkts
     # Arguments: calling object
-    # Description: checks unmatched received packets against unmatched expected packets
-    #              notifies barrierEvent if expected and received packet lists are empty
+    # Description: packets are matched as they are received and expected,
+    #              notifies barrierEvent if there are no expected packets left
     ############################
     def resolvePkts(self):
         self.lock.acquire()
-        if (len(self.pkts) > 0) and  (len(self.exp_pkts) > 0):
-            self.barrierEvent.clear()
-            i = 0
-            numPkts = len(self.pkts)
-            while i < numPkts:
-                strpkt = str(self.pkts[i])
-                for (exp, mask) in self.exp_pkts:
-                    strexp = str(exp)
-                    strmask = None
-                    if mask:
-                        strmask = str(mask)
-                    matches = self.comparePkts(strexp, strpkt, strmask)
-                    if not matches and len(exp) < 60 and self.pkts[i].haslayer(scapy.Padding):
-                        matches = self.comparePkts(
-                                ''.join([strexp,str(self.pkts[i][scapy.Padding])]),
-                                strpkt, strmask)
-                    if matches:
-                        self.matched.append(self.pkts[i])
-                        self.pkts.remove(self.pkts[i])
-                        self.exp_pkts.remove((exp, mask))
-                        numPkts -= 1
-                        i -= 1
-                        break
-                i += 1
+        done = len(self.exp_pkts) == 0
         self.lock.release()
-        if (len(self.exp_pkts) is 0):
+        if done:
             self.barrierEvent.set()
             return True
         return False
@@ -213,9 +436,7 @@ class pktExpect(Thread):
     ############################
     def restart(self):
         self.lock.acquire()
-        self.exp_pkts = []
-        self.pkts = []
-        self.matched = []
+        self.matcher.reset()
         self.lock.release()
 
 
@@ -229,9 +450,11 @@ class pktExpect(Thread):
         print self.device, 'finishing up'
         self.done = True
         self.lock.acquire()
-        exp_pkts = [ exp for (exp, mask) in self.exp_pkts ]
+        exp_pkts = [ exp for (exp, mask) in self.exp_pkts.itervalues() ]
         #print "\n\n\n -------------- received=%d and exptected=%d --------------- \n\n" % (len(self.pkts), len(exp_pkts))
-        return (self.matched, self.pkts, exp_pkts)
+        # raw packets are only decoded now, for the reports and pcap files
+        return ([decodePkt(pkt) for pkt in self.matched],
+                [decodePkt(pkt) for pkt in self.pkts.itervalues()], exp_pkts)
 
 class pktSend(Thread):
     ############################
@@ -239,14 +462,24 @@ class pktSend(Thread):
     # Arguments: calling object
     #            device name
     #            socket configuration options
+    #            (optional) maximum number of packets sent per system call
+    #            (optional) whether to send through a PACKET_TX_RING
+    #            (optional) condition to notify after each batch is sent
     # Description: overrides Thread.__init__, initializes vars, opens socket
     ############################
     def __init__(self, device, family = socket.AF_PACKET,
-                 type = socket.SOCK_RAW, proto = socket.htons(3)):
+                 type = socket.SOCK_RAW, proto = socket.htons(3),
+                 batch = 64, tx_ring = True, cond = None):
         Thread.__init__(self)
         self.daemon = True
-        self.lock = Lock()
+        # protects toSend and the counters, notified when packets are
+        # queued, sent or the sender is closed
+        self.lock = Condition()
+        self.cond = cond
         self.closed = False
+        # number of packets taken off toSend that are not sent yet
+        self.inFlight = 0
+        # packets are serialized when they are queued
         self.toSend = deque()
         self.sock = socket.socket(family, type, proto)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 0)
@@ -258,72 +491,240 @@ class pktSend(Thread):
                 break
         self.sock.bind((device,3))
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2**30)
+        self.device = device
+        self.ring = None
+        self.plainSock = None
+        if tx_ring and family == socket.AF_PACKET:
+            try:
+                self.ring = tpacket_capture.TPacketTxRing(self.sock)
+                batch = min(batch, self.ring.frame_nr)
+            except (socket.error, EnvironmentError):
+                self.ring = None
+        self.batch = batch
         self.sentcount = 0
         self.sendcount = 0
+        self.sentbytes = 0
+        # (time, number of packets) of the most recent batches handed to
+        # the kernel
+        self.sendTimes = deque(maxlen = SEND_TIMES_LEN)
+        self.firstSendTime = None
+        # the rate is timed from the end of the first batch, so its packets
+        # are left out of the count
+        self.firstBatchPkts = 0
+        self.firstBatchBytes = 0
+        self.lastSendTime = None
+        self.setRate()
+
+    ############################
+    # Function: setRate
+    # Arguments: calling object
+    #            (optional) rate in Gbps of packet bytes
+    #            (optional) rate in packets per second
+    # Description: paces the sending with a token bucket, sends as fast as
+    #              possible if neither rate is given
+    ############################
+    def setRate(self, gbps = None, pps = None):
+        self.lock.acquire()
+        self.gbps = gbps
+        self.pps = pps
+        self.nextSendTime = None
+        self.lock.release()
 
     ############################
     # Function: run
     # Arguments: calling object
-    # Description: overrides Thread.run, sends packets in queue
+    # Description: overrides Thread.run, sleeps until packets are queued
+    #              then sends them in batches at the configured rate
     ############################
     def run(self):
-        while not self.closed:
+        while True:
             try:
-                if len(self.toSend) > 0:
-                    self.lock.acquire()
-                    self.sock.send(self.toSend.popleft().__str__())
-                    self.sentcount += 1
+                self.lock.acquire()
+                try:
+                    while not self.toSend and not self.closed:
+                        self.lock.wait()
+                    if not self.toSend:
+                        return
+                    batch = self.batch
+                    if self.pps is not None or self.gbps is not None:
+                        # smaller batches keep the pacing smooth
+                        batch = min(batch, 8)
+                    pkts = [self.toSend.popleft() for i in xrange(min(batch, len(self.toSend)))]
+                    self.inFlight = len(pkts)
+                finally:
                     self.lock.release()
+                self.pace(pkts)
+                self.sendBatch(pkts)
             except(KeyboardInterrupt):
-                self.close()
+                self.closed = True
+                return
+
+    ############################
+    # Function: pace
+    # Arguments: calling object
+    #            batch of packet strings about to be sent
+    # Description: waits until the token bucket allows the batch
+    ############################
+    def pace(self, pkts):
+        # setRate may be called while we sleep, so work on a snapshot
+        self.lock.acquire()
+        pps, gbps, nextSendTime = self.pps, self.gbps, self.nextSendTime
+        self.lock.release()
+        if pps is None and gbps is None:
+            return
+        duration = 0.0
+        if pps is not None:
+            duration = max(duration, len(pkts) / float(pps))
+        if gbps is not None:
+            duration = max(duration, sum(len(pkt) for pkt in pkts) * 8 / (gbps * 1e9))
+        now = time.time()
+        if nextSendTime is None or nextSendTime < now:
+            nextSendTime = now
+        elif nextSendTime > now:
+            time.sleep(nextSendTime - now)
+        self.lock.acquire()
+        # a new rate set meanwhile restarts the schedule from its next batch
+        if self.pps == pps and self.gbps == gbps:
+            self.nextSendTime = nextSendTime + duration
+        self.lock.release()
+
+    ############################
+    # Function: sendBatch
+    # Arguments: calling object
+    #            batch of packet strings
+    # Description: sends the batch through the TX ring, or one packet at
+    #              a time if there is no ring; packets that do not fit in
+    #              a ring frame are sent through a plain socket
+    ############################
+    def sendBatch(self, pkts):
+        if self.ring is None:
+            for pkt in pkts:
+                self.sock.send(pkt)
+        elif max(len(pkt) for pkt in pkts) <= self.ring.maxLen():
+            self.ring.send(pkts)
+        else:
+            # keep the packet order, sending each run of packets that fit
+            # through the ring and the others through the plain socket
+            maxLen = self.ring.maxLen()
+            run = []
+            for pkt in pkts:
+                if len(pkt) <= maxLen:
+                    run.append(pkt)
+                    continue
+                if run:
+                    self.ring.send(run)
+                    run = []
+                self.plainSocket().send(pkt)
+            if run:
+                self.ring.send(run)
+        now = time.time()
+        self.lock.acquire()
+        if self.firstSendTime is None:
+            self.firstSendTime = now
+            self.firstBatchPkts = len(pkts)
+            self.firstBatchBytes = sum(len(pkt) for pkt in pkts)
+        self.lastSendTime = now
+        self.sendTimes.append((now, len(pkts)))
+        self.sentcount += len(pkts)
+        self.sentbytes += sum(len(pkt) for pkt in pkts)
+        self.inFlight = 0
+        self.lock.notifyAll()
+        self.lock.release()
+        # notified without holding self.lock, as the barrier calls idle()
+        # while holding cond
+        if self.cond is not None:
+            self.cond.acquire()
+            self.cond.notifyAll()
+            self.cond.release()
+
+    ############################
+    # Function: idle
+    # Arguments: calling object
+    # Description: returns True when every queued packet has been sent
+    ############################
+    def idle(self):
+        self.lock.acquire()
+        idle = not self.toSend and self.inFlight == 0
+        self.lock.release()
+        return idle
+
+    ############################
+    # Function: plainSocket
+    # Arguments: calling object
+    # Description: returns a socket without a TX ring for packets too long
+    #              for a ring frame; once the ring is attached every send on
+    #              self.sock goes through the ring, so they cannot use it
+    ############################
+    def plainSocket(self):
+        if self.plainSock is None:
+            # protocol 0 so the socket does not receive any packets
+            self.plainSock = socket.socket(self.sock.family, self.sock.type, 0)
+            self.plainSock.bind((self.device, 0))
+        return self.plainSock
 
     ############################
     # Function: sendPkt
     # Arguments: calling object
     #            packet to send
-    # Description: adds packets to queue to be sent
-    #              delays so scapy doesn't drop packets
+    # Description: serializes the packet and adds it to the queue to be sent
     ############################
     def sendPkt(self, pkt):
+        self.sendPkts([pkt])
+
+    ############################
+    # Function: sendPkts
+    # Arguments: calling object
+    #            list of packets to send
+    # Description: serializes the packets and adds them to the queue to be
+    #              sent
+    ############################
+    def sendPkts(self, pkts):
+        strpkts = [str(pkt) for pkt in pkts]
         self.lock.acquire()
-        self.toSend.append(pkt)
-        self.sendcount += 1
+        self.toSend.extend(strpkts)
+        self.sendcount += len(strpkts)
+        self.lock.notifyAll()
         self.lock.release()
 
+    ############################
+    # Function: stats
+    # Arguments: calling object
+    # Description: returns the number of packets and bytes sent, the
+    #              achieved rate in packets per second and Gbps, and the
+    #              (time, number of packets) of the last SEND_TIMES_LEN
+    #              batches sent
+    ############################
+    def stats(self):
+        self.lock.acquire()
+        stats = {'packets': self.sentcount, 'bytes': self.sentbytes,
+                 'pps': 0.0, 'gbps': 0.0, 'send_times': list(self.sendTimes)}
+        if self.sentcount > self.firstBatchPkts and self.lastSendTime > self.firstSendTime:
+            # rate of the batches sent after the first one
+            elapsed = self.lastSendTime - self.firstSendTime
+            stats['pps'] = (self.sentcount - self.firstBatchPkts) / elapsed
+            stats['gbps'] = (self.sentbytes - self.firstBatchBytes) * 8 / elapsed / 1e9
+        self.lock.release()
+        return stats
+
     ############################
     # Function: close
     # Arguments: calling object
     # Description: waits for packets to drain, then closes socket
     ############################
     def close(self):
-        while len(self.toSend) > 0:
-            pass
+        self.lock.acquire()
+        while self.toSend and self.isAlive():
+            self.lock.wait(0.5)
         if self.closed:
+            self.lock.release()
             return
         self.closed = True
+        self.lock.notifyAll()
+        self.lock.release()
+        if self.isAlive():
+            self.join()
+        if self.ring is not None:
+            self.ring.close()
+        if self.plainSock is not None:
+            self.plainSock.close()
         self.sock.close()
-
-class pktCompare(Thread):
-    ############################
-    # Function: __init__
-    # Arguments: calling object
-    #            pktExpect object
-    # Description: overrides Thread.__init__, initializes vars
-    ############################
-    def __init__ (self, expect):
-        Thread.__init__(self)
-        self.daemon = True
-        self.done = False
-        self.compareEvent = expect.compareEvent
-        self.compare = expect.resolvePkts
-
-    ############################
-    # Function: run
-    # Arguments: calling object
-    # Description: waits until woken by addPkt, then calls resolvePkts
-    ############################
-    def run(self):
-        while not self.done:
-            self.compareEvent.wait()
-            self.compare()
-            self.compareEvent.clear()
\ No newline at end of file
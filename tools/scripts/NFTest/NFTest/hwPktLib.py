@@ -34,6 +34,7 @@ import sys
 import os
 
 import time
+from threading import Condition
 
 try:
     import scapy.all as scapy
@@ -49,6 +50,16 @@ openSockets = {}
 packets = {}
 toIgnore = {}
 barrier_timeouts = 0
+# notified by the capture threads whenever a packet is received or expected,
+# and by the send threads whenever a batch of packets is sent
+barrierCond = Condition()
+# seconds without sent or received packets before a barrier returns, so that
+# trailing unexpected packets are caught by the barrier that caused them
+barrier_quiet = 0.1
+# capture backend of the capture threads, 'scapy' or 'tpacket', and the
+# optional BPF filter (tcpdump expression) of the tpacket backend
+capture_backend = 'scapy'
+capture_filter = None
 
 pcap_dir = "hw_pcaps/"
 
@@ -68,8 +79,9 @@ def init(active_ports):
 ############################
 def start():
     for iface in ifaceArray:
-        captureThreads[iface] = hwPkt.pktExpect(iface)
-        openSockets[iface] = hwPkt.pktSend(iface)
+        captureThreads[iface] = hwPkt.pktExpect(iface, barrierCond,
+                                                capture_backend, capture_filter)
+        openSockets[iface] = hwPkt.pktSend(iface, cond = barrierCond)
         packets[iface] = {}
         toIgnore['layer'] = []
         toIgnore['method'] = []
@@ -111,6 +123,30 @@ def send(ifaceName, pkt, exp = True):
     if exp:
         expect(ifaceName, pkt)
 
+############################
+# Function: set_rate
+# Arguments: interface name
+#            (optional) rate in Gbps of packet bytes
+#            (optional) rate in packets per second
+# Description: paces the packets sent on an interface, sends as fast as
+#              possible if neither rate is given
+############################
+def set_rate(ifaceName, gbps = None, pps = None):
+    try:
+        openSockets[ifaceName].setRate(gbps, pps)
+    except(KeyError):
+        print 'Error: invalid interface name'
+
+############################
+# Function: send_stats
+# Arguments: interface name
+# Description: returns the number of packets and bytes sent on an
+#              interface, the achieved rate in pps and Gbps, and the
+#              (time, number of packets) of the recent batches sent
+############################
+def send_stats(ifaceName):
+    return openSockets[ifaceName].stats()
+
 ############################
 # Function: expect
 # Arguments: interface name
@@ -124,62 +160,46 @@ def expect(ifaceName, pkt, mask = None):
 ############################
 # Function: barrier
 # Arguments: (optional) timeout in seconds, default is 10 sec
-# Description: blocks execution until expected packets arrive, or times out
+#            (optional) quiet period in seconds, default is barrier_quiet
+# Description: blocks execution until expected packets arrive and no packet
+#              has been received for the quiet period, or times out
 #              returns False if timed out
 ############################
-def barrier(timeout = 10):
-    # wait until no more packets are received
-    # we assume that if no packets are received within 1 second, then no more traffic is expected
-    prevCount = 0
-    while True:
-        sumCount = 0
-        for iface in ifaceArray:
-            sumCount += captureThreads[iface].count
-        if sumCount == prevCount:
-            break
-        prevCount = sumCount
-        time.sleep(1.0)
-
-    #print "\n\n--BARRIER1-------we are no longer receiving traffic--------"
-
-    # trigger the post-test packet verification/comparison and wait it to finish
-    for iface in ifaceArray:
-            captureThreads[iface].compareEvent.set() # start verification in parallel
-    for iface in ifaceArray:
-            while captureThreads[iface].compareEvent.isSet():
-                time.sleep(0.2)
-
-    #print "\n--BARRIER2-------the bulk of the verification is done--------"
-
-    # get the status of the verification and wait for potentially delayed packets
-    waitPerIteration = float(timeout)/(len(ifaceArray)*5.0)
+def barrier(timeout = 10, quiet = None):
+    if quiet is None:
+        quiet = barrier_quiet
     stop = time.time() + timeout
-    good = False
-    while not good and stop > time.time():
-        good = True
-        for iface in ifaceArray:
-            captureThreads[iface].compareEvent.set()
-        for iface in ifaceArray:
-            captureThreads[iface].barrierEvent.wait(waitPerIteration)
-            good &= captureThreads[iface].barrierEvent.is_set()
-
-    #print "\n--BARRIER3-------the barrier is done--------"
-
-    #start = time.clock()
-    #good = False
-    #while timeout + start - time.clock() > 0:
-    #    good = True
-    #    for iface in ifaceArray:
-    #        captureThreads[iface].compareEvent.set()
-    #    for iface in ifaceArray:
-    #        captureThreads[iface].barrierEvent.wait(timeout-start)
-    #        good &= captureThreads[iface].barrierEvent.is_set()
-    #    if good:
-    #        break
+    barrierCond.acquire()
+    try:
+        while True:
+            now = time.time()
+            good = True
+            for iface in ifaceArray:
+                good &= captureThreads[iface].resolvePkts()
+            # packets still queued to be sent belong to this phase too
+            sent = True
+            for iface in ifaceArray:
+                sent &= openSockets[iface].idle()
+            if good and sent:
+                # all packets have been sent and all expected packets have
+                # arrived, wait for the traffic to stop so that trailing
+                # packets are reported by this barrier
+                lastPktTime = max([captureThreads[iface].lastPktTime for iface in ifaceArray] +
+                                  [openSockets[iface].lastSendTime or 0 for iface in ifaceArray] + [0])
+                wait = min(lastPktTime + quiet, stop) - now
+            else:
+                wait = stop - now
+            if wait <= 0:
+                break
+            barrierCond.wait(wait)
+    finally:
+        barrierCond.release()
 
-    if not good:
+    if not good or not sent:
         print 'Error: barrier timed out after', str(timeout), 'seconds'
         for iface in ifaceArray:
+            if not openSockets[iface].idle():
+                print 'Error: device', iface, 'still had packets to send'
             numUnexp = captureThreads[iface].pkts.__len__()
             numExp = captureThreads[iface].exp_pkts.__len__()
             if numUnexp > 0:
@@ -191,7 +211,7 @@ def barrier(timeout = 10):
         print ''
         global barrier_timeouts
         barrier_timeouts += 1
-    return good
+    return good and sent
 
 ############################
 # Function: compare
@@ -259,6 +279,9 @@ def finish():
         os.mkdir(pcap_dir)
     for iface in ifaceArray:
         openSockets[iface].close()
+        if openSockets[iface].gbps is not None or openSockets[iface].pps is not None:
+            stats = send_stats(iface)
+            print iface, 'sent', stats['packets'], 'packets at %.0f pps (%.3f Gbps)' % (stats['pps'], stats['gbps'])
         # close capture threads, record packets
         pkts = captureThreads[iface].finish()
 
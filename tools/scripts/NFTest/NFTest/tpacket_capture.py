@@ -0,0 +1,389 @@
+#
+# Copyright (c) 2015 University of Cambridge
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory 
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"), 
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+
+#
+# Packet capture from an AF_PACKET socket with a TPACKET_V3 mmap'd receive
+# ring. The kernel fills blocks of packets in the ring and the packets are
+# read as raw strings with their timestamps, without building a scapy
+# object per packet.
+#
+# TPacketTxRing queues batches of packets in a PACKET_TX_RING and sends
+# each batch with a single system call.
+#
+# Run as a script to benchmark the capture on a veth pair (needs root):
+#     tpacket_capture.py [--pkts N] [--size BYTES] [--scapy]
+#
+################################################################################
+import argparse
+import ctypes
+import mmap
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import time
+from threading import Thread
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+SO_ATTACH_FILTER = 26
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_TX_RING = 13
+TPACKET_V2 = 1
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+TP_STATUS_AVAILABLE = 0
+TP_STATUS_SEND_REQUEST = 1
+TP_STATUS_SENDING = 2
+TP_STATUS_WRONG_FORMAT = 4
+
+# struct tpacket_req3
+TPACKET_REQ3 = struct.Struct('=IIIIIII')
+# block_status, num_pkts and offset_to_first_pkt of struct tpacket_block_desc
+BLOCK_HDR = struct.Struct('=III')
+BLOCK_HDR_OFFSET = 8
+# tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac
+# of struct tpacket3_hdr
+PKT_HDR = struct.Struct('=IIIIIIH')
+# struct tpacket_stats_v3
+TPACKET_STATS_V3 = struct.Struct('=III')
+# struct tpacket_req
+TPACKET_REQ = struct.Struct('=IIII')
+# tp_status, tp_len, tp_snaplen of struct tpacket2_hdr
+TX_HDR = struct.Struct('=III')
+# offset of the packet data in a TX frame, TPACKET2_HDRLEN minus the
+# sockaddr_ll
+TX_DATA_OFFSET = 32
+
+class sock_filter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_ushort), ('jt', ctypes.c_ubyte),
+                ('jf', ctypes.c_ubyte), ('k', ctypes.c_uint32)]
+
+class rawPkt(str):
+    ############################
+    # Description: the raw string of a captured packet, with its capture
+    #              time in seconds as the time attribute
+    ############################
+    pass
+
+############################
+# Function: compileFilter
+# Arguments: tcpdump filter expression
+#            interface name
+# Description: compiles a filter expression into BPF instructions
+#              (code, jt, jf, k) with tcpdump -ddd
+############################
+def compileFilter(expr, device):
+    out = subprocess.check_output(['tcpdump', '-i', device, '-ddd', expr])
+    lines = out.split('\n')
+    insns = []
+    for line in lines[1:int(lines[0])+1]:
+        insns.append(tuple(int(x) for x in line.split()))
+    return insns
+
+class TPacketRing(object):
+    ############################
+    # Function: __init__
+    # Arguments: calling object
+    #            device name to capture on
+    #            (optional) BPF filter, a tcpdump expression or a list of
+    #            (code, jt, jf, k) instructions
+    #            ring geometry: block size and number of blocks, frame size
+    #            block retire timeout in milliseconds
+    # Description: opens the socket and maps its receive ring
+    ############################
+    def __init__(self, device, bpf = None, block_size = 1 << 22, block_nr = 16,
+                 frame_size = 2048, retire_tov = 10):
+        self.device = device
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.block = 0
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            if bpf is not None:
+                self.attachFilter(bpf)
+            self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, TPACKET_REQ3.pack(
+                block_size, block_nr, frame_size, block_size / frame_size * block_nr,
+                retire_tov, 0, 0))
+            self.ring = mmap.mmap(self.sock.fileno(), block_size * block_nr,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self.sock.bind((device, ETH_P_ALL))
+        except:
+            self.sock.close()
+            raise
+
+    ############################
+    # Function: attachFilter
+    # Arguments: calling object
+    #            tcpdump expression or list of BPF instructions
+    # Description: attaches a BPF filter to the socket
+    ############################
+    def attachFilter(self, bpf):
+        if isinstance(bpf, str):
+            bpf = compileFilter(bpf, self.device)
+        self.bpf = (sock_filter * len(bpf))(*[sock_filter(*insn) for insn in bpf])
+        # struct sock_fprog: unsigned short len, struct sock_filter *filter
+        fprog = struct.pack('HP', len(bpf), ctypes.addressof(self.bpf))
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    ############################
+    # Function: recv
+    # Arguments: calling object
+    #            (optional) seconds to wait for packets
+    # Description: returns the packets of all of the blocks filled by the
+    #              kernel as rawPkt strings, waiting up to timeout for the
+    #              next block if none is ready
+    ############################
+    def recv(self, timeout = 1.0):
+        ring = self.ring
+        pkts = []
+        while True:
+            offset = self.block * self.block_size
+            status, num_pkts, pos = BLOCK_HDR.unpack_from(ring, offset + BLOCK_HDR_OFFSET)
+            if not status & TP_STATUS_USER:
+                if pkts or timeout is None:
+                    return pkts
+                select.select([self.sock], [], [], timeout)
+                timeout = None
+                continue
+            pos += offset
+            for i in xrange(num_pkts):
+                next_offset, sec, nsec, snaplen, length, pkt_status, mac = PKT_HDR.unpack_from(ring, pos)
+                pkt = rawPkt(ring[pos + mac:pos + mac + snaplen])
+                pkt.time = sec + nsec * 1e-9
+                pkts.append(pkt)
+                pos += next_offset
+            # hand the block back to the kernel
+            ring[offset + BLOCK_HDR_OFFSET:offset + BLOCK_HDR_OFFSET + 4] = '\0\0\0\0'
+            self.block = (self.block + 1) % self.block_nr
+
+    ############################
+    # Function: stats
+    # Arguments: calling object
+    # Description: returns (packets, drops) since the last call
+    ############################
+    def stats(self):
+        packets, drops, freeze_q_cnt = TPACKET_STATS_V3.unpack(
+            self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, TPACKET_STATS_V3.size))
+        return packets, drops
+
+    def close(self):
+        self.ring.close()
+        self.sock.close()
+
+class TPacketTxRing(object):
+    ############################
+    # Function: __init__
+    # Arguments: calling object
+    #            bound AF_PACKET socket
+    #            (optional) frame size and number of frames
+    # Description: maps a TPACKET_V2 transmit ring on the socket
+    ############################
+    def __init__(self, sock, frame_size = 2048, frame_nr = 1024):
+        self.sock = sock
+        self.frame_size = frame_size
+        self.frame_nr = frame_nr
+        self.frame = 0
+        self.errors = 0
+        block_size = max(mmap.PAGESIZE, frame_size)
+        frames_per_block = block_size / frame_size
+        block_nr = (frame_nr + frames_per_block - 1) / frames_per_block
+        self.frame_nr = block_nr * frames_per_block
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V2)
+        sock.setsockopt(SOL_PACKET, PACKET_TX_RING, TPACKET_REQ.pack(
+            block_size, block_nr, frame_size, self.frame_nr))
+        self.ring = mmap.mmap(sock.fileno(), block_size * block_nr,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    ############################
+    # Function: maxLen
+    # Arguments: calling object
+    # Description: returns the largest packet a frame can hold
+    ############################
+    def maxLen(self):
+        return self.frame_size - TX_DATA_OFFSET
+
+    ############################
+    # Function: send
+    # Arguments: calling object
+    #            list of packet strings, at most frame_nr of them
+    # Description: copies the packets into the ring and sends them with
+    #              one system call, which returns once they are sent
+    ############################
+    def send(self, pkts):
+        ring = self.ring
+        for data in pkts:
+            offset = self.frame * self.frame_size
+            self.waitFrame(offset)
+            ring[offset + TX_DATA_OFFSET:offset + TX_DATA_OFFSET + len(data)] = data
+            # the status is written last, it hands the frame to the kernel
+            ring[offset:offset + TX_HDR.size] = TX_HDR.pack(TP_STATUS_SEND_REQUEST, len(data), len(data))
+            self.frame = (self.frame + 1) % self.frame_nr
+        self.sock.send('')
+
+    ############################
+    # Function: waitFrame
+    # Arguments: calling object
+    #            offset of a frame in the ring
+    #            (optional) seconds to wait for the kernel
+    # Description: waits until the kernel has handed the frame back, so a
+    #              frame that is still queued or being sent is not overwritten
+    ############################
+    def waitFrame(self, offset, timeout = 1):
+        status = TX_HDR.unpack_from(self.ring, offset)[0]
+        if status & (TP_STATUS_SEND_REQUEST | TP_STATUS_SENDING):
+            # flush the queued frames, the call returns once they are sent
+            self.sock.send('')
+            deadline = time.time() + timeout
+            status = TX_HDR.unpack_from(self.ring, offset)[0]
+            while status & (TP_STATUS_SEND_REQUEST | TP_STATUS_SENDING):
+                if time.time() > deadline:
+                    raise socket.error('TX ring frame was not released by the kernel')
+                time.sleep(0.0001)
+                status = TX_HDR.unpack_from(self.ring, offset)[0]
+        if status & TP_STATUS_WRONG_FORMAT:
+            self.errors += 1
+
+    def close(self):
+        self.ring.close()
+
+############################
+# Function: capture
+# Arguments: device name
+#            function called with each list of captured packets
+#            function returning True when the capture should stop
+#            (optional) BPF filter
+# Description: captures packets until stopper returns True, in the manner
+#              of scapy_sniff_patch.sniff
+############################
+def capture(device, prn, stopper, bpf = None, stopperTimeout = 1):
+    ring = TPacketRing(device, bpf)
+    try:
+        while not stopper():
+            pkts = ring.recv(stopperTimeout)
+            if pkts:
+                prn(pkts)
+    finally:
+        ring.close()
+
+
+############################
+# Function: selfTest
+# Arguments: number of packets, packet size, whether to also benchmark
+#            scapy sniff
+# Description: sends packets as fast as possible over a veth pair and
+#              reports the capture rate and drops
+############################
+def selfTest(num_pkts, size, use_scapy):
+    tx_dev, rx_dev = 'nftest_veth0', 'nftest_veth1'
+    subprocess.check_call(['ip', 'link', 'add', tx_dev, 'type', 'veth', 'peer', 'name', rx_dev])
+    try:
+        for dev in [tx_dev, rx_dev]:
+            subprocess.check_call(['ip', 'link', 'set', dev, 'up'])
+        frame = '\xff' * 6 + '\x02\x00\x00\x00\x00\x01' + '\x88\xb5' + os.urandom(size - 14)
+        tx = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        tx.bind((tx_dev, ETH_P_ALL))
+        # only count the test frames, not IPv6 neighbour discovery
+        bpf = [(0x28, 0, 0, 12), (0x15, 0, 1, 0x88b5), (0x6, 0, 0, 0x40000), (0x6, 0, 0, 0)]
+
+        results = [('tpacket', benchRing(rx_dev, bpf, tx, frame, num_pkts))]
+        if use_scapy:
+            results.append(('scapy', benchScapy(rx_dev, tx, frame, num_pkts)))
+        tx.close()
+        for name, (received, drops, elapsed) in results:
+            print '%-8s %8d/%d packets  %6d drops  %7.2f s  %10.0f pkts/s' % (
+                    name, received, num_pkts, drops, elapsed, received / max(elapsed, 1e-9))
+    finally:
+        subprocess.call(['ip', 'link', 'del', tx_dev])
+
+def benchRing(device, bpf, tx, frame, num_pkts):
+    ring = TPacketRing(device, bpf)
+    ring.stats()
+    received = [0]
+    def rx():
+        while received[0] < num_pkts:
+            pkts = ring.recv(1.0)
+            if not pkts:
+                break
+            received[0] += len(pkts)
+    t = Thread(target=rx)
+    start = time.time()
+    t.start()
+    for i in xrange(num_pkts):
+        tx.send(frame)
+    t.join()
+    elapsed = time.time() - start
+    packets, drops = ring.stats()
+    ring.close()
+    return received[0], drops, elapsed
+
+def benchScapy(device, tx, frame, num_pkts):
+    # the per packet work of scapy_sniff_patch.sniff
+    import scapy.all as scapy
+    listen = scapy.conf.L2listen(iface=device, type=ETH_P_ALL)
+    received = [0]
+    last = [time.time()]
+    def rx():
+        while received[0] < num_pkts:
+            r, w, x = select.select([listen], [], [], 1.0)
+            if not r:
+                break
+            pkt = listen.recv(scapy.MTU)
+            if pkt is not None and pkt.type == 0x88b5:
+                received[0] += 1
+                last[0] = time.time()
+    t = Thread(target=rx)
+    start = last[0] = time.time()
+    t.start()
+    for i in xrange(num_pkts):
+        tx.send(frame)
+    t.join()
+    listen.close()
+    return received[0], num_pkts - received[0], last[0] - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TPACKET_V3 capture on a veth pair")
+    parser.add_argument('--pkts', type=int, default=100000, help="number of packets to send")
+    parser.add_argument('--size', type=int, default=64, help="packet size in bytes")
+    parser.add_argument('--scapy', action='store_true', default=False, help="also benchmark scapy sniff")
+    args = parser.parse_args()
+    if args.size < 14:
+        print >> sys.stderr, "ERROR: packets must be at least 14 bytes"
+        sys.exit(1)
+    selfTest(args.pkts, args.size, args.scapy)
+
+if __name__ == "__main__":
+    main()
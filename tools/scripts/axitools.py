@@ -40,6 +40,7 @@
 import math
 import sys
 import os
+from binascii import unhexlify
 from NFTest import *
 
 # under cygwin, there is no hardware support - so suppress hardware initialisation
@@ -63,12 +64,14 @@ class BadAXIDataException( Exception ):
         return '%s: %d: bad AXI data: %s' % (self.filename, self.lineno, self.msg)
 
 
-def axis_dump( packets, f, bus_width, period, tuser_width = 128 ):
+def axis_dump( packets, f, bus_width, period, tuser_width = 128, chunk_size = 1 << 20 ):
     """
-    Dumps the list of packets to an AXI Stream-grammar formatted text file.
-    Attribute .tuser (array of 128-bit integers) will supply TUSER if present,
-    and .tuser_sport and .tuser_dport, if present, will be applied (overriding)
-    any .tuser.
+    Dumps the packets to an AXI Stream-grammar formatted text file.  packets
+    may be a single packet, a list or any iterable (e.g. a scapy PcapReader)
+    of Scapy packets or AXISPacket records.  Attribute .tuser (array of
+    128-bit integers) will supply TUSER if present, and .tuser_sport and
+    .tuser_dport, if present, will be applied (overriding) any .tuser.
+    Output is written to f in chunks of about chunk_size bytes.
     """
     def tuser_mask( partial_mask ):
         """
@@ -85,24 +88,40 @@ def axis_dump( packets, f, bus_width, period, tuser_width = 128 ):
     last_ts   = None
     period    = int(period * 1e9)
 
+    # Everything that does not depend on the packet is formatted up front
+    len_mask   = tuser_mask(0xffffff0000)
+    sport_mask = tuser_mask(0xffff00ffff)
+    dport_mask = tuser_mask(0xff00ffffff)
+    tuser_chars = tuser_width/4
+    # TSTRB string for each amount of padding in the last word
+    strb_strs = [('%x' % (strb_mask >> padding)).zfill(bus_width/4) for padding in range(bus_width)]
+    zero_tuser = '0' * tuser_chars
+    # TSTRB, TUSER and TLAST of a full, non-terminal word with no TUSER data
+    mid_suffix = ', %s, %s,\n' % (strb_strs[0], zero_tuser)
+    word_chars = 2 * bus_width
+
     #Cope with the case of individual packets being sent instead of a list
-    if isinstance(packets,Ether):
+    if isinstance(packets, (Ether, AXISPacket)):
         packets = [packets]
 
+    out = []
+    out_len = 0
     for packet in packets:
+        lines = []
         # Output delay parameter
+        ts = int(packet.time * 1e9)
         if last_ts is not None:
-            if (int(packet.time * 1e9)-last_ts) > 0 :
-                f.write( '+ %d\n' % (int(packet.time * 1e9)-last_ts) )
-	else:
-            f.write( '@ %d\n' % (int(packet.time * 1e9)))
-        last_ts = int(packet.time * 1e9)
+            if (ts-last_ts) > 0 :
+                lines.append( '+ %d\n' % (ts-last_ts) )
+        else:
+            lines.append( '@ %d\n' % ts )
+        last_ts = ts
 
-        # Set up TUSER
+        # Set up TUSER (on a copy, so that the packet is left untouched)
         if hasattr( packet, 'tuser' ):
-            if type(packet.tuser) == list and type(packet.tuser[0]) == int:
-                tuser = packet.tuser
-            elif type(packet.tuser) == int:
+            if type(packet.tuser) == list and isinstance(packet.tuser[0], (int, long)):
+                tuser = list(packet.tuser)
+            elif isinstance(packet.tuser, (int, long)):
                 tuser = [packet.tuser]
             elif type(packet.tuser) == str:
                 tuser = [int(packet.tuser, 16)]
@@ -110,42 +129,60 @@ def axis_dump( packets, f, bus_width, period, tuser_width = 128 ):
                 raise TypeError( 'bad tuser data (not an array of ints)' )
         else:
             tuser = [0]
+
+        # Raw packet bytes
+        if isinstance(packet, AXISPacket):
+            data = packet.data
+        else:
+            data = str(packet)
+        pkt_len = len(data)
+
         # Override length, sport, dport fields as appropriate
-        tuser[0] = (tuser[0] & tuser_mask(0xffffff0000) ) | len(packet)
+        tuser[0] = (tuser[0] & len_mask ) | pkt_len
         if hasattr( packet, 'tuser_sport' ):
-            tuser[0] = (tuser[0] & tuser_mask(0xffff00ffff) ) | (packet.tuser_sport << 16)
+            tuser[0] = (tuser[0] & sport_mask ) | (packet.tuser_sport << 16)
         if hasattr( packet, 'tuser_dport' ):
-            tuser[0] = (tuser[0] & tuser_mask(0xff00ffffff) ) | (packet.tuser_dport << 24)
+            tuser[0] = (tuser[0] & dport_mask ) | (packet.tuser_dport << 24)
 
-        # Turn into a list of bytes
-        packet = [ord(x) for x in str(packet)]
+        # TDATA is little-endian: reversing the padded packet as a whole
+        # gives every word reversed, with the words in reverse order
+        num_words = (pkt_len + bus_width - 1) / bus_width
+        padding = num_words * bus_width - pkt_len
+        rev_hex = (data + '\0' * padding)[::-1].encode('hex')
 
         # Dump word-by-word
-        for i in range(0, len(packet), bus_width):
-            if len(packet)-i < bus_width:
-                padding = bus_width - (len(packet)-i)
-                word = packet[i:] + [0] * padding
-            else:
-                padding = 0
-                word = packet[i:i+bus_width]
-            word.reverse()                            # TDATA is little-endian
-
-            if i + bus_width >= len(packet):
-                terminal = '.'
+        num_tuser = len(tuser)
+        pos = len(rev_hex)
+        for i in xrange(num_words):
+            tdata = rev_hex[pos-word_chars:pos]
+            pos -= word_chars
+            last = (i == num_words - 1)
+            if i < num_tuser and tuser[i] != 0:
+                tuser_str = ('%x' % tuser[i]).zfill(tuser_chars)
+            elif not last:
+                lines.append( tdata + mid_suffix )
+                continue
             else:
-                terminal = ','
+                tuser_str = zero_tuser
+            lines.append( '%s, %s, %s%s\n' % (
+                    tdata,                                  # TDATA
+                    strb_strs[padding if last else 0],      # TSTRB
+                    tuser_str,                              # TUSER
+                    '.' if last else ',' ) )                # TLAST
 
-            # Add TUSER pad to guarantee something is there to pop
-            tuser.append(0)
-            f.write( '%s, %s, %s%s\n' % (
-                    ''.join( '%02x' % x for x in word ),                # TDATA
-                    ('%x' % (strb_mask >> padding)).zfill(bus_width/4), # TSTRB
-                    ('%x' % tuser.pop(0)).zfill(tuser_width/4),         # TUSER
-                    terminal ) )                                        # TLAST
+        # one clock tick per word
+        last_ts += period * num_words
+        lines.append( '\n' )
 
-            # one clock tick
-            last_ts += period
-        f.write( '\n' )
+        chunk = ''.join(lines)
+        out.append( chunk )
+        out_len += len(chunk)
+        if out_len >= chunk_size:
+            f.write( ''.join(out) )
+            out = []
+            out_len = 0
+    if out:
+        f.write( ''.join(out) )
 
 def axis_reg( packets, f ):
     last_ts   = None
@@ -158,91 +195,144 @@ def axis_reg( packets, f ):
 	last_ts = int(packet.time * 1e9)
 
 
-def axis_load( f, period ):
+class AXISPacket( object ):
     """
-    Loads packets from an AXI Stream-grammar formatted text file as a list of
-    Scapy packet instances.  The following extra attributes are added to each
-    instance:
+    Lightweight record for a packet read from an AXI Stream-grammar formatted
+    text file.  Holds the raw packet bytes and the TUSER derived metadata;
+    decoding into a Scapy packet is only done on demand by to_scapy().
+        .data           raw packet bytes (str)
+        .time           time of the start of the packet
         .tuser          raw contents of TUSER, stored as array of 128-bit ints
         .tuser_len      packet length (from TUSER)
         .tuser_sport    source port (one-hot, from TUSER)
         .tuser_dport    dest port (one-hot, from TUSER)
+        .lineno         line number of the end of the packet
     """
-    def as_bytes(x):
+    __slots__ = ('data', 'time', 'tuser', 'tuser_len', 'tuser_sport', 'tuser_dport', 'lineno')
+
+    def __init__( self, data, time, tuser, lineno = None ):
+        self.data        =  data
+        self.time        =  time
+        self.tuser       =  tuser
+        self.tuser_len   =  tuser[0] & 0xffff
+        self.tuser_sport = (tuser[0] >> 16) & 0xff
+        self.tuser_dport = (tuser[0] >> 24) & 0xff
+        self.lineno      =  lineno
+
+    def __len__( self ):
+        return len(self.data)
+
+    def to_scapy( self ):
         """
-        Splits hex string X into list of bytes.
+        Decodes the packet into a Scapy instance with the same extra
+        attributes as returned by axis_load().
         """
-        return [int(x[i:i+2],16) for i in range(0,len(x),2)]
+        try:
+            pkt = Ether( self.data )
+        except:
+            try:
+                pkt = Raw( self.data )
+            except Exception as e:
+                print e
+                sys.exit(1)
+        pkt.time        = self.time
+        pkt.tuser       = self.tuser
+        pkt.tuser_len   = self.tuser_len
+        pkt.tuser_sport = self.tuser_sport
+        pkt.tuser_dport = self.tuser_dport
+        return pkt
 
+
+# Number of valid bytes for each contiguous TSTRB value of up to 512 bits
+TSTRB_VALID_BYTES = dict( ((1 << n) - 1, n) for n in range(513) )
+
+def iter_axis( f, period ):
+    """
+    Lazily yields the packets of an AXI Stream-grammar formatted text file
+    as AXISPacket records, so that arbitrarily long logs can be processed in
+    constant memory.
+    """
     bus_width = None
+    word_chars = None
     time = 0
-    pkt_data = []
-    tuser = []
-    pkts = []
-    for lno, line in enumerate(f):
-        lno += 1
-        try:
-            # Look to see if a comment is present.  If not, index() will throw
-            # an exception, and we skip this section.
-            hash_index = line.index( '#' )
-        except ValueError:
-            pass
-        else:
-            line = line[:hash_index]
+    words = []
+    tusers = []
+    num_pkts = 0
+    valid_lookup = TSTRB_VALID_BYTES
+    for lno, line in enumerate(f, 1):
+        # Strip comments
+        if '#' in line:
+            line = line[:line.index( '#' )]
         line = line.strip()
         if not line:
             continue
 
         # Handle delay specs
-        if   line[0] == '@':
-            a = line.lstrip('@')
-	    b = a.lstrip(' ')
-            time = int(b)
-        elif line[0] == '+':
+        c = line[0]
+        if   c == '@':
+            time = int(line[1:])/1e9
+        elif c == '+':
             time += int(line[1:])/1e9
-        elif line[0] == '*':
+        elif c == '*':
             time += period * int(line[1:])
         else: # treat as data
             terminal = line[-1]
-            line     = line[:-1]
-            if terminal not in [',', '.']:
+            if terminal != ',' and terminal != '.':
                 raise BadAXIDataException( f.name, lno, 'unknown terminal %s' % terminal )
-            line = [x.strip() for x in line.split(',')]
-            if len(line) != 3:
-                raise BadAXIDataException( f.name, lno, 'invalid data (expected 3 fields, got %d)' %len(line) )
+            fields = line[:-1].split(',')
+            if len(fields) != 3:
+                raise BadAXIDataException( f.name, lno, 'invalid data (expected 3 fields, got %d)' %len(fields) )
+            tdata = fields[0].strip()
 
             # handle start of packet
-            if not pkt_data:
+            if not words:
                 SoP_time = time
             if bus_width is None:
-                bus_width = len(line[0]) * 4
-                if math.log(bus_width,2) - int(math.log(bus_width,2)) != 0:
+                bus_width = len(tdata) * 4
+                word_chars = bus_width/4
+                if bus_width & (bus_width - 1) != 0:
                     print '%s: data bus not a power of two in width' % f.name
-            # accumulate packet and TUSER data
-            pkt_data += reversed( as_bytes( line[0].zfill( bus_width/4 ) ) )
-            tuser.append( int( line[2], 16 ) )
+            if len(tdata) != word_chars:
+                tdata = tdata.zfill( word_chars )
+            # accumulate packet and TUSER data as hex, decoded once per packet
+            words.append( tdata )
+            tusers.append( fields[2] )
             # handle end of packet
             if terminal == '.':
-                valid_bytes = int( math.log( int( line[1], 16 ) + 1, 2 ) )
-                if valid_bytes < bus_width/8: # trim off any padding
-                    del pkt_data[valid_bytes-bus_width/8:]
+                # TDATA is little-endian: decoding the words in reverse order
+                # and reversing the result reverses each word in place, and
+                # leaves the padding of the last word at the end
+                words.reverse()
                 try:
-                    pkts.append( Ether( ''.join( [chr(x) for x in pkt_data] ) ) )
-                except:
-                    try:
-                        pkts.append( Raw( ''.join( [chr(x) for x in pkt_data] ) ) )
-                    except Exception as e:
-                        print e
-                        sys.exit(1) 
-                pkts[-1].time        =  SoP_time
-                pkts[-1].tuser       =  tuser
-                pkts[-1].tuser_len   =  tuser[0] & 0xffff
-                pkts[-1].tuser_sport = (tuser[0] >> 16) & 0xff
-                pkts[-1].tuser_dport = (tuser[0] >> 24) & 0xff
-                pkt_data = []
-                tuser    = []
-                if len(pkts[-1]) != pkts[-1].tuser_len:
-                    meta_len = pkts[-1].tuser_len
-                    print '%s: %d: #%d: warning: meta length (%d) disagrees with actual length (%d)' % (f.name, lno, len(pkts), meta_len, len(pkts[-1]))
+                    data = unhexlify( ''.join( words ) )[::-1]
+                    tuser = [int( x, 16 ) for x in tusers]
+                    strb = int( fields[1], 16 )
+                except (TypeError, ValueError):
+                    raise BadAXIDataException( f.name, lno, 'invalid hex data' )
+                valid_bytes = valid_lookup.get( strb )
+                if valid_bytes is None:
+                    valid_bytes = int( math.log( strb + 1, 2 ) )
+                padding = bus_width/8 - valid_bytes
+                if padding > 0: # trim off any padding
+                    data = data[:-padding]
+                pkt = AXISPacket( data, SoP_time, tuser, lno )
+                num_pkts += 1
+                words = []
+                tusers = []
+                if len(pkt) != pkt.tuser_len:
+                    print '%s: %d: #%d: warning: meta length (%d) disagrees with actual length (%d)' % (f.name, lno, num_pkts, pkt.tuser_len, len(pkt))
+                yield pkt
             time += period
-    return pkts
+
+
+def axis_load( f, period ):
+    """
+    Loads packets from an AXI Stream-grammar formatted text file as a list of
+    Scapy packet instances.  The following extra attributes are added to each
+    instance:
+        .tuser          raw contents of TUSER, stored as array of 128-bit ints
+        .tuser_len      packet length (from TUSER)
+        .tuser_sport    source port (one-hot, from TUSER)
+        .tuser_dport    dest port (one-hot, from TUSER)
+    """
+    return [pkt.to_scapy() for pkt in iter_axis( f, period )]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2010, 2011 The Board of Trustees of The Leland Stanford
+#                          Junior University
+# Copyright (C) 2015 David J. Miller
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+################################################################################
+#
+#  File:
+#        axitools_bench.py
+#
+#  Description:
+#        Benchmark of the axitools AXI Stream-grammar parser against the
+#        original per-byte implementation, on a synthetic log.
+#
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import axitools
+
+
+def legacy_iter_axis( f, period ):
+    """
+    The original axis_load() parsing loop, yielding (data, time, tuser)
+    """
+    def as_bytes(x):
+        return [int(x[i:i+2],16) for i in range(0,len(x),2)]
+
+    bus_width = None
+    time = 0
+    pkt_data = []
+    tuser = []
+    for lno, line in enumerate(f):
+        try:
+            hash_index = line.index( '#' )
+        except ValueError:
+            pass
+        else:
+            line = line[:hash_index]
+        line = line.strip()
+        if not line:
+            continue
+
+        if   line[0] == '@':
+            time = int(line.lstrip('@').lstrip(' '))
+        elif line[0] == '+':
+            time += int(line[1:])/1e9
+        elif line[0] == '*':
+            time += period * int(line[1:])
+        else:
+            terminal = line[-1]
+            line     = [x.strip() for x in line[:-1].split(',')]
+            if not pkt_data:
+                SoP_time = time
+            if bus_width is None:
+                bus_width = len(line[0]) * 4
+            pkt_data += reversed( as_bytes( line[0].zfill( bus_width/4 ) ) )
+            tuser.append( int( line[2], 16 ) )
+            if terminal == '.':
+                valid_bytes = int( math.log( int( line[1], 16 ) + 1, 2 ) )
+                if valid_bytes < bus_width/8:
+                    del pkt_data[valid_bytes-bus_width/8:]
+                yield ''.join( [chr(x) for x in pkt_data] ), SoP_time, tuser
+                pkt_data = []
+                tuser    = []
+            time += period
+
+
+def write_synthetic_log( f, num_pkts, bus_width, seed = 0 ):
+    """
+    Writes num_pkts random packets of 64 to 1518 bytes to f
+    """
+    rand = random.Random( seed )
+    word_bytes = bus_width/8
+    strb_mask = (1 << word_bytes) - 1
+    payload = os.urandom( 1518 + word_bytes )
+    f.write( '@ 0\n' )
+    for n in xrange( num_pkts ):
+        length = rand.randint( 64, 1518 )
+        data = payload[n % word_bytes:][:length]
+        lines = []
+        for i in xrange( 0, length, word_bytes ):
+            word = data[i:i+word_bytes]
+            padding = word_bytes - len(word)
+            tuser = length if i == 0 else 0
+            lines.append( '%s, %0*x, %032x%s\n' % (
+                    ('\0' * padding + word[::-1]).encode('hex'),
+                    word_bytes/4, strb_mask >> padding, tuser,
+                    '.' if i + word_bytes >= length else ',' ) )
+        lines.append( '+ 10\n' )
+        f.write( ''.join( lines ) )
+
+
+def bench( name, parse, filename ):
+    size = os.path.getsize( filename )
+    start = time.time()
+    num_pkts = 0
+    with open( filename ) as f:
+        for pkt in parse( f, 1e-9 ):
+            num_pkts += 1
+    elapsed = time.time() - start
+    print '%-8s %8d packets  %7.2f s  %8.1f MB/s  %10.0f pkts/s' % (
+            name, num_pkts, elapsed, size / elapsed / 1e6, num_pkts / elapsed)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pkts', type=int, default=1000000, help="number of synthetic packets to generate")
+    parser.add_argument('--bus_width', type=int, default=256, help="TDATA width in bits")
+    parser.add_argument('--log', type=str, default=None, help="benchmark an existing .axi log instead of a synthetic one")
+    parser.add_argument('--no_legacy', action='store_true', default=False, help="skip the original parser")
+    args = parser.parse_args()
+
+    filename = args.log
+    if filename is None:
+        fd, filename = tempfile.mkstemp( suffix='.axi' )
+        with os.fdopen( fd, 'w' ) as f:
+            write_synthetic_log( f, args.pkts, args.bus_width )
+    try:
+        print '%s: %.1f MB' % (filename, os.path.getsize( filename ) / 1e6)
+        fast = bench( 'iter_axis', axitools.iter_axis, filename )
+        if not args.no_legacy:
+            slow = bench( 'legacy', legacy_iter_axis, filename )
+            print 'speedup: %.1fx' % (slow / fast)
+    finally:
+        if args.log is None:
+            os.remove( filename )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2010, 2011 The Board of Trustees of The Leland Stanford
+#                          Junior University
+# Copyright (C) 2015 David J. Miller
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+################################################################################
+#
+#  File:
+#        axitrace.py
+#
+#  Description:
+#        Compact binary container for AXI Stream packet traces, with
+#        random access through mmap, and converters to and from the AXI
+#        grammar text format handled by axitools.
+#
+#        Layout (all fields little-endian):
+#          header   magic, version, bus width (bits), period (s),
+#                   number of packets, offset of the index
+#          data     raw packet bytes, each followed by the 128-bit TUSER
+#                   words after the first one
+#          index    one entry per packet: data offset, length, number of
+#                   TUSER words, start time (s) and the first TUSER word
+#
+#  Usage:
+#        axitrace.py [--bus_width BITS] [--period SECONDS] input output
+#        Converts a .axi file to a binary trace, or a binary trace back to
+#        a .axi file, depending on the format of input. The bus width of a
+#        .axi file is taken from its TDATA unless --bus_width is given.
+#
+
+import argparse
+import mmap
+import struct
+import sys
+
+import axitools
+
+TRACE_MAGIC   = 'NFAXITRC'
+TRACE_VERSION = 1
+
+# magic, version, bus_width, period, num_pkts, index_offset
+TRACE_HEADER = struct.Struct( '<8sHHdQQ' )
+# offset, length, num_tuser, time, tuser[0] (low and high 64 bits)
+TRACE_INDEX  = struct.Struct( '<QIIdQQ' )
+TUSER_WORD   = struct.Struct( '<QQ' )
+
+MASK64 = (1 << 64) - 1
+
+
+def is_trace( filename ):
+    """
+    Returns True if filename is a binary trace rather than a .axi file
+    """
+    with open( filename, 'rb' ) as f:
+        return f.read( len(TRACE_MAGIC) ) == TRACE_MAGIC
+
+
+class AXISTraceWriter( object ):
+    """
+    Writes packets to a binary trace.  The index is kept in memory (one
+    small entry per packet) and written out by close().
+    """
+    def __init__( self, f, bus_width, period ):
+        self.f         = f
+        self.bus_width = bus_width
+        self.period    = period
+        self.index     = []
+        self.offset    = TRACE_HEADER.size
+        self.f.write( TRACE_HEADER.pack( TRACE_MAGIC, TRACE_VERSION, bus_width, period, 0, 0 ) )
+
+    def write( self, packet ):
+        """
+        Appends an AXISPacket record or a Scapy packet to the trace
+        """
+        if isinstance( packet, axitools.AXISPacket ):
+            data = packet.data
+        else:
+            data = str(packet)
+        tuser = getattr( packet, 'tuser', [0] )
+        if not isinstance( tuser, list ):
+            tuser = [int( tuser, 16 ) if isinstance( tuser, str ) else tuser]
+        # only keep the TUSER words up to the last non-zero one
+        num_tuser = len(tuser)
+        while num_tuser > 1 and tuser[num_tuser-1] == 0:
+            num_tuser -= 1
+        chunk = [data]
+        for t in tuser[1:num_tuser]:
+            chunk.append( TUSER_WORD.pack( t & MASK64, t >> 64 ) )
+        chunk = ''.join( chunk )
+        self.f.write( chunk )
+        self.index.append( TRACE_INDEX.pack( self.offset, len(data), num_tuser, packet.time,
+                                             tuser[0] & MASK64, tuser[0] >> 64 ) )
+        self.offset += len(chunk)
+
+    def close( self ):
+        self.f.write( ''.join( self.index ) )
+        self.f.seek( 0 )
+        self.f.write( TRACE_HEADER.pack( TRACE_MAGIC, TRACE_VERSION, self.bus_width, self.period,
+                                         len(self.index), self.offset ) )
+        self.f.flush()
+
+
+class AXISTrace( object ):
+    """
+    Read-only, mmap backed view of a binary trace.  Packets are decoded
+    into AXISPacket records on access, so t[n] does not scan the file.
+    """
+    def __init__( self, filename ):
+        self.filename = filename
+        self.f  = open( filename, 'rb' )
+        self.mm = mmap.mmap( self.f.fileno(), 0, access=mmap.ACCESS_READ )
+        (magic, version, self.bus_width, self.period,
+         self.num_pkts, self.index_offset) = TRACE_HEADER.unpack_from( self.mm, 0 )
+        if magic != TRACE_MAGIC:
+            raise axitools.BadAXIDataException( filename, 0, 'not a binary AXI trace' )
+        if version != TRACE_VERSION:
+            raise axitools.BadAXIDataException( filename, 0, 'unsupported trace version %d' % version )
+        if self.index_offset + self.num_pkts * TRACE_INDEX.size > len(self.mm):
+            raise axitools.BadAXIDataException( filename, 0, 'truncated trace' )
+
+    def __len__( self ):
+        return self.num_pkts
+
+    def __getitem__( self, n ):
+        if n < 0:
+            n += self.num_pkts
+        if n < 0 or n >= self.num_pkts:
+            raise IndexError( 'packet index out of range' )
+        (offset, length, num_tuser, time,
+         tuser_lo, tuser_hi) = TRACE_INDEX.unpack_from( self.mm, self.index_offset + n * TRACE_INDEX.size )
+        tuser = [tuser_lo | (tuser_hi << 64)]
+        pos = offset + length
+        for i in xrange( num_tuser - 1 ):
+            lo, hi = TUSER_WORD.unpack_from( self.mm, pos )
+            tuser.append( lo | (hi << 64) )
+            pos += TUSER_WORD.size
+        return axitools.AXISPacket( self.mm[offset:offset+length], time, tuser )
+
+    def __iter__( self ):
+        return self.iter_from( 0 )
+
+    def iter_from( self, start ):
+        """
+        Yields the packets from packet number start onwards
+        """
+        for n in xrange( start, self.num_pkts ):
+            yield self[n]
+
+    def close( self ):
+        self.mm.close()
+        self.f.close()
+
+
+def iter_packets( filename, period, start = 0 ):
+    """
+    Yields the AXISPacket records of filename, which may be either a .axi
+    file or a binary trace, from packet number start onwards.
+    """
+    if is_trace( filename ):
+        trace = AXISTrace( filename )
+        try:
+            for pkt in trace.iter_from( start ):
+                yield pkt
+        finally:
+            trace.close()
+    else:
+        with open( filename ) as f:
+            for n, pkt in enumerate( axitools.iter_axis( f, period ) ):
+                if n >= start:
+                    yield pkt
+
+
+def axis_bus_width( f ):
+    """
+    Returns the TDATA width in bits of the first data line of the .axi file
+    f, or None if it has no data lines
+    """
+    for line in f:
+        if '#' in line:
+            line = line[:line.index( '#' )]
+        line = line.strip()
+        if line and line[0] not in '@+*':
+            return len( line.split( ',' )[0].strip() ) * 4
+    return None
+
+
+def exact_ns( packets ):
+    """
+    Yields the packets with their times moved half a nanosecond past the
+    nearest whole nanosecond, so that axis_dump(), which truncates times to
+    whole nanoseconds, writes the delays the packets were read with
+    """
+    for pkt in packets:
+        yield axitools.AXISPacket( pkt.data, (round( pkt.time * 1e9 ) + 0.5) / 1e9, pkt.tuser )
+
+
+def axis_to_trace( axi_filename, trace_filename, bus_width, period ):
+    """
+    Converts a .axi file into a binary trace, returning the number of
+    packets. If bus_width is None it is taken from the .axi file.
+    """
+    if bus_width is None:
+        with open( axi_filename ) as f_in:
+            bus_width = axis_bus_width( f_in )
+        if bus_width is None:
+            raise axitools.BadAXIDataException( axi_filename, 0, 'no data lines to take the bus width from' )
+    with open( axi_filename ) as f_in, open( trace_filename, 'wb' ) as f_out:
+        writer = AXISTraceWriter( f_out, bus_width, period )
+        for pkt in axitools.iter_axis( f_in, period ):
+            writer.write( pkt )
+        writer.close()
+    return len(writer.index)
+
+
+def trace_to_axis( trace_filename, axi_filename ):
+    """
+    Converts a binary trace into a .axi file, returning the number of packets
+    """
+    trace = AXISTrace( trace_filename )
+    try:
+        with open( axi_filename, 'w' ) as f_out:
+            axitools.axis_dump( exact_ns( trace ), f_out, trace.bus_width, trace.period )
+        return len(trace)
+    finally:
+        trace.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between .axi files and binary AXI traces")
+    parser.add_argument('input', type=str, help="the .axi file or binary trace to convert")
+    parser.add_argument('output', type=str, help="the converted file")
+    parser.add_argument('--bus_width', type=int, default=None, help="TDATA width in bits (for .axi input, defaults to the width of its TDATA)")
+    parser.add_argument('--period', type=float, default=1e-9, help="clock period in seconds (for .axi input)")
+    args = parser.parse_args()
+
+    try:
+        if is_trace( args.input ):
+            num_pkts = trace_to_axis( args.input, args.output )
+        else:
+            num_pkts = axis_to_trace( args.input, args.output, args.bus_width, args.period )
+    except (IOError, axitools.BadAXIDataException) as e:
+        print >> sys.stderr, 'ERROR: %s' % e
+        sys.exit(1)
+    print '%s: %d packets' % (args.output, num_pkts)
+
+if __name__ == "__main__":
+    main()
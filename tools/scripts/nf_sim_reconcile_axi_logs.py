@@ -36,47 +36,149 @@
 #        nf10_sim_reconcile_axi_logs.py
 #
 #  Description:
-#         Reconciles *_log.axi with *_expected.axi.
+#         Reconciles *_log.axi with *_expected.axi, for all ports in
+#         parallel, optionally writing a JSON report.
 #
 
 from __future__ import with_statement
 
-import axitools
+import axitrace
+import pktmask
+import argparse
 import glob
+import json
+import multiprocessing
 import os
 import sys
+from itertools import izip_longest
 
 EXPECTED_AXI = '_expected.axi'
 LOG_AXI      = '_log.axi'
 
-def reconcile_axi( log_pkts, exp_pkts ):
+def find_axi_pairs( directory ):
     """
-    Reconcile list of logged AXI packets with list of expected packets.
+    Returns a sorted list of (name, log_axi, expected_axi) for every
+    *_expected.axi in directory with a matching *_log.axi.
     """
-    if log_pkts == exp_pkts:
-        print '\tPASS (%d packets expected, %d packets received)' % (len(exp_pkts), len(log_pkts))
+    pairs = []
+    for expected_axi in sorted( glob.glob( os.path.join( directory, '*%s' % EXPECTED_AXI ) ) ):
+        prefix = expected_axi[:-len(EXPECTED_AXI)]
+        log_axi = '%s%s' % (prefix, LOG_AXI)
+        if os.path.isfile( log_axi ):
+            pairs.append( (os.path.basename( prefix ), log_axi, expected_axi) )
+    return pairs
+
+def compare_axi( log_pkts, exp_pkts, mask = None ):
+    """
+    Compares logged AXI packets with expected packets.  Both are iterables
+    of axitools.AXISPacket records, compared one pair at a time, ignoring
+    the bits set in the optional mask string.  Returns
+    (num_exp_pkts, num_log_pkts, first_divergence) where first_divergence is
+    None or a dict with the number and hex data of the first packet that
+    differs.
+    """
+    pkt_mask = pktmask.get_mask( mask )
+    num_log_pkts = 0
+    num_exp_pkts = 0
+    first_divergence = None
+    for log_pkt, exp_pkt in izip_longest( log_pkts, exp_pkts ):
+        if log_pkt is not None:
+            num_log_pkts += 1
+        if exp_pkt is not None:
+            num_exp_pkts += 1
+        if first_divergence is not None:
+            continue
+        if log_pkt is None or exp_pkt is None:
+            differ = True
+        elif pkt_mask is None:
+            differ = log_pkt.data != exp_pkt.data
+        else:
+            differ = pkt_mask.apply( log_pkt.data ) != pkt_mask.apply( exp_pkt.data )
+        if differ:
+            first_divergence = {'packet'   : max( num_log_pkts, num_exp_pkts ) - 1,
+                                'expected' : exp_pkt.data.encode('hex') if exp_pkt is not None else None,
+                                'logged'   : log_pkt.data.encode('hex') if log_pkt is not None else None}
+    return num_exp_pkts, num_log_pkts, first_divergence
+
+def reconcile_axi( log_pkts, exp_pkts, mask = None ):
+    """
+    Reconcile logged AXI packets with expected packets.  Both are iterables
+    of axitools.AXISPacket records, compared one pair at a time.
+    """
+    num_exp_pkts, num_log_pkts, first_divergence = compare_axi( log_pkts, exp_pkts, mask )
+    if first_divergence is None:
+        print '\tPASS (%d packets expected, %d packets received)' % (num_exp_pkts, num_log_pkts)
         return False
     else:
-        print '\tFAIL (%d packets expected, %d packets received)' % (len(exp_pkts), len(log_pkts))
+        print '\tFAIL (%d packets expected, %d packets received)' % (num_exp_pkts, num_log_pkts)
         return True
 
+def reconcile_pair( pair ):
+    """
+    Pool worker: reconciles one (name, log_axi, expected_axi, mask) pair
+    and returns its entry of the report
+    """
+    name, log_axi, expected_axi, mask = pair
+    # time is ignored, so period=1e-9 is hard-coded
+    num_exp_pkts, num_log_pkts, first_divergence = compare_axi( axitrace.iter_packets( log_axi, 1e-9 ),
+                                                                axitrace.iter_packets( expected_axi, 1e-9 ),
+                                                                mask )
+    return {'name'             : name,
+            'log'              : log_axi,
+            'expected'         : expected_axi,
+            'expected_pkts'    : num_exp_pkts,
+            'logged_pkts'      : num_log_pkts,
+            'pass'             : first_divergence is None,
+            'first_divergence' : first_divergence}
+
+def map_pairs( worker, pairs, jobs ):
+    """
+    Runs worker on every pair, in a pool of jobs processes if jobs > 1,
+    and returns the results in the order of pairs
+    """
+    if jobs > 1 and len(pairs) > 1:
+        pool = multiprocessing.Pool( min( jobs, len(pairs) ) )
+        try:
+            return pool.map( worker, pairs, 1 )
+        finally:
+            pool.close()
+            pool.join()
+    return [worker( pair ) for pair in pairs]
+
+def write_report( filename, results ):
+    """
+    Writes the per-port results as a JSON report
+    """
+    report = {'pass'  : all( r['pass'] for r in results ),
+              'ports' : results}
+    with open( filename, 'w' ) as f:
+        json.dump( report, f, indent=2, sort_keys=True )
+        f.write( '\n' )
+
 
 def main():
-    fail = False
-    for expected_axi in glob.glob( '*%s' % EXPECTED_AXI ):
-        # Find log/expected pairs
-        log_axi = '%s%s' % (expected_axi[:-len(EXPECTED_AXI)], LOG_AXI)
-        if not os.path.isfile( log_axi ):
-            continue
-        print 'Reconciliation of %s with %s' % (log_axi, expected_axi)
-        # Load packets (time is ignored, so period=1e-9 is hard-coded)
-        with open( log_axi ) as f:
-            log_pkts = axitools.axis_load( f, 1e-9 )
-        with open( expected_axi ) as f:
-            exp_pkts = axitools.axis_load( f, 1e-9 )
-        fail |= reconcile_axi( log_pkts, exp_pkts )
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dir', type=str, default='.', help="directory holding the *_log.axi/*_expected.axi pairs")
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(), help="number of pairs to reconcile in parallel")
+    parser.add_argument('--json', type=str, default=None, help="write a JSON report to this file")
+    parser.add_argument('--mask', type=str, default=None, help="hex mask of the packet bits to ignore, e.g. TTL, checksum or timestamp fields")
+    args = parser.parse_args()
+
+    mask = None
+    if args.mask is not None:
+        try:
+            mask = pktmask.parse_mask( args.mask )
+        except ValueError as e:
+            parser.error( str(e) )
+    pairs = [pair + (mask,) for pair in find_axi_pairs( args.dir )]
+    results = map_pairs( reconcile_pair, pairs, args.jobs )
+    for r in results:
+        print 'Reconciliation of %s with %s' % (os.path.basename( r['log'] ), os.path.basename( r['expected'] ))
+        print '\t%s (%d packets expected, %d packets received)' % ('PASS' if r['pass'] else 'FAIL', r['expected_pkts'], r['logged_pkts'])
         print
-    sys.exit( fail )
+    if args.json is not None:
+        write_report( args.json, results )
+    sys.exit( not all( r['pass'] for r in results ) )
 
 if __name__ == '__main__':
     main()
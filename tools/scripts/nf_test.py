@@ -37,6 +37,8 @@ import sys
 import argparse
 import glob
 import subprocess
+import pipes
+import shlex
 
 script_dir = os.path.dirname( sys.argv[0] )
 # Add path *relative to this script's location* of testcheck module
@@ -329,6 +331,8 @@ def handleArgs():
     parser.add_argument('--packet_length', help='Specify the lenght of the packet.', type=int)
     parser.add_argument('--packet_no', help='Specify the number of the packet.', type=int)
     parser.add_argument('--conn', help='Specify the conn file specifying the physical connections of the nfX ports.  Formatting is one connection per line, nfX:ethY.', metavar='<connections file>')
+    parser.add_argument('--tpacket', action='store_true', help='Hardware only. Capture packets from a TPACKET_V3 mmap\'d ring instead of with scapy sniff.')
+    parser.add_argument('--filter', help='Hardware only. Only capture packets matching this tcpdump filter expression.', metavar='<filter>')
     parser.add_argument('--map', help='Remap interfaces per mapfile, which is a list of two interfaces per line.', metavar='<map_file>')
     parser.add_argument('--ci', choices=['testcheck'], help='For use when using a continuout integration tool.  Instructs the system to print out extra debugging information used by the CI tool.', metavar='<test_tool>')
     parser.add_argument('--citest', help='The name of the top-level test to print error messages in when using the \'ci\' option.', metavar='<test_name>', default='')
@@ -531,6 +535,10 @@ def runTest(project, test):
             script += ' --seed ' + str(args.seed[0])
         if args.conn:
             script += ' --conn ' + str(args.conn)
+        if args.tpacket:
+            script += ' --tpacket'
+        if args.filter:
+            script += ' --filter ' + pipes.quote(args.filter)
         return runScript(project, test, script, REQUIRED)
     else:
         match = re.search(r'/(.*)\/([^\/]*)/', test)
@@ -540,6 +548,10 @@ def runTest(project, test):
                 script += ' --seed ' + str(args.seed[0])
             if args.conn:
                 script += ' --conn ' + str(args.conn)
+            if args.tpacket:
+                script += ' --tpacket'
+            if args.filter:
+                script += ' --filter ' + pipes.quote(args.filter)
             return runScript(project, match.group(1), script, REQUIRED)
         else:
             print 'Error finding test file: ' + test
@@ -589,7 +601,8 @@ def runScript(project, subdir, script, required):
 
     try:
         os.chdir(proj_test_dir + '/' + subdir)
-        process = subprocess.Popen(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        # shlex keeps a quoted --filter expression in one argument
+        process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         output = process.communicate()[0]
         status = process.returncode
     except OSError, exc:
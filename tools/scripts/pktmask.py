@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2010, 2011 The Board of Trustees of The Leland Stanford
+#                          Junior University
+# Copyright (C) 2015 David J. Miller
+# All rights reserved.
+#
+# This software was developed by Stanford University and the University of Cambridge Computer Laboratory
+# under National Science Foundation under Grant No. CNS-0855268,
+# the University of Cambridge Computer Laboratory under EPSRC INTERNET Project EP/H040536/1 and
+# by the University of Cambridge Computer Laboratory under DARPA/AFRL contract FA8750-11-C-0249 ("MRC2"),
+# as part of the DARPA MRC research programme.
+#
+# @NETFPGA_LICENSE_HEADER_START@
+#
+# Licensed to NetFPGA C.I.C. (NetFPGA) under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  NetFPGA licenses this
+# file to you under the NetFPGA Hardware-Software License, Version 1.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at:
+#
+#   http://www.netfpga-cic.org
+#
+# Unless required by applicable law or agreed to in writing, Work distributed
+# under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+# CONDITIONS OF ANY KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# @NETFPGA_LICENSE_HEADER_END@
+#
+################################################################################
+#
+#  File:
+#        pktmask.py
+#
+#  Description:
+#        Masked packet comparison for the hardware (NFTest) and simulation
+#        log comparators.  A mask is a packet-sized string whose set bits
+#        are ignored when comparing; bytes past the end of the mask are
+#        compared exactly.  Each distinct mask is converted once, into a
+#        NumPy uint8 array when NumPy is available and into an integer
+#        otherwise, and is trimmed after its last non-zero byte, so that
+#        masking a packet is a single AND over the masked prefix.
+#
+
+from binascii import hexlify, unhexlify
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class PacketMask( object ):
+    """
+    A mask converted for whole-buffer ANDs.  apply() returns a packet
+    string with the masked bits cleared.
+    """
+    def __init__( self, mask ):
+        mask = str(mask).rstrip( '\0' )
+        self.length = len(mask)
+        if np is not None:
+            self.keep = np.frombuffer( mask, dtype=np.uint8 ) ^ np.uint8( 0xff )
+        else:
+            self.keep = int( hexlify( mask ), 16 ) ^ ((1 << (8*self.length)) - 1) if mask else 0
+
+    def apply( self, pkt ):
+        n = min( len(pkt), self.length )
+        if n == 0:
+            return pkt
+        if np is not None:
+            masked = (np.frombuffer( pkt, dtype=np.uint8, count=n ) & self.keep[:n]).tobytes()
+        else:
+            # the integer is shortened by dropping its low (last) bytes
+            keep = self.keep >> (8 * (self.length - n))
+            masked = unhexlify( '%0*x' % (2*n, int( hexlify( pkt[:n] ), 16 ) & keep) )
+        return masked + pkt[n:]
+
+
+# mask string -> PacketMask, so that a mask shared by many expectations is
+# only converted once
+_masks = {}
+
+def get_mask( mask ):
+    """
+    Returns the PacketMask of a mask string or scapy packet, or None if
+    mask is empty
+    """
+    if not mask:
+        return None
+    mask = str(mask)
+    pkt_mask = _masks.get( mask )
+    if pkt_mask is None:
+        pkt_mask = _masks[mask] = PacketMask( mask )
+    return pkt_mask
+
+def apply_mask( pkt, mask ):
+    """
+    Returns the packet string pkt with the bits set in mask cleared
+    """
+    pkt_mask = get_mask( mask )
+    if pkt_mask is None:
+        return pkt
+    return pkt_mask.apply( pkt )
+
+def compare( pkta, pktb, mask = None ):
+    """
+    Compares two packet strings, ignoring the bits set in mask
+    """
+    pkt_mask = get_mask( mask )
+    if pkt_mask is None:
+        return pkta == pktb
+    return pkt_mask.apply( pkta ) == pkt_mask.apply( pktb )
+
+def parse_mask( hex_mask ):
+    """
+    Returns the mask string of a hex string such as 'ffff0000', as given on
+    a command line
+    """
+    try:
+        return unhexlify( hex_mask.replace( ':', '' ) )
+    except TypeError:
+        raise ValueError( 'invalid hex mask %r' % hex_mask )